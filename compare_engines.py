@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Compare the nodes extracted by the fast engine with the ones from the fparser engine
+on a corpus of source code folders
+"""
+
+import os, sys, time
+import argparse
+
+import runparse
+
+tnow = time.perf_counter
+
+compared_attrname_list = ['type','filename','nfirst_line','nlast_line','nlines','ncode_lines','ncomment_lines','uses','calls','arrays_or_funcs',
+                          'subroutines','functions','procedures',
+                          'var_dict','alloc','dealloc','alloc_wo_dealloc','dealloc_wo_alloc']
+
+def get_node_facts(node_obj):
+   """
+   Dictionary of the comparable attributes of a node (the arrays and variables are compared by their repr)
+   """
+   fact_dict = {}
+   for attrname in compared_attrname_list:
+      if not hasattr(node_obj,attrname):
+         continue
+
+      value = getattr(node_obj,attrname)
+
+      # Not computed at this analysis level
+      if value is None:
+         pass
+      elif attrname == 'var_dict':
+         value = {name: repr(var) for name,var in value.items()}
+      elif attrname in ['alloc','dealloc','alloc_wo_dealloc','dealloc_wo_alloc']:
+         value = [repr(x) for x in value]
+
+      fact_dict[attrname] = value
+
+   return fact_dict
+
+def compare_node_dicts(ref_dict,new_dict,dict_name,verbose=True):
+   """
+   Print the differences between two node dicts, return the number of differences
+   """
+   ndiff = 0
+
+   for name in sorted(ref_dict.keys() - new_dict.keys()):
+      print(f'  [{dict_name}] {name}: only in the fparser engine')
+      ndiff += 1
+
+   for name in sorted(new_dict.keys() - ref_dict.keys()):
+      print(f'  [{dict_name}] {name}: only in the fast engine')
+      ndiff += 1
+
+   for name in sorted(ref_dict.keys() & new_dict.keys()):
+      ref_facts = get_node_facts(ref_dict[name])
+      new_facts = get_node_facts(new_dict[name])
+
+      for attrname in compared_attrname_list:
+         ref_value = ref_facts.get(attrname)
+         new_value = new_facts.get(attrname)
+
+         if ref_value != new_value:
+            ndiff += 1
+            if verbose:
+               print(f'  [{dict_name}] {name}.{attrname}:')
+               print(f'     fparser: {ref_value}')
+               print(f'     fast   : {new_value}')
+
+   return ndiff
+
+def compare_engines(path,exclude_files=None,jobs=1,verbose=True,analysis='full'):
+   """
+   Run both engines on a source folder and print the differences
+   """
+   source_file_list = runparse.get_source_file_list(path,exclude_files=exclude_files)
+
+   t1 = tnow()
+   ref_callable_dict, ref_module_dict = runparse.create_node_dicts(path,source_file_list,with_modules=True,jobs=jobs,engine='fparser',analysis=analysis)
+   time_fparser = tnow() - t1
+
+   t1 = tnow()
+   new_callable_dict, new_module_dict = runparse.create_node_dicts(path,source_file_list,with_modules=True,jobs=jobs,engine='fast',analysis=analysis)
+   time_fast = tnow() - t1
+
+   print(f'\n=== {path} ===\n')
+
+   ndiff  = compare_node_dicts(ref_callable_dict,new_callable_dict,'callables',verbose=verbose)
+   ndiff += compare_node_dicts(ref_module_dict,new_module_dict,'modules',verbose=verbose)
+
+   nnodes = len(ref_callable_dict) + len(ref_module_dict)
+
+   print(f'\nFiles: {len(source_file_list)}, nodes: {nnodes}, differences: {ndiff}')
+   print(f'Time: fparser {time_fparser:.2f} s, fast {time_fast:.2f} s')
+
+   return ndiff
+
+def main():
+
+   help_description = 'Compare the fast engine with the fparser engine on a corpus of FORTRAN source folders.'
+
+   cmd_parser = argparse.ArgumentParser(description=help_description)
+
+   cmd_parser.add_argument('-p','--path-list',help='List of paths to the source code folders',nargs='+',required=True)
+   cmd_parser.add_argument('--exclude-files',help='List of file to exclude from parsing',nargs='*',required = False,default=[])
+   cmd_parser.add_argument('-j','--jobs',help='Number of processes used to parse the source files.',type=int,required = False,default=1)
+   cmd_parser.add_argument('--analysis',help='Analysis level of both engines.',choices=runparse.ANALYSIS_LEVELS,required = False,default='full')
+   cmd_parser.add_argument('-q','--quiet',action='store_true',help='Print only the nodes that differ and the summary.',default=False)
+
+   args = cmd_parser.parse_args()
+
+   ndiff = 0
+   for path in args.path_list:
+      ndiff += compare_engines(path,exclude_files=args.exclude_files,jobs=args.jobs,verbose=not args.quiet,analysis=args.analysis)
+
+   sys.exit(1 if ndiff > 0 else 0)
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+
+"""
+C preprocessor stage in front of the parsing engines (#ifdef, #include, #define in .F90 files).
+The preprocessing uses the local cpp executable (traditional mode, as the FORTRAN compilers do)
+or a pure-Python fallback that handles the conditionals, the includes and the object-like macros.
+The output comes with a line map, so that the line numbers refer to the original file,
+and is cached on disk, keyed by the file and the macro set (and checked against the content
+of the file and of the included files).
+"""
+
+import os, sys, re, shutil, pickle, hashlib, subprocess, warnings
+
+CPP_CACHE_VERSION = 1
+
+class PreprocessorError(Exception):
+   pass
+
+def get_file_hash(filepath):
+   sha = hashlib.sha256()
+   with open(filepath,'rb') as f:
+      sha.update(f.read())
+
+   return sha.hexdigest()
+
+def parse_define(define):
+   """
+   -D argument: NAME or NAME=VALUE (the value of NAME is 1)
+   """
+   if '=' in define:
+      name, value = define.split('=',1)
+   else:
+      name, value = define, '1'
+
+   return name.strip(), value
+
+#
+# cpp executable
+#
+linemarker_regex = re.compile(r'#\s*(\d+)\s+"((?:[^"\\]|\\.)*)"((?:\s+\d+)*)\s*$')
+
+def run_cpp(cpp_path,filepath,define_dict,include_dirs):
+   """
+   Run cpp on a file, return the text without the line markers, the line map (line of the original file
+   for each line of the text; the lines of an included file map to the #include line) and the included files
+   """
+   command = [cpp_path,'-traditional-cpp','-w']
+   command += [ '-D{:}={:}'.format(name,value) for name,value in define_dict.items() ]
+   command += [ '-I'+x for x in include_dirs ]
+   command.append(filepath)
+
+   result = subprocess.run(command,stdout=subprocess.PIPE,stderr=subprocess.PIPE,errors='replace')
+   if result.returncode != 0:
+      raise PreprocessorError('{:} failed on {:}:\n{:}'.format(cpp_path,filepath,result.stderr))
+
+   line_list = []
+   line_map = []
+   dependency_set = set()
+
+   # Stack of the open files, the original file is at the bottom
+   file_stack = []
+   nline = 0
+
+   # First line of text of the file included by the original file
+   include_start = None
+
+   for line in result.stdout.split('\n'):
+      match = linemarker_regex.match(line)
+      if match is not None:
+         marker_file = match.group(2)
+         flags = match.group(3).split()
+
+         if '1' in flags:
+            if len(file_stack) == 1:
+               include_start = len(line_list)
+            file_stack.append(marker_file)
+            if file_stack[0] == filepath and not marker_file.startswith('<'):
+               dependency_set.add(marker_file)
+
+         elif '2' in flags and len(file_stack) > 1:
+            file_stack.pop()
+            file_stack[-1] = marker_file
+
+            # Back in the original file: the lines of the included file map to the #include line,
+            # i.e. the line before the line of the return marker
+            if len(file_stack) == 1 and include_start is not None:
+               nline_include = int(match.group(1)) - 1
+               for i in range(include_start,len(line_list)):
+                  line_map[i] = nline_include
+               include_start = None
+
+         elif len(file_stack) > 0:
+            file_stack[-1] = marker_file
+         else:
+            file_stack.append(marker_file)
+
+         nline = int(match.group(1))
+         continue
+
+      if len(file_stack) > 0 and file_stack[0] == filepath:
+         line_list.append(line)
+         line_map.append(nline)
+
+      nline += 1
+
+   # The output ends with a new line
+   if len(line_list) > 0 and line_list[-1] == '':
+      line_list.pop()
+      line_map.pop()
+
+   return '\n'.join(line_list)+'\n', line_map, sorted(dependency_set)
+
+#
+# Pure-Python fallback
+#
+expr_token_regex = re.compile(r'\s*(?:(\d+)[uUlL]*|([A-Za-z_]\w*)|(&&|\|\||==|!=|<=|>=|<<|>>|[-+*/%<>!()~&|^?:]))')
+identifier_regex = re.compile(r'[A-Za-z_]\w*')
+include_regex = re.compile(r'#\s*include\s*["<]([^">]+)[">]')
+
+class PythonPreprocessor:
+   """
+   Minimal C preprocessor: #if/#ifdef/#ifndef/#elif/#else/#endif, #define/#undef
+   (the object-like macros are expanded in the code, not in the strings and comments)
+   and #include. The other directives are dropped.
+   """
+   def __init__(self,define_dict,include_dirs):
+      self.define_dict = dict(define_dict)
+      self.include_dirs = include_dirs
+      self.dependency_set = set()
+
+   def evaluate(self,expression,filepath):
+      """
+      Value of the expression of an #if or #elif directive
+      """
+      expression = re.sub(r'\bdefined\s*\(\s*(\w+)\s*\)|\bdefined\s+(\w+)',
+                          lambda m: '1' if (m.group(1) or m.group(2)) in self.define_dict else '0', expression)
+
+      python_token_list = []
+      pos = 0
+      expression = expression.strip()
+      while pos < len(expression):
+         match = expr_token_regex.match(expression,pos)
+         if match is None:
+            raise PreprocessorError('Cannot evaluate #if {:} in {:}'.format(expression,filepath))
+         pos = match.end()
+
+         number, name, operator = match.groups()
+         if number is not None:
+            python_token_list.append(number)
+         elif name is not None:
+            value = self.expand(name,set())
+            python_token_list.append('({:})'.format(self.evaluate(value,filepath)) if value != name else '0')
+         else:
+            python_token_list.append({'&&': ' and ', '||': ' or ', '!': ' not ', '/': '//'}.get(operator,operator))
+
+      if len(python_token_list) == 0:
+         raise PreprocessorError('Empty #if in {:}'.format(filepath))
+
+      try:
+         return int(eval(''.join(python_token_list),{'__builtins__': {}}))
+      except Exception:
+         raise PreprocessorError('Cannot evaluate #if {:} in {:}'.format(expression,filepath))
+
+   def expand(self,text,expanding):
+      """
+      Expand the object-like macros of a text
+      """
+      def replace(match):
+         name = match.group(0)
+         if name in self.define_dict and name not in expanding:
+            return self.expand(self.define_dict[name],expanding | {name})
+         return name
+
+      return identifier_regex.sub(replace,text)
+
+   def expand_code(self,line):
+      """
+      Expand the macros of a FORTRAN line, outside of the strings and the comment
+      """
+      if len(self.define_dict) == 0:
+         return line
+
+      part_list = []
+      start = 0
+      quote = None
+      i = 0
+      while i < len(line):
+         c = line[i]
+         if quote is not None:
+            if c == quote:
+               part_list.append(line[start:i+1])
+               start = i+1
+               quote = None
+         elif c in '\'"':
+            part_list.append(self.expand(line[start:i],set()))
+            start = i
+            quote = c
+         elif c == '!':
+            break
+         i += 1
+
+      if quote is None:
+         part_list.append(self.expand(line[start:i],set()))
+         part_list.append(line[i:])
+      else:
+         # String continued on the next line
+         part_list.append(line[start:])
+
+      return ''.join(part_list)
+
+   def find_include(self,name,current_dir):
+      for include_dir in [current_dir] + list(self.include_dirs):
+         include_path = os.path.join(include_dir,name)
+         if os.path.isfile(include_path):
+            return include_path
+
+      return None
+
+   def read_lines(self,filepath):
+      """
+      Lines of a file, with the directives continued with a backslash joined
+      (the continuation lines are kept empty, so that the line numbers do not change)
+      """
+      with open(filepath,'r',errors='replace') as f:
+         line_list = f.read().split('\n')
+
+      if len(line_list) > 0 and line_list[-1] == '':
+         line_list.pop()
+
+      i = 0
+      while i < len(line_list):
+         if line_list[i].lstrip().startswith('#'):
+            j = i
+            while line_list[i].endswith('\\') and j+1 < len(line_list):
+               j += 1
+               line_list[i] = line_list[i][:-1] + line_list[j]
+               line_list[j] = ''
+            i = j+1
+         else:
+            i += 1
+
+      return line_list
+
+   def process(self,filepath,nline_include=None,depth=0):
+      """
+      Preprocess a file, return the list of (line, line of the original file)
+      """
+      if depth > 50:
+         raise PreprocessorError('#include nested too deeply in {:}'.format(filepath))
+
+      output_list = []
+
+      # Stack of the conditionals: (parent active, a branch was taken, active)
+      cond_stack = []
+      active = True
+
+      for iline, line in enumerate(self.read_lines(filepath)):
+         nline = iline+1 if nline_include is None else nline_include
+
+         stripped = line.lstrip()
+         if not stripped.startswith('#'):
+            output_list.append((self.expand_code(line) if active else '', nline))
+            continue
+
+         directive_match = re.match(r'#\s*(\w*)\s*(.*)',stripped)
+         directive, argument = directive_match.group(1), directive_match.group(2).strip()
+
+         if directive in ['ifdef','ifndef','if']:
+            if directive == 'ifdef':
+               value = argument.split()[0] in self.define_dict if argument else False
+            elif directive == 'ifndef':
+               value = argument.split()[0] not in self.define_dict if argument else False
+            else:
+               value = active and self.evaluate(argument,filepath) != 0
+
+            cond_stack.append((active,value,active and value))
+            active = active and value
+
+         elif directive == 'elif':
+            if len(cond_stack) == 0:
+               raise PreprocessorError('#elif without #if in {:}:{:}'.format(filepath,iline+1))
+
+            parent_active, taken, _ = cond_stack.pop()
+            value = parent_active and not taken and self.evaluate(argument,filepath) != 0
+            cond_stack.append((parent_active,taken or value,value))
+            active = value
+
+         elif directive == 'else':
+            if len(cond_stack) == 0:
+               raise PreprocessorError('#else without #if in {:}:{:}'.format(filepath,iline+1))
+
+            parent_active, taken, _ = cond_stack.pop()
+            cond_stack.append((parent_active,True,parent_active and not taken))
+            active = parent_active and not taken
+
+         elif directive == 'endif':
+            if len(cond_stack) == 0:
+               raise PreprocessorError('#endif without #if in {:}:{:}'.format(filepath,iline+1))
+
+            active = cond_stack.pop()[0]
+
+         elif not active:
+            pass
+
+         elif directive == 'define':
+            match = re.match(r'(\w+)(\([^)]*\))?\s*(.*)',argument)
+            if match is not None:
+               # The function-like macros are defined (for #ifdef) but not expanded
+               self.define_dict[match.group(1)] = match.group(3) if match.group(2) is None else match.group(1)
+
+         elif directive == 'undef':
+            self.define_dict.pop(argument.split()[0] if argument else '',None)
+
+         elif directive == 'include':
+            match = include_regex.match(stripped)
+            include_path = None if match is None else self.find_include(match.group(1),os.path.dirname(filepath))
+
+            if include_path is None:
+               warnings.warn('Include file not found: {:} ({:}:{:})'.format(argument,filepath,iline+1))
+            else:
+               self.dependency_set.add(include_path)
+               output_list.extend(self.process(include_path,nline_include=nline,depth=depth+1))
+               continue
+
+         # Directives are replaced by empty lines
+         output_list.append(('',nline))
+
+      if len(cond_stack) > 0:
+         raise PreprocessorError('Unterminated #if in {:}'.format(filepath))
+
+      return output_list
+
+def run_python_preprocessor(filepath,define_dict,include_dirs):
+   """
+   Same as run_cpp, with the pure-Python preprocessor
+   """
+   preprocessor = PythonPreprocessor(define_dict,include_dirs)
+   output_list = preprocessor.process(filepath)
+
+   text = ''.join( line+'\n' for line,nline in output_list )
+   line_map = [ nline for line,nline in output_list ]
+
+   return text, line_map, sorted(preprocessor.dependency_set)
+
+def map_line(line_map,nline):
+   """
+   Line of the original file for a line of the preprocessed text (unchanged if line_map is None)
+   """
+   if line_map is None or len(line_map) == 0:
+      return nline
+
+   return line_map[min(max(nline,1),len(line_map))-1]
+
+class Preprocessor:
+   """
+   Preprocessing of the source files with a set of macros (-D) and include folders (-I).
+   cpp_command is the cpp executable, 'auto' (cpp if it is found, the Python fallback otherwise)
+   or 'python' (Python fallback).
+   If cache_dir is specified, the output is cached: an entry is reused if the file,
+   the macro set and the included files did not change.
+   """
+   def __init__(self,defines=None,include_dirs=None,cpp_command='auto',cache_dir=None):
+      self.define_dict = dict( parse_define(x) for x in (defines or []) )
+      self.include_dirs = [ os.path.abspath(x) for x in (include_dirs or []) ]
+      self.cache_dir = cache_dir
+
+      if cpp_command == 'auto':
+         self.cpp_path = shutil.which('cpp')
+      elif cpp_command == 'python':
+         self.cpp_path = None
+      else:
+         self.cpp_path = shutil.which(cpp_command)
+         if self.cpp_path is None:
+            raise PreprocessorError('cpp executable not found: {:}'.format(cpp_command))
+
+      if self.cache_dir is not None:
+         os.makedirs(self.cache_dir, exist_ok=True)
+
+   def get_signature(self):
+      """
+      String representation of the macro set, the include folders and the preprocessor
+      """
+      return '{:}|{:}|{:}'.format(self.cpp_path or 'python',
+         ';'.join( '{:}={:}'.format(name,value) for name,value in sorted(self.define_dict.items()) ),
+         ';'.join(self.include_dirs))
+
+   def get_cache_path(self,filepath):
+      """
+      One cache entry per file and macro set: the entry of a file is replaced when the file changes
+      """
+      sha = hashlib.sha256()
+      sha.update('{:}|{:}|{:}'.format(CPP_CACHE_VERSION,self.get_signature(),os.path.abspath(filepath)).encode())
+
+      return os.path.join(self.cache_dir,sha.hexdigest()+'.pkl')
+
+   def load(self,cache_path,file_hash):
+      """
+      Return the cached (text, line_map), None if there is no entry or if the file or an included file changed
+      """
+      if not os.path.isfile(cache_path):
+         return None
+
+      try:
+         with open(cache_path,'rb') as f:
+            entry_file_hash, text, line_map, dependency_hash_list = pickle.load(f)
+      except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+         return None
+
+      if entry_file_hash != file_hash:
+         return None
+
+      for dependency, dependency_hash in dependency_hash_list:
+         if not os.path.isfile(dependency) or get_file_hash(dependency) != dependency_hash:
+            return None
+
+      return text, line_map
+
+   def store(self,cache_path,file_hash,text,line_map,dependency_list):
+      dependency_hash_list = [ (x,get_file_hash(x)) for x in dependency_list if os.path.isfile(x) ]
+
+      tmp_path = cache_path+'.tmp'
+      with open(tmp_path,'wb') as f:
+         pickle.dump((file_hash,text,line_map,dependency_hash_list),f,protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_path,cache_path)
+
+   def preprocess(self,filepath):
+      """
+      Return the preprocessed text of a file and its line map
+      (line_map[i] is the line of the original file for the line i+1 of the text)
+      """
+      if self.cache_dir is not None:
+         cache_path = self.get_cache_path(filepath)
+         file_hash = get_file_hash(filepath)
+
+         cached = self.load(cache_path,file_hash)
+         if cached is not None:
+            return cached
+
+      if self.cpp_path is not None:
+         text, line_map, dependency_list = run_cpp(self.cpp_path,filepath,self.define_dict,self.include_dirs)
+      else:
+         text, line_map, dependency_list = run_python_preprocessor(filepath,self.define_dict,self.include_dirs)
+
+      if self.cache_dir is not None:
+         self.store(cache_path,file_hash,text,line_map,dependency_list)
+
+      return text, line_map
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
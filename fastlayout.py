@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+
+"""
+Layered (Sugiyama) layout of the call graphs, for the graphs that are too large for graphviz dot.
+It is selected with the graph parameter ('graph','layout'): 'fast' (see graphtools.print_default_graph_param).
+
+The steps are the ones of dot, with simpler heuristics:
+   cycle breaking:    the back edges of a depth-first search are reversed
+   layering:          longest path from the nodes without predecessors
+   long edges:        a dummy node is inserted in each layer crossed by an edge, up to MAX_DUMMY_SPAN layers
+                      (the longer edges are drawn straight, they would multiply the number of nodes)
+   crossing reduction: barycenter sweeps, each layer is sorted at once with NumPy
+   coordinates:       the nodes are pulled towards the mean position of their neighbours,
+                      the separation constraints are restored with cumulative maxima (NumPy)
+
+The SVG file is written directly, with the structure of the graphviz SVG files read by htmltools.get_node_coord
+(node comment, title and polygon, viewBox and translate of the graph). The nodes are drawn as boxes
+and the edges as polylines. The other formats are rendered by graphviz from the computed positions.
+"""
+
+import os, sys, time
+from html import escape
+
+import numpy as np
+
+tnow = time.perf_counter
+
+FAST_LAYOUT = 'fast'
+
+# Points per inch (graphviz units)
+POINTS = 72.
+
+# Estimated size of the labels: width of a character and height of a line (fraction of the font size)
+CHAR_WIDTH  = 0.6
+LINE_HEIGHT = 1.2
+
+# Margins of the labels (graphviz defaults: 0.11 and 0.055 inches)
+MARGIN_X = 0.11*POINTS
+MARGIN_Y = 0.055*POINTS
+
+# Size of the arrow heads (points)
+ARROW_LENGTH = 10.
+ARROW_WIDTH  = 3.5
+
+# Longest edges (number of layers) split with dummy nodes
+MAX_DUMMY_SPAN = 8
+
+# Number of barycenter sweeps (down and up) of the crossing reduction and of the coordinate assignment
+ORDER_SWEEPS = 8
+COORD_SWEEPS = 8
+
+def get_attr(attr,key,default):
+   """
+   Attribute of a pygraphviz item, default if it is not set
+   """
+   try:
+      value = attr[key]
+   except KeyError:
+      return default
+
+   if value is None or value == '':
+      return default
+
+   return value
+
+def get_float_attr(attr,key,default):
+   try:
+      return float(get_attr(attr,key,default))
+   except ValueError:
+      return default
+
+class NodeStyle:
+   """
+   Drawing attributes of a node, read from the pygraphviz graph (see graphtools.apply_graph_param)
+   """
+   def __init__(self,node):
+      attr = node.attr
+
+      label = get_attr(attr,'label','\\N')
+      self.label_list = label.replace('\\N',str(node)).replace('\\n','\n').split('\n')
+
+      self.fontsize  = get_float_attr(attr,'fontsize',14.)
+      self.fontname  = get_attr(attr,'fontname','Times,serif')
+      self.fontcolor = get_attr(attr,'fontcolor','black')
+      self.color     = get_attr(attr,'color','black')
+      self.fillcolor = get_attr(attr,'fillcolor','lightgrey')
+      self.style     = get_attr(attr,'style','')
+      self.peripheries = int(get_float_attr(attr,'peripheries',1))
+
+      # Minimal size in points (graphviz defaults: 0.75 x 0.5 inches)
+      self.min_width  = get_float_attr(attr,'width',0.75)*POINTS
+      self.min_height = get_float_attr(attr,'height',0.5)*POINTS
+
+   def get_size(self):
+      """
+      Estimated size of the box of the node (points)
+      """
+      text_width  = max( len(x) for x in self.label_list ) * self.fontsize * CHAR_WIDTH
+      text_height = len(self.label_list) * self.fontsize * LINE_HEIGHT
+
+      return max(text_width + 2*MARGIN_X, self.min_width), max(text_height + 2*MARGIN_Y, self.min_height)
+
+def get_edge_arrays(graph_dict,node_index):
+   """
+   Source and destination indices of the edges of the adjacency dict, without the self calls
+   """
+   edge_list = [ (node_index[node], node_index[x]) for node, successors in graph_dict.items() for x in successors if x != node ]
+
+   if len(edge_list) == 0:
+      return np.zeros(0,dtype=np.int64), np.zeros(0,dtype=np.int64)
+
+   edges = np.array(edge_list,dtype=np.int64)
+   return edges[:,0], edges[:,1]
+
+def get_csr(nnodes,src,dst):
+   """
+   Successors of each node in compressed form: dst[order[offsets[i]:offsets[i+1]]]
+   """
+   order = np.argsort(src,kind='stable')
+   offsets = np.zeros(nnodes+1,dtype=np.int64)
+   np.cumsum(np.bincount(src,minlength=nnodes),out=offsets[1:])
+   return order, offsets
+
+def get_postorder(nnodes,src,dst):
+   """
+   Post-order number of each node in an iterative depth-first search (the nodes are started in their order)
+   """
+   order, offsets = get_csr(nnodes,src,dst)
+   succ = dst[order].tolist()
+   offsets = offsets.tolist()
+
+   post = [-1]*nnodes
+   visited = [False]*nnodes
+   count = 0
+
+   for start in range(nnodes):
+      if visited[start]:
+         continue
+
+      visited[start] = True
+      stack = [(start,offsets[start])]
+
+      while stack:
+         node, i = stack[-1]
+         if i < offsets[node+1]:
+            stack[-1] = (node,i+1)
+            x = succ[i]
+            if not visited[x]:
+               visited[x] = True
+               stack.append((x,offsets[x]))
+         else:
+            stack.pop()
+            post[node] = count
+            count += 1
+
+   return np.array(post,dtype=np.int64)
+
+def get_layers(nnodes,src,dst):
+   """
+   Break the cycles and assign the layers (longest path from the nodes without predecessors).
+   Return the layer of each node and the mask of the reversed edges.
+   """
+   post = get_postorder(nnodes,src,dst)
+
+   # The back edges are the edges to a node that finishes later in the depth-first search
+   reversed_mask = post[src] < post[dst]
+   a = np.where(reversed_mask,dst,src)
+   b = np.where(reversed_mask,src,dst)
+
+   # The reverse post-order is a topological order of the graph with the reversed back edges
+   order, offsets = get_csr(nnodes,a,b)
+   succ = b[order]
+
+   layer = np.zeros(nnodes,dtype=np.int64)
+   for node in np.argsort(-post).tolist():
+      start, end = offsets[node], offsets[node+1]
+      if start < end:
+         s = succ[start:end]
+         layer[s] = np.maximum(layer[s],layer[node]+1)
+
+   return layer, reversed_mask
+
+def add_dummy_nodes(layer,a,b,max_span=MAX_DUMMY_SPAN):
+   """
+   Split the edges a->b that cross several layers (at most max_span) with dummy nodes.
+   Return the layers of all the nodes, the edges between the layers (consecutive layers, except for the longer edges)
+   and the first dummy node of each edge (the dummy nodes of an edge are consecutive).
+   """
+   nnodes = len(layer)
+   span = layer[b] - layer[a]
+   ndummy_per_edge = np.where(span <= max_span,np.maximum(span-1,0),0)
+   ndummy = int(ndummy_per_edge.sum())
+
+   first_dummy = nnodes + np.cumsum(ndummy_per_edge) - ndummy_per_edge
+
+   # Rank of each dummy node in its edge
+   edge_of_dummy = np.repeat(np.arange(len(a)),ndummy_per_edge)
+   rank_in_edge = np.arange(ndummy) - (first_dummy[edge_of_dummy] - nnodes)
+
+   dummy_layer = layer[a][edge_of_dummy] + 1 + rank_in_edge
+   all_layer = np.concatenate([layer,dummy_layer])
+
+   # Chain of each edge: a -> first dummy -> ... -> last dummy -> b
+   dummy_id = nnodes + np.arange(ndummy)
+   has_dummy = ndummy_per_edge > 0
+   last_dummy = first_dummy + ndummy_per_edge - 1
+
+   is_last = np.ones(ndummy,dtype=bool)
+   if ndummy > 0:
+      is_last[:-1] = edge_of_dummy[1:] != edge_of_dummy[:-1]
+
+   src = np.concatenate([ a[~has_dummy], a[has_dummy], dummy_id[~is_last], last_dummy[has_dummy] ])
+   dst = np.concatenate([ b[~has_dummy], first_dummy[has_dummy], dummy_id[~is_last]+1, b[has_dummy] ])
+
+   return all_layer, src, dst, first_dummy, ndummy_per_edge
+
+class LayerEdges:
+   """
+   Edges between the layers, grouped by the layer of their destination (down)
+   and of their source (up), with the local indices of the nodes in their layers
+   """
+   def __init__(self,layer_nodes,local_index,all_layer,src,dst):
+      nlayers = len(layer_nodes)
+
+      self.down = []
+      self.up = []
+
+      down_order = np.argsort(all_layer[dst],kind='stable')
+      down_offsets = np.searchsorted(all_layer[dst][down_order],np.arange(nlayers+1))
+
+      for l in range(nlayers):
+         e = down_order[down_offsets[l]:down_offsets[l+1]]
+         self.down.append((src[e],local_index[dst[e]]))
+
+      up_order = np.argsort(all_layer[src],kind='stable')
+      up_offsets = np.searchsorted(all_layer[src][up_order],np.arange(nlayers+1))
+
+      for l in range(nlayers):
+         e = up_order[up_offsets[l]:up_offsets[l+1]]
+         self.up.append((dst[e],local_index[src[e]]))
+
+def get_barycenter(neighbour_value,local,current):
+   """
+   Mean value of the neighbours of each node of a layer (current value if the node has no neighbours)
+   """
+   n = len(current)
+   counts = np.bincount(local,minlength=n)
+   sums = np.bincount(local,weights=neighbour_value,minlength=n)
+
+   return np.where(counts > 0, sums/np.maximum(counts,1), current)
+
+def reduce_crossings(layer_nodes,layer_edges,pos,nsweeps=ORDER_SWEEPS):
+   """
+   Barycenter heuristic: the nodes of each layer are sorted by the mean position of their neighbours
+   in the previous layers (down sweeps) or in the next layers (up sweeps). pos is modified in place.
+   """
+   nlayers = len(layer_nodes)
+
+   for sweep in range(nsweeps):
+      if sweep % 2 == 0:
+         layer_range = range(1,nlayers)
+         edges = layer_edges.down
+      else:
+         layer_range = range(nlayers-2,-1,-1)
+         edges = layer_edges.up
+
+      for l in layer_range:
+         nodes = layer_nodes[l]
+         neighbours, local = edges[l]
+         if len(neighbours) == 0:
+            continue
+
+         barycenter = get_barycenter(pos[neighbours].astype(float),local,pos[nodes].astype(float))
+         order = np.argsort(barycenter,kind='stable')
+         pos[nodes[order]] = np.arange(len(nodes))
+
+def project_separation(desired,separation):
+   """
+   Closest positions to desired (sorted nodes of a layer) with y[i] - y[i-1] >= separation[i]:
+   mean of the solutions of a forward and a backward pass (cumulative maximum and minimum)
+   """
+   c = np.cumsum(separation)
+   w = desired - c
+   forward  = np.maximum.accumulate(w) + c
+   backward = np.minimum.accumulate(w[::-1])[::-1] + c
+
+   return 0.5*(forward + backward)
+
+def assign_coordinates(layer_nodes,layer_edges,pos,order_size,nodesep,nsweeps=COORD_SWEEPS):
+   """
+   Coordinate of the nodes along the layers: packed in the order of pos, then pulled
+   towards the mean coordinate of their neighbours while keeping the order and the separation
+   """
+   coord = np.zeros(len(pos))
+   sorted_layer_nodes = []
+   separation_list = []
+
+   for nodes in layer_nodes:
+      nodes = nodes[np.argsort(pos[nodes])]
+      size = order_size[nodes]
+
+      separation = np.zeros(len(nodes))
+      separation[1:] = 0.5*(size[1:] + size[:-1]) + nodesep
+
+      c = np.cumsum(separation)
+      coord[nodes] = c - 0.5*c[-1]
+
+      sorted_layer_nodes.append(nodes)
+      separation_list.append(separation)
+
+   nlayers = len(layer_nodes)
+   local_rank = np.zeros(len(pos),dtype=np.int64)
+   for nodes in sorted_layer_nodes:
+      local_rank[nodes] = np.arange(len(nodes))
+
+   for sweep in range(nsweeps):
+      if sweep % 2 == 0:
+         layer_range = range(1,nlayers)
+         edges = layer_edges.down
+      else:
+         layer_range = range(nlayers-2,-1,-1)
+         edges = layer_edges.up
+
+      for l in layer_range:
+         nodes = sorted_layer_nodes[l]
+         neighbours, local = edges[l]
+         if len(neighbours) == 0:
+            continue
+
+         # local is the index in layer_nodes, the barycenter is needed in the sorted order
+         barycenter = np.empty(len(nodes))
+         barycenter[local_rank[layer_nodes[l]]] = get_barycenter(coord[neighbours],local,coord[layer_nodes[l]])
+
+         coord[nodes] = project_separation(barycenter,separation_list[l])
+
+   return coord
+
+class Layout:
+   """
+   Positions of the nodes (centers, points, graphviz coordinates: y upwards) and points of the edges
+   """
+   def __init__(self,node_list,graph_dict,size_array,rankdir='LR',ranksep=0.5*POINTS,nodesep=0.25*POINTS):
+      self.node_list = node_list
+      node_index = { node: i for i, node in enumerate(node_list) }
+      nnodes = len(node_list)
+
+      horizontal = rankdir in ['LR','RL']
+
+      self.width  = size_array[:,0]
+      self.height = size_array[:,1]
+      rank_size  = self.width if horizontal else self.height
+      order_size = self.height if horizontal else self.width
+
+      src, dst = get_edge_arrays(graph_dict,node_index)
+      layer, reversed_mask = get_layers(nnodes,src,dst)
+
+      a = np.where(reversed_mask,dst,src)
+      b = np.where(reversed_mask,src,dst)
+      all_layer, chain_src, chain_dst, first_dummy, ndummy_per_edge = add_dummy_nodes(layer,a,b)
+
+      nall = len(all_layer)
+      nlayers = int(all_layer.max()) + 1 if nall > 0 else 0
+
+      # Nodes of each layer, in their initial order (dummy nodes after the nodes)
+      layer_order = np.argsort(all_layer,kind='stable')
+      layer_offsets = np.searchsorted(all_layer[layer_order],np.arange(nlayers+1))
+      layer_nodes = [ layer_order[layer_offsets[l]:layer_offsets[l+1]] for l in range(nlayers) ]
+
+      local_index = np.zeros(nall,dtype=np.int64)
+      pos = np.zeros(nall,dtype=np.int64)
+      for nodes in layer_nodes:
+         local_index[nodes] = np.arange(len(nodes))
+         pos[nodes] = np.arange(len(nodes))
+
+      layer_edges = LayerEdges(layer_nodes,local_index,all_layer,chain_src,chain_dst)
+
+      reduce_crossings(layer_nodes,layer_edges,pos)
+
+      # The dummy nodes take the space of an edge
+      all_order_size = np.concatenate([order_size,np.zeros(nall-nnodes)])
+      order_coord = assign_coordinates(layer_nodes,layer_edges,pos,all_order_size,nodesep)
+
+      # Coordinate of the layers: the widest node of each layer, and ranksep between the layers
+      layer_size = np.zeros(nlayers)
+      if nnodes > 0:
+         np.maximum.at(layer_size,layer,rank_size)
+      layer_coord = np.cumsum(layer_size + ranksep) - 0.5*layer_size - ranksep
+      rank_coord = layer_coord[all_layer]
+
+      if rankdir == 'LR':
+         x, y = rank_coord, -order_coord
+      elif rankdir == 'RL':
+         x, y = -rank_coord, -order_coord
+      elif rankdir == 'BT':
+         x, y = order_coord, rank_coord
+      else:
+         x, y = order_coord, -rank_coord
+
+      self.x = x
+      self.y = y
+
+      edge_list = self.get_edge_list(graph_dict,node_index,src,dst,reversed_mask,first_dummy,ndummy_per_edge)
+
+      # Bounding box of the node boxes and of the edges (the dummy nodes and the loops can be outside the nodes), moved to (0,0)
+      point_array = np.array([ p for s, d, point_list in edge_list for p in point_list ]).reshape(-1,2)
+      xmin = min(np.min(x[:nnodes] - 0.5*self.width,initial=np.inf), np.min(point_array[:,0],initial=np.inf))
+      ymin = min(np.min(y[:nnodes] - 0.5*self.height,initial=np.inf), np.min(point_array[:,1],initial=np.inf))
+      xmax = max(np.max(x[:nnodes] + 0.5*self.width,initial=-np.inf), np.max(point_array[:,0],initial=-np.inf))
+      ymax = max(np.max(y[:nnodes] + 0.5*self.height,initial=-np.inf), np.max(point_array[:,1],initial=-np.inf))
+
+      if nnodes == 0:
+         xmin = ymin = xmax = ymax = 0.
+
+      self.x = x - xmin
+      self.y = y - ymin
+      self.bb_width  = float(xmax - xmin)
+      self.bb_height = float(ymax - ymin)
+
+      self.edge_list = [ (s, d, [ (px-xmin,py-ymin) for px, py in point_list ]) for s, d, point_list in edge_list ]
+
+   def get_edge_list(self,graph_dict,node_index,src,dst,reversed_mask,first_dummy,ndummy_per_edge):
+      """
+      Edges (source, destination, points), the points from the border of the source
+      to the border of the destination (through the dummy nodes)
+      """
+      edge_list = []
+
+      x = self.x.tolist()
+      y = self.y.tolist()
+      half_width  = (0.5*self.width).tolist()
+      half_height = (0.5*self.height).tolist()
+
+      for s, d, rev, first, ndummy in zip(src.tolist(),dst.tolist(),reversed_mask.tolist(),first_dummy.tolist(),ndummy_per_edge.tolist()):
+         dummy_list = list(range(first,first+ndummy))
+         if rev:
+            dummy_list.reverse()
+
+         point_list = [ (x[k],y[k]) for k in dummy_list ]
+
+         next_point = point_list[0] if point_list else (x[d],y[d])
+         prev_point = point_list[-1] if point_list else (x[s],y[s])
+
+         start = clip_to_box((x[s],y[s]),half_width[s],half_height[s],next_point)
+         end   = clip_to_box((x[d],y[d]),half_width[d],half_height[d],prev_point)
+
+         edge_list.append((self.node_list[s],self.node_list[d],[start] + point_list + [end]))
+
+      # Self calls: a loop on the side of the node
+      for node, successors in graph_dict.items():
+         if node in successors:
+            k = node_index[node]
+            x_right = x[k] + half_width[k]
+            dy = half_height[k]/2
+            edge_list.append((node,node,[(x_right,y[k]+dy),(x_right+2*dy,y[k]+dy),(x_right+2*dy,y[k]-dy),(x_right,y[k]-dy)]))
+
+      return edge_list
+
+def clip_to_box(center,half_width,half_height,target):
+   """
+   Intersection of the segment from the center of a box to target with the border of the box
+   """
+   dx = target[0] - center[0]
+   dy = target[1] - center[1]
+
+   if dx == 0 and dy == 0:
+      return center
+
+   t = min( half_width/abs(dx) if dx != 0 else float('inf'), half_height/abs(dy) if dy != 0 else float('inf') )
+   t = min(t,1.)
+
+   return (center[0] + t*dx, center[1] + t*dy)
+
+def get_arrow(point_list):
+   """
+   Shorten the last segment of an edge by the arrow length, return the points and the arrow head polygon
+   """
+   (x1,y1), (x2,y2) = point_list[-2], point_list[-1]
+   length = ((x2-x1)**2 + (y2-y1)**2)**0.5
+
+   if length == 0:
+      return point_list, []
+
+   ux, uy = (x2-x1)/length, (y2-y1)/length
+   arrow_length = min(ARROW_LENGTH,length)
+   bx, by = x2 - arrow_length*ux, y2 - arrow_length*uy
+
+   head = [ (bx - ARROW_WIDTH*uy, by + ARROW_WIDTH*ux), (x2,y2), (bx + ARROW_WIDTH*uy, by - ARROW_WIDTH*ux) ]
+
+   return point_list[:-1] + [(bx,by)], head + head[:1]
+
+def svg_point(p):
+   return '{:.2f},{:.2f}'.format(p[0],-p[1])
+
+def write_svg(svg_path,layout,style_list,pad=0.1*POINTS,edge_color='black'):
+   """
+   Write the graph in SVG, with the structure of the graphviz files (see htmltools.get_node_coord)
+   """
+   width  = layout.bb_width + 2*pad
+   height = layout.bb_height + 2*pad
+
+   line_list = ['<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+                '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN"',
+                ' "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">',
+                '<!-- Generated by fastlayout -->',
+                '<svg width="{:.0f}pt" height="{:.0f}pt"'.format(width,height),
+                ' viewBox="0.00 0.00 {:.2f} {:.2f}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'.format(width,height),
+                '<g id="graph0" class="graph" transform="scale(1 1) rotate(0) translate({:.2f} {:.2f})">'.format(pad,height-pad),
+                '<polygon fill="white" stroke="none" points="{:} {:} {:} {:} {:}"/>'.format(*[ svg_point(p) for p in [(-pad,-pad),(-pad,height-pad),(width-pad,height-pad),(width-pad,-pad),(-pad,-pad)] ])]
+
+   # Edges first (outputorder=edgesfirst)
+   for i, (s, d, point_list) in enumerate(layout.edge_list):
+      point_list, head = get_arrow(point_list)
+      title = escape('{:}->{:}'.format(s,d)).replace('-','&#45;')
+
+      line_list += ['<!-- {:} -->'.format(title),
+                    '<g id="edge{:}" class="edge">'.format(i+1),
+                    '<title>{:}</title>'.format(title),
+                    '<path fill="none" stroke="{:}" d="M{:}"/>'.format(edge_color,' L'.join( svg_point(p) for p in point_list ))]
+      if head:
+         line_list.append('<polygon fill="{0:}" stroke="{0:}" points="{1:}"/>'.format(edge_color,' '.join( svg_point(p) for p in head )))
+      line_list.append('</g>')
+
+   for i, (node, style) in enumerate(zip(layout.node_list,style_list)):
+      x, y = layout.x[i], layout.y[i]
+      hw, hh = 0.5*layout.width[i], 0.5*layout.height[i]
+
+      fill = style.fillcolor if 'filled' in style.style else 'none'
+      dash = ' stroke-dasharray="5,2"' if 'dashed' in style.style else ''
+
+      title = escape(str(node))
+      line_list += ['<!-- {:} -->'.format(title),
+                    '<g id="node{:}" class="node">'.format(i+1),
+                    '<title>{:}</title>'.format(title)]
+
+      # The first polygon is the box of the node (read by htmltools.get_node_coord), then the peripheries
+      for k in range(max(style.peripheries,1)):
+         d = 4.*k
+         box = [(x+hw+d,y+hh+d),(x-hw-d,y+hh+d),(x-hw-d,y-hh-d),(x+hw+d,y-hh-d),(x+hw+d,y+hh+d)]
+         line_list.append('<polygon fill="{:}" stroke="{:}"{:} points="{:}"/>'.format(fill if k == 0 else 'none',style.color,dash,' '.join( svg_point(p) for p in box )))
+
+      nlines = len(style.label_list)
+      line_height = style.fontsize*LINE_HEIGHT
+      for k, label in enumerate(style.label_list):
+         baseline = y + (0.5*(nlines-1) - k)*line_height - 0.3*style.fontsize
+         line_list.append('<text text-anchor="middle" x="{:.2f}" y="{:.2f}" font-family="{:}" font-size="{:.2f}" fill="{:}">{:}</text>'.format(x,-baseline,style.fontname,style.fontsize,style.fontcolor,escape(label)))
+
+      line_list.append('</g>')
+
+   line_list += ['</g>','</svg>','']
+
+   with open(svg_path,'w') as f:
+      f.write('\n'.join(line_list))
+
+def set_graph_positions(graph,layout):
+   """
+   Attach the positions to the pygraphviz graph (graphviz renders the other formats from them)
+   """
+   graph.graph_attr['bb'] = '0,0,{:.2f},{:.2f}'.format(layout.bb_width,layout.bb_height)
+
+   for i, node in enumerate(layout.node_list):
+      n = graph.get_node(node)
+      n.attr['pos'] = '{:.2f},{:.2f}'.format(layout.x[i],layout.y[i])
+      n.attr['width']  = '{:.4f}'.format(layout.width[i]/POINTS)
+      n.attr['height'] = '{:.4f}'.format(layout.height[i]/POINTS)
+
+   # Edge positions: the segments of the polylines as cubic Bezier curves, 'e,' is the end of the arrow
+   pos_dict = {}
+   for s, d, point_list in layout.edge_list:
+      point_list, head = get_arrow(point_list)
+      bezier = [point_list[0]]
+      for (x1,y1), (x2,y2) in zip(point_list[:-1],point_list[1:]):
+         bezier += [ (x1+(x2-x1)/3,y1+(y2-y1)/3), (x1+2*(x2-x1)/3,y1+2*(y2-y1)/3), (x2,y2) ]
+
+      pos = ' '.join( '{:.2f},{:.2f}'.format(*p) for p in bezier )
+      if head:
+         pos = 'e,{:.2f},{:.2f} '.format(*head[1]) + pos
+      pos_dict[(s,d)] = pos
+
+   for edge in graph.edges_iter():
+      pos = pos_dict.get((str(edge[0]),str(edge[1])))
+      if pos is not None:
+         edge.attr['pos'] = pos
+
+   graph.has_layout = True
+
+def draw_graph(graph,graph_dict,output_path_list):
+   """
+   Compute the layout of graph (pygraphviz graph of the adjacency dict graph_dict, see graphtools.create_call_graph)
+   and write the SVG files of output_path_list. Return the other paths: the positions are attached
+   to the graph if there are some (see set_graph_positions).
+   """
+   t1 = tnow()
+
+   node_list = [ str(x) for x in graph.nodes_iter() ]
+   style_list = [ NodeStyle(graph.get_node(x)) for x in node_list ]
+   size_array = np.array([ x.get_size() for x in style_list ]).reshape(-1,2)
+
+   rankdir = get_attr(graph.graph_attr,'rankdir','TB')
+   ranksep = get_float_attr(graph.graph_attr,'ranksep',0.5)*POINTS
+   nodesep = get_float_attr(graph.graph_attr,'nodesep',0.25)*POINTS
+   pad = get_float_attr(graph.graph_attr,'pad',0.1)*POINTS
+
+   layout = Layout(node_list,graph_dict,size_array,rankdir=rankdir,ranksep=ranksep,nodesep=nodesep)
+
+   print('Fast layout: {:} nodes, {:.2f} s'.format(len(node_list),tnow() - t1))
+
+   edge_color = get_attr(graph.edge_attr,'color','black')
+
+   other_path_list = []
+   for output_path in output_path_list:
+      if output_path.endswith('.svg'):
+         write_svg(output_path,layout,style_list,pad=pad,edge_color=edge_color)
+      else:
+         other_path_list.append(output_path)
+
+   if len(other_path_list) > 0:
+      set_graph_positions(graph,layout)
+
+   return other_path_list
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
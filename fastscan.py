@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+
+"""
+Fast engine: streaming line-oriented scan of the free-form FORTRAN source code.
+No parse tree is built, only the facts needed for the graphs (program units, calls,
+uses, function references, interfaces, allocations, line spans) are extracted
+into the same MyNode objects as with the fparser engine.
+"""
+
+import os, sys, re, io
+
+from parsetools import MySubrOrFunc, MyFortranVariable, MyFortranArray, get_node_class
+from cpptools import map_line
+
+#
+# Logical lines
+#
+def split_line(line, quote):
+   """
+   Split a physical line into (code, comment, quote) taking the strings into account.
+   The content of the strings is removed from the code.
+   quote is the quote character of a string continued from the previous line (or None),
+   the returned quote is the one of a string continued on the next line.
+   """
+   # Fast path: no strings, comments or continued string
+   if quote is None and "'" not in line and '"' not in line and '!' not in line:
+      return line, None, None
+
+   code = []
+   i = 0
+   n = len(line)
+
+   while i < n:
+      char = line[i]
+
+      if quote is not None:
+         if char == quote:
+            # Doubled quote inside a string
+            if i+1 < n and line[i+1] == quote:
+               i += 2
+               continue
+            code.append(char)
+            quote = None
+         elif char == '&' and line[i+1:].strip() == '':
+            # String continued on the next line
+            code.append('&')
+            return ''.join(code), None, quote
+         i += 1
+         continue
+
+      if char in '\'"':
+         quote = char
+         code.append(char)
+      elif char == '!':
+         return ''.join(code), line[i:], None
+      else:
+         code.append(char)
+      i += 1
+
+   return ''.join(code), None, quote
+
+def iter_logical_lines(line_iter):
+   """
+   Yield the events of the free-form source:
+     ('stmt', statement, first_line, last_line) for each statement (continuation lines joined,
+                                                   split on ';', strings emptied)
+     ('comment', line, blank) for each comment or blank line
+   The comments that are inside a continued statement are yielded after the statement (as fparser does)
+   """
+   buffer = []
+   first_line = None
+   delayed_comment_list = []
+   quote = None
+
+   for lineno, line in enumerate(line_iter, start=1):
+      line = line.rstrip('\n')
+
+      stripped = line.strip()
+
+      # Preprocessor directives
+      if quote is None and stripped.startswith('#'):
+         continue
+
+      if quote is None and (stripped == '' or stripped.startswith('!')):
+         if buffer:
+            delayed_comment_list.append((lineno,stripped == ''))
+         else:
+            yield ('comment', lineno, stripped == '')
+         continue
+
+      # Continuation of the previous line
+      if buffer and stripped.startswith('&'):
+         line = line[line.index('&')+1:]
+
+      code, comment, quote = split_line(line, quote)
+
+      if comment is not None:
+         delayed_comment_list.append((lineno,False))
+
+      code = code.rstrip()
+
+      if first_line is None:
+         first_line = lineno
+
+      if code.endswith('&'):
+         buffer.append(code[:-1])
+         continue
+
+      buffer.append(code)
+      statement = ''.join(buffer)
+
+      for sub_statement in split_statements(statement):
+         yield ('stmt', sub_statement, first_line, lineno)
+
+      for comment_line, blank in delayed_comment_list:
+         yield ('comment', comment_line, blank)
+
+      buffer = []
+      first_line = None
+      delayed_comment_list = []
+
+def split_statements(statement):
+   """
+   Split on ';' (the strings are already empty)
+   """
+   return [x.strip() for x in statement.split(';') if x.strip() != '']
+
+def split_top_level(text, sep=','):
+   """
+   Split text on sep that are not inside parentheses
+   """
+   part_list = []
+   depth = 0
+   start = 0
+   for i,char in enumerate(text):
+      if char in '([':
+         depth += 1
+      elif char in ')]':
+         depth -= 1
+      elif char == sep and depth == 0:
+         part_list.append(text[start:i].strip())
+         start = i+1
+
+   part_list.append(text[start:].strip())
+
+   return [x for x in part_list if x != '']
+
+def get_paren_content(text, start):
+   """
+   Return the content of the parentheses that open at text[start] and the index after the closing one
+   """
+   depth = 0
+   for i in range(start,len(text)):
+      if text[i] == '(':
+         depth += 1
+      elif text[i] == ')':
+         depth -= 1
+         if depth == 0:
+            return text[start+1:i], i+1
+
+   return text[start+1:], len(text)
+
+#
+# Statements
+#
+NAME = r'[a-z_]\w*'
+
+TYPE_SPEC = r'(?:integer|real|double\s*precision|double\s*complex|complex|logical|character)\b' + \
+            r'\s*(?:\((?:[^()]|\([^()]*\))*\)|\*\s*\w+)?' + \
+            r'|(?:type|class)\s*\((?:[^()]|\([^()]*\))*\)'
+
+PREFIX = r'(?:(?:recursive|non_recursive|pure|impure|elemental|module)\s+|(?:' + TYPE_SPEC + r')\s*)*'
+
+label_re       = re.compile(r'^\d+\s+')
+construct_re   = re.compile(r'^' + NAME + r'\s*:(?!:)\s*', re.I)
+module_re      = re.compile(r'^module\s+(?!(?:procedure|subroutine|function|pure|impure|elemental|recursive)\b)(' + NAME + r')\s*$', re.I)
+submodule_re   = re.compile(r'^submodule\s*\(', re.I)
+program_re     = re.compile(r'^program\s+(' + NAME + r')', re.I)
+subprogram_re  = re.compile(r'^' + PREFIX + r'(subroutine|function)\s+(' + NAME + r')', re.I)
+sep_module_procedure_re = re.compile(r'^module\s+procedure\s+(' + NAME + r')\s*$', re.I)
+block_data_re  = re.compile(r'^block\s*data\b', re.I)
+interface_re   = re.compile(r'^(abstract\s+)?interface\b\s*(.*)$', re.I)
+type_def_re    = re.compile(r'^type\b(?!\s*\()(?!\s+is\b)\s*(?:,.*?::|::)?\s*(' + NAME + r')\s*(?:\(.*\))?$', re.I)
+contains_re    = re.compile(r'^contains$', re.I)
+end_re         = re.compile(r'^end\s*(subroutine|function|module|submodule|program|interface|type|procedure|block\s*data)\b', re.I)
+use_re         = re.compile(r'^use\b\s*(?:,\s*(?:non_)?intrinsic\s*)?(?:::)?\s*(' + NAME + r')', re.I)
+call_re        = re.compile(r'^call\s+(' + NAME + r'(?:\s*%\s*' + NAME + r')*)\s*(\(.*)?$', re.I)
+if_re          = re.compile(r'^if\s*\(', re.I)
+procedure_re   = re.compile(r'^(?:module\s+)?procedure\b\s*(?:::)?\s*(.*)$', re.I)
+alloc_re       = re.compile(r'^(allocate|deallocate)\s*\(', re.I)
+decl_re        = re.compile(r'^(' + TYPE_SPEC + r')\s*(?=,|::|[a-z_])', re.I)
+spec_stmt_re   = re.compile(r'^(?:dimension|parameter|implicit|external|intrinsic|save|data|common|equivalence|namelist|'
+                            r'public|private|optional|allocatable|pointer|target|intent|import|format|enum|enumerator|'
+                            r'entry|include|bind|value|volatile|protected|contiguous|asynchronous|sequence|generic|'
+                            r'final|procedure|use)\b\s*(?:$|::|,|\(|[a-z_])', re.I)
+ref_re         = re.compile(r'(?<![%\w])(' + NAME + r')\s*\(', re.I)
+
+KEYWORDS = set('''
+   if then else elseif call allocate deallocate nullify write read print open close inquire rewind backspace
+   endfile flush wait format do while concurrent select case where elsewhere forall associate block critical
+   return stop error go goto continue cycle exit result bind intent dimension len kind type class is default
+   sync all images memory lock unlock change team event post form rank
+'''.split())
+
+INTRINSICS = set('''
+   abs achar acos acosh adjustl adjustr aimag aint all allocated anint any asin asinh associated atan atan2 atanh
+   atomic_define atomic_ref bessel_j0 bessel_j1 bessel_jn bessel_y0 bessel_y1 bessel_yn bge bgt bit_size ble blt
+   btest c_associated c_f_pointer c_f_procpointer c_funloc c_loc c_sizeof ceiling char cmplx command_argument_count
+   conjg cos cosh count cpu_time cshift date_and_time dble dcmplx digits dim dot_product dprod dshiftl dshiftr
+   eoshift epsilon erf erfc erfc_scaled execute_command_line exp exponent extends_type_of findloc float floor
+   fraction gamma get_command get_command_argument get_environment_variable huge hypot iachar iall iand iany
+   ibclr ibits ibset ichar idint idnint ieor ifix image_index index int ior iparity is_contiguous is_iostat_end
+   is_iostat_eor ishft ishftc kind lbound lcobound leadz len len_trim lge lgt lle llt log log10 log_gamma logical
+   maskl maskr matmul max maxexponent maxloc maxval merge merge_bits min minexponent minloc minval mod modulo
+   move_alloc mvbits nearest new_line nint norm2 not null num_images pack parity popcnt poppar precision present
+   product radix random_number random_seed range rank real repeat reshape rrspacing same_type_as scale scan
+   selected_char_kind selected_int_kind selected_real_kind set_exponent shape shifta shiftl shiftr sign sin sinh
+   size sngl spacing spread sqrt storage_size sum system_clock tan tanh this_image tiny trailz transfer transpose
+   trim ubound ucobound unpack verify
+'''.split())
+
+class ScanUnit:
+   """
+   Program unit (or other scoping block) found by the scanner
+   """
+   def __init__(self,kind,name,first_line,parent=None):
+      self.kind = kind
+      self.name = name
+      self.parent = parent
+      self.first_line = first_line
+      self.last_line = first_line
+      self.nitems = 0
+
+      # Lines with a statement and lines with a (non-blank) comment
+      self.code_line_set = set()
+      self.comment_line_set = set()
+
+      self.in_contains = False
+
+      self.children = []
+      self.calls  = []
+      self.refs   = []
+      self.uses   = []
+      self.decls  = []
+      self.alloc  = []
+      self.dealloc = []
+      self.procedures = []
+
+   def iter_subtree(self):
+      yield self
+      for child in self.children:
+         yield from child.iter_subtree()
+
+   def get_module(self):
+      unit = self.parent
+      while unit is not None:
+         if unit.kind == 'module':
+            return unit
+         unit = unit.parent
+      return None
+
+   def in_interface(self):
+      unit = self.parent
+      while unit is not None:
+         if unit.kind == 'interface':
+            return True
+         unit = unit.parent
+      return False
+
+class FastScanner:
+   """
+   Scan the events of iter_logical_lines and build the tree of ScanUnit
+   """
+   def __init__(self):
+      self.unit_list = []
+      self.stack = []
+
+      # Comments since the previous statement: [(line, blank), ...]
+      self.pending_comment_list = []
+
+      # Lines of the current statement
+      self.statement_lines = range(0)
+
+   @property
+   def current(self):
+      return self.stack[-1] if self.stack else None
+
+   def start_unit(self,kind,name,first_line):
+      """
+      Push a new unit on the stack. As in fparser, the comments since the previous statement
+      belong to the new unit (except at the top level).
+      """
+      parent = self.current
+
+      # The first statement of the unit is a part of the parent
+      self.count_item()
+
+      unit = ScanUnit(kind,name,first_line,parent=parent)
+      unit.nitems = 1
+      unit.code_line_set.update(self.statement_lines)
+
+      if parent is not None:
+         parent.children.append(unit)
+
+         if len(self.pending_comment_list) > 0:
+            unit.first_line = self.pending_comment_list[0][0]
+            unit.nitems += len(self.pending_comment_list)
+            unit.comment_line_set.update( line for line, blank in self.pending_comment_list if not blank )
+
+      self.stack.append(unit)
+      self.unit_list.append(unit)
+
+   def pop(self,last_line):
+      unit = self.stack.pop()
+      unit.last_line = last_line
+      return unit
+
+   def count_item(self):
+      """
+      Count the current statement in all the units of the stack
+      """
+      for unit in self.stack:
+         unit.nitems += 1
+         unit.code_line_set.update(self.statement_lines)
+
+   def count_comment(self,line,blank):
+      for unit in self.stack:
+         unit.nitems += 1
+         if not blank:
+            unit.comment_line_set.add(line)
+
+   def scan(self,line_iter):
+      for event in iter_logical_lines(line_iter):
+         if event[0] == 'comment':
+            line, blank = event[1:]
+            self.pending_comment_list.append((line,blank))
+            self.count_comment(line,blank)
+            continue
+
+         statement, first_line, last_line = event[1:]
+         self.statement_lines = range(first_line,last_line+1)
+         self.process_statement(statement,first_line,last_line)
+
+         self.pending_comment_list = []
+
+      return self.unit_list
+
+   def process_statement(self,statement,first_line,last_line):
+      statement = label_re.sub('',statement)
+      statement = construct_re.sub('',statement)
+
+      unit = self.current
+
+      #
+      # Ends of the units
+      #
+      end_match = end_re.match(statement)
+      if statement.lower() == 'end' or end_match:
+         if unit is not None:
+            self.count_item()
+            self.pop(last_line)
+         return
+
+      #
+      # Beginnings of the units
+      #
+      if unit is not None and unit.kind == 'type':
+         # Derived type definition: components and type-bound procedures
+         self.count_item()
+         return
+
+      if unit is not None and unit.kind == 'interface':
+         subprogram_match = subprogram_re.match(statement)
+         if subprogram_match:
+            self.start_unit(subprogram_match.group(1).lower(),subprogram_match.group(2),first_line)
+            return
+
+         procedure_match = procedure_re.match(statement)
+         if procedure_match:
+            unit.procedures += [x.strip() for x in procedure_match.group(1).split(',') if x.strip() != '']
+
+         self.count_item()
+         return
+
+      module_match = module_re.match(statement)
+      if module_match:
+         self.start_unit('module',module_match.group(1),first_line)
+         return
+
+      if submodule_re.match(statement):
+         self.start_unit('submodule',None,first_line)
+         return
+
+      program_match = program_re.match(statement)
+      if program_match:
+         self.start_unit('program',program_match.group(1),first_line)
+         return
+
+      if block_data_re.match(statement):
+         self.start_unit('block_data',None,first_line)
+         return
+
+      sep_module_procedure_match = sep_module_procedure_re.match(statement)
+      if sep_module_procedure_match:
+         self.start_unit('procedure',sep_module_procedure_match.group(1),first_line)
+         return
+
+      subprogram_match = subprogram_re.match(statement)
+      if subprogram_match:
+         self.start_unit(subprogram_match.group(1).lower(),subprogram_match.group(2),first_line)
+         return
+
+      interface_match = interface_re.match(statement)
+      if interface_match:
+         name = interface_match.group(2).strip()
+         if interface_match.group(1) is not None or not re.fullmatch(NAME,name,re.I):
+            # Abstract, unnamed, operator, or assignment interface
+            name = None
+         self.start_unit('interface',name,first_line)
+         return
+
+      type_def_match = type_def_re.match(statement)
+      if type_def_match:
+         self.start_unit('type',type_def_match.group(1),first_line)
+         return
+
+      if unit is None:
+         return
+
+      self.count_item()
+
+      if contains_re.match(statement):
+         unit.in_contains = True
+         return
+
+      self.process_body_statement(unit,statement)
+
+   def process_body_statement(self,unit,statement):
+      """
+      Statements inside a program unit
+      """
+      use_match = use_re.match(statement)
+      if use_match:
+         unit.uses.append(use_match.group(1))
+         return
+
+      # Logical if: the condition and the action statement
+      if if_re.match(statement):
+         condition, end = get_paren_content(statement,statement.index('('))
+         action = statement[end:].strip()
+
+         unit.refs += self.get_refs(condition)
+
+         if action.lower() != 'then' and action != '':
+            self.process_body_statement(unit,action)
+         return
+
+      call_match = call_re.match(statement)
+      if call_match:
+         unit.calls.append(call_match.group(1).strip())
+         if call_match.group(2) is not None:
+            unit.refs += self.get_refs(call_match.group(2))
+         return
+
+      alloc_match = alloc_re.match(statement)
+      if alloc_match:
+         content, end = get_paren_content(statement,statement.index('('))
+         if alloc_match.group(1).lower() == 'allocate':
+            unit.alloc += self.get_allocations(content)
+         else:
+            unit.dealloc += self.get_deallocations(content)
+         return
+
+      decl_match = decl_re.match(statement)
+      if decl_match and not subprogram_re.match(statement):
+         unit.decls += self.get_declarations(decl_match.group(1),statement[decl_match.end():])
+         return
+
+      if spec_stmt_re.match(statement):
+         return
+
+      unit.refs += self.get_refs(statement)
+
+   @staticmethod
+   def get_refs(text):
+      """
+      Names followed by a parenthesis: array or function references
+      """
+      text = re.sub(r'\s*%\s*','%',text)
+      ref_list = []
+      for name in ref_re.findall(text):
+         name_lower = name.lower()
+         if name_lower not in KEYWORDS and name_lower not in INTRINSICS:
+            ref_list.append(name)
+      return ref_list
+
+   @staticmethod
+   def get_allocations(content):
+      allocation_list = []
+      if '::' in content:
+         content = content.split('::',1)[1]
+
+      for item in split_top_level(content):
+         if re.match(r'^' + NAME + r'\s*=[^=]',item,re.I):
+            # stat=, errmsg=, source=, mold=
+            continue
+         paren = item.rfind('(')
+         if item.endswith(')') and paren > 0:
+            shape_content, end = get_paren_content(item,item.index('(',len(item.split('(')[0])))
+            name = item[:item.index('(')].strip()
+            shape_list = split_top_level(shape_content)
+         else:
+            name = item.strip()
+            shape_list = []
+         allocation_list.append((name,shape_list))
+
+      return allocation_list
+
+   @staticmethod
+   def get_deallocations(content):
+      return [ item.strip() for item in split_top_level(content) \
+               if not re.match(r'^' + NAME + r'\s*=[^=]',item,re.I) ]
+
+   @staticmethod
+   def get_declarations(ftype,rest):
+      """
+      Return the list of (name, type, shape_list) of a type declaration statement
+      """
+      if '::' in rest:
+         entities = rest.split('::',1)[1]
+      else:
+         entities = rest
+
+      declaration_list = []
+      for entity in split_top_level(entities):
+         entity = entity.split('=')[0].strip()
+         name_match = re.match(r'^(' + NAME + r')\s*(\()?',entity,re.I)
+         if name_match is None:
+            continue
+
+         shape_list = None
+         if name_match.group(2) is not None:
+            shape_content, end = get_paren_content(entity,name_match.end(2)-1)
+            spec_list = split_top_level(shape_content)
+            # Assumed-size (*) specifications have no shape
+            if len(spec_list) > 0 and not spec_list[-1].endswith('*'):
+               shape_list = spec_list
+
+         declaration_list.append((name_match.group(1),ftype.strip(),shape_list))
+
+      return declaration_list
+
+#
+# MyNode objects from the scanned units
+#
+callable_kinds = {
+   'subroutine' : 'Subroutine',
+   'function'   : 'Function',
+   'interface'  : 'Interface',
+   'program'    : 'Program',
+   'module'     : 'Module',
+}
+
+def get_sorted_names(name_list):
+   return sorted(list(set(name_list)))
+
+def get_subtree_names(unit,kind):
+   return get_sorted_names([ x.name for x in unit.iter_subtree() if x.kind == kind and x is not unit ])
+
+def get_unit_scope(unit):
+   """
+   Lower case names of the enclosing program units, outermost first (see MyNode.get_scope)
+   """
+   scope = []
+   parent = unit.parent
+   while parent is not None:
+      if parent.kind == 'interface':
+         return ()
+
+      if parent.kind in ['module','program','subroutine','function'] and parent.name is not None:
+         scope.append(parent.name.lower())
+
+      parent = parent.parent
+
+   return tuple(reversed(scope))
+
+def get_subtree_uses(unit):
+   return get_sorted_names([ name for x in unit.iter_subtree() for name in x.uses ])
+
+def get_var_dict(unit):
+   var_dict = {}
+   for name, ftype, shape_list in unit.decls:
+      myvar = MyFortranVariable(name=name,ftype=ftype)
+      myvar.shape_list = shape_list
+      var_dict[myvar.name] = myvar
+   return var_dict
+
+def get_array_list(name_shape_list,var_dict):
+   array_list = []
+   for name, shape_list in name_shape_list:
+      myarray = MyFortranArray()
+      myarray.name = name
+      if shape_list is not None:
+         myarray.shape_list = shape_list
+      if name in var_dict.keys():
+         myarray.ftype = var_dict[name].ftype
+      array_list.append(myarray)
+   return sorted(array_list, key=lambda x: x.name)
+
+def create_node(unit,filename,fparser_type,analysis='full',line_map=None):
+   """
+   Create the MyNode object (with the same attributes as with the fparser engine) of a unit
+   line_map maps the lines of the preprocessed source to the original file (see cpptools)
+   """
+   node_class = get_node_class(fparser_type)
+
+   attr_dict = {
+      'fparser_type' : fparser_type,
+      'type'         : callable_kinds[unit.kind],
+      'filename'     : filename,
+      'name'         : unit.name,
+      'parent_types' : [],
+      'scope'        : get_unit_scope(unit),
+      'interface_body' : False,
+      'uses'         : None,
+      'calls'        : None,
+      'arrays_or_funcs' : None,
+      'subroutines'  : get_subtree_names(unit,'subroutine'),
+      'functions'    : get_subtree_names(unit,'function'),
+      'nfirst_line'  : map_line(line_map,unit.first_line),
+      'nlast_line'   : map_line(line_map,unit.last_line),
+      'nlines'       : unit.nitems - 1,
+   }
+
+   if line_map is None:
+      code_line_set, comment_line_set = unit.code_line_set, unit.comment_line_set
+   else:
+      code_line_set = { map_line(line_map,x) for x in unit.code_line_set }
+      comment_line_set = { map_line(line_map,x) for x in unit.comment_line_set }
+
+   attr_dict['ncode_lines'] = len(code_line_set)
+   attr_dict['ncomment_lines'] = len(comment_line_set - code_line_set)
+
+   if issubclass(node_class,MySubrOrFunc):
+      uses = get_subtree_uses(unit)
+      module = unit.get_module()
+      if module is not None:
+         uses = get_sorted_names(uses + get_subtree_uses(module))
+
+      var_dict = get_var_dict(unit)
+
+      attr_dict |= {
+         'uses'   : uses,
+         'calls'  : get_sorted_names(unit.calls),
+         'arrays' : None,
+         'arrays_or_funcs' : get_sorted_names(unit.refs),
+         'var_dict' : var_dict,
+         'alloc'   : get_array_list(unit.alloc,var_dict),
+         'dealloc' : get_array_list([(name,None) for name in unit.dealloc],{}),
+      }
+
+      mynode = node_class.from_attrs(attr_dict)
+      mynode.alloc_wo_dealloc = mynode.get_alloc_wo_dealloc()
+      mynode.dealloc_wo_alloc = mynode.get_dealloc_wo_alloc()
+
+   elif unit.kind == 'interface':
+      attr_dict['procedures'] = sorted(unit.procedures)
+      mynode = node_class.from_attrs(attr_dict)
+
+   elif unit.kind == 'module':
+      attr_dict['uses'] = get_subtree_uses(unit)
+      mynode = node_class.from_attrs(attr_dict)
+
+   else:
+      mynode = node_class.from_attrs(attr_dict)
+
+   mynode.set_analysis_level(analysis)
+
+   return mynode
+
+def scan_file(filepath,preprocessor=None):
+   """
+   Scan a file and return the list of ScanUnit objects and the line map of the preprocessed
+   source to the original file (None if preprocessor is None)
+   """
+   if preprocessor is not None:
+      text, line_map = preprocessor.preprocess(filepath)
+      return FastScanner().scan(io.StringIO(text)), line_map
+
+   with open(filepath,'r',errors='replace') as f:
+      return FastScanner().scan(f), None
+
+def extract_file_fast(path,fparser_types_list,filename,analysis='full',preprocessor=None):
+   """
+   Same as parsetools.extract_file, with the fast engine
+   """
+   unit_list, line_map = scan_file(os.path.join(path,filename),preprocessor=preprocessor)
+
+   local_node_dict_list = []
+   for fparser_types in fparser_types_list:
+      # e.g. Subroutine_Stmt -> Subroutine
+      kind_dict = { fparser_type.__name__.replace('_Stmt',''): fparser_type for fparser_type in fparser_types }
+
+      local_node_dict = {}
+      for unit in unit_list:
+         # Unnamed interfaces and interface bodies are not callables
+         if unit.name is None or unit.in_interface():
+            continue
+
+         kind = callable_kinds.get(unit.kind)
+         if kind in kind_dict.keys():
+            mynode = create_node(unit,filename,kind_dict[kind],analysis=analysis,line_map=line_map)
+            local_node_dict[mynode.get_qualified_name()] = mynode
+
+      local_node_dict_list.append(local_node_dict)
+
+   return filename, local_node_dict_list
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
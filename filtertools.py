@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+
+"""
+Filters of the call graph: hidden nodes and removed connections, declared in a single specification
+and compiled once (sets for the exact names, one regular expression per kind of pattern).
+The filter is applied to the adjacency dict {node: {successor: None}} in a single pass over the edges.
+
+Specification (YAML file of the --filter option):
+
+   hide:                        # hidden nodes: a node is hidden if it matches one of the rules
+     - name: init_*             # glob pattern (or exact name) of the node name (case insensitive),
+                                #   the qualified name mod::name or the bare name
+     - regex: ^debug_           # regular expression searched in the node name (case insensitive)
+     - file: utils/*.F90        # glob pattern of the file (path relative to the source folder, or name)
+     - module: mod_log          # enclosing module (or program) of the node, or the module itself
+     - type: Function           # Subroutine, Function, Interface, Program, Module or External
+     - {module: mod_io, type: Function}   # the predicates of a rule must all match
+
+   forbid:                      # removed connections: caller -> callee
+     - caller: main
+       callee: [log_*, timer]
+
+   allow:                       # only these connections are kept for the matching callers
+     - caller: work
+       callee: [helper, fsq]
+
+The caller and callee of the connection rules are node rules as above: a name pattern, a list of name patterns,
+or a dict of predicates.
+"""
+
+import os, sys, re, fnmatch
+
+from yaml import load
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+NODE_PREDICATES = ['name','regex','file','module','type']
+
+def is_glob(pattern):
+   return any( c in pattern for c in '*?[' )
+
+def join_regex(regex_list,flags=0):
+   """
+   Single regular expression that matches any of regex_list (None if the list is empty)
+   """
+   if len(regex_list) == 0:
+      return None
+
+   return re.compile('|'.join( '(?:{:})'.format(x) for x in regex_list ),flags)
+
+class NodeInfo:
+   """
+   Attributes of a node used by the predicates.
+   name is the key of the node (qualified module::name if several modules define the name),
+   bare_name is the name of the procedure without its module.
+   """
+   def __init__(self,name,node_obj=None):
+      self.name = name
+
+      if node_obj is None:
+         self.bare_name = name
+         self.type = 'External'
+         self.filename = None
+         self.module = None
+      else:
+         self.bare_name = node_obj.name.lower()
+         self.type = node_obj.type
+         self.filename = node_obj.filename
+
+         scope = getattr(node_obj,'scope',())
+         if len(scope) > 0:
+            self.module = scope[0]
+         elif node_obj.type == 'Module':
+            self.module = node_obj.name.lower()
+         else:
+            self.module = None
+
+   def get_names(self):
+      if self.bare_name == self.name:
+         return [self.name]
+      return [self.name, self.bare_name]
+
+   def get_file_names(self):
+      if self.filename is None:
+         return []
+      return [self.filename, os.path.basename(self.filename)]
+
+class NodeRule:
+   """
+   Conjunction of predicates on a node: {predicate: value or list of values}
+   A list of values matches if one of the values matches.
+   """
+   def __init__(self,rule):
+      if isinstance(rule,str):
+         rule = {'name': rule}
+
+      if not isinstance(rule,dict) or len(rule) == 0:
+         raise ValueError(f'Wrong filter rule: {rule}')
+
+      self.predicate_dict = {}
+      for predicate, value_list in rule.items():
+         if predicate not in NODE_PREDICATES:
+            raise ValueError('Unknown predicate in the filter rule {:}: {:} (choose from {:})'.format(rule,predicate,', '.join(NODE_PREDICATES)))
+
+         if not isinstance(value_list,list):
+            value_list = [value_list]
+
+         self.predicate_dict[predicate] = [ str(x) for x in value_list ]
+
+class NodeMatcher:
+   """
+   Compiled set of node rules: a node matches if one of the rules matches.
+   The names are compared without case (Fortran is case insensitive, the external nodes keep the case of the source).
+   The rules with a single predicate are merged into sets (exact names, modules, types)
+   and into one regular expression per attribute (name and file patterns),
+   the rules with several predicates are evaluated one by one.
+   """
+   def __init__(self,rule_list):
+      name_set = set()
+      name_regex_list = []
+      file_set = set()
+      file_regex_list = []
+      module_set = set()
+      type_set = set()
+
+      self.conjunction_list = []
+
+      for rule in rule_list:
+         node_rule = rule if isinstance(rule,NodeRule) else NodeRule(rule)
+
+         if len(node_rule.predicate_dict) > 1:
+            self.conjunction_list.append(NodeMatcher.compile_predicates(node_rule.predicate_dict))
+            continue
+
+         predicate, value_list = list(node_rule.predicate_dict.items())[0]
+         for value in value_list:
+            if predicate == 'name':
+               if is_glob(value):
+                  # Anchored at the start, as the regular expressions are searched in the name
+                  name_regex_list.append('\\A'+fnmatch.translate(value.lower()))
+               else:
+                  name_set.add(value.lower())
+            elif predicate == 'regex':
+               name_regex_list.append(value)
+            elif predicate == 'file':
+               if is_glob(value):
+                  file_regex_list.append(fnmatch.translate(value))
+               else:
+                  file_set.add(value)
+            elif predicate == 'module':
+               module_set.add(value.lower())
+            elif predicate == 'type':
+               type_set.add(value)
+
+      self.name_set = name_set
+      self.name_regex = join_regex(name_regex_list,re.IGNORECASE)
+      self.file_set = file_set
+      self.file_regex = join_regex(file_regex_list)
+      self.module_set = module_set
+      self.type_set = type_set
+
+   @staticmethod
+   def compile_predicates(predicate_dict):
+      """
+      Matcher of each predicate of a conjunction (each one is a NodeMatcher with a single rule)
+      """
+      return [ NodeMatcher([{predicate: value_list}]) for predicate, value_list in predicate_dict.items() ]
+
+   def is_empty(self):
+      return not ( self.name_set or self.name_regex or self.file_set or self.file_regex or
+                   self.module_set or self.type_set or self.conjunction_list )
+
+   def match(self,info):
+      if info.type in self.type_set:
+         return True
+
+      # The key of the node and its bare name
+      for name in info.get_names():
+         if name.lower() in self.name_set:
+            return True
+         if self.name_regex is not None and self.name_regex.search(name):
+            return True
+
+      if info.module is not None and info.module.lower() in self.module_set:
+         return True
+
+      for filename in info.get_file_names():
+         if filename in self.file_set:
+            return True
+         if self.file_regex is not None and self.file_regex.match(filename):
+            return True
+
+      for matcher_list in self.conjunction_list:
+         if all( x.match(info) for x in matcher_list ):
+            return True
+
+      return False
+
+class EdgeRule:
+   """
+   Connection rule: caller -> callee (node rules, see NodeRule)
+   """
+   def __init__(self,rule):
+      if not isinstance(rule,dict) or 'caller' not in rule or 'callee' not in rule:
+         raise ValueError(f'Wrong connection rule (caller and callee are required): {rule}')
+
+      self.caller_matcher = NodeMatcher(get_rule_list(rule['caller']))
+      self.callee_matcher = NodeMatcher(get_rule_list(rule['callee']))
+
+def check_spec(spec):
+   """
+   Check the sections of a filter specification
+   """
+   if not isinstance(spec,dict):
+      raise ValueError(f'Wrong filter specification: {spec}')
+
+   unknown_keys = set(spec.keys()) - {'hide','forbid','allow'}
+   if len(unknown_keys) > 0:
+      raise ValueError('Unknown sections in the filter: {:} (choose from hide, forbid, allow)'.format(', '.join(sorted(unknown_keys))))
+
+def get_rule_list(rule):
+   """
+   A node rule, or a list of node rules
+   """
+   if isinstance(rule,list):
+      return rule
+   return [rule]
+
+class GraphFilter:
+   """
+   Compiled filter of the call graph (see the module docstring for the specification)
+   """
+   def __init__(self,hide=None,forbid=None,allow=None):
+      self.hide_matcher = NodeMatcher(hide or [])
+      self.forbid_rule_list = [ EdgeRule(x) for x in (forbid or []) ]
+      self.allow_rule_list = [ EdgeRule(x) for x in (allow or []) ]
+
+   @classmethod
+   def from_dict(cls,spec):
+      check_spec(spec)
+      return cls(hide=spec.get('hide'),forbid=spec.get('forbid'),allow=spec.get('allow'))
+
+   @classmethod
+   def from_options(cls,filter_path=None,hide_nodes=None,hide_from_files=None,allowed_connections_path=None,forbidden_connections_path=None):
+      """
+      Filter from the specification file and from the separate options: lists of hidden nodes and files,
+      and YAML files of the allowed/forbidden connections {node: [successors]}
+      """
+      spec = {'hide': [], 'forbid': [], 'allow': []}
+
+      if filter_path is not None:
+         with open(filter_path,'r') as stream:
+            file_spec = load(stream,Loader=Loader) or {}
+
+         check_spec(file_spec)
+         for key in spec.keys():
+            spec[key] += file_spec.get(key) or []
+
+      if hide_nodes:
+         spec['hide'].append({'name': list(hide_nodes)})
+
+      if hide_from_files:
+         spec['hide'].append({'file': list(hide_from_files)})
+
+      if allowed_connections_path is not None:
+         spec['allow'] += get_connection_rule_list(allowed_connections_path)
+
+      if forbidden_connections_path is not None:
+         spec['forbid'] += get_connection_rule_list(forbidden_connections_path)
+
+      return cls.from_dict(spec)
+
+   def is_empty(self):
+      return self.hide_matcher.is_empty() and len(self.forbid_rule_list) == 0 and len(self.allow_rule_list) == 0
+
+   def apply(self,graph_dict,callable_dict):
+      """
+      Return the filtered copy of the adjacency dict: without the hidden nodes and the removed connections.
+      Each node is matched once against each rule, then the edges are filtered in a single pass.
+      """
+      # The nodes without successors (e.g. external procedures) are not necessarily keys
+      node_list = list(graph_dict.keys())
+      node_set = set(node_list)
+      for successors in graph_dict.values():
+         for node in successors:
+            if node not in node_set:
+               node_set.add(node)
+               node_list.append(node)
+
+      info_dict = { node: NodeInfo(node,callable_dict.get(node)) for node in node_list }
+
+      hidden = { node for node in node_list if self.hide_matcher.match(info_dict[node]) }
+
+      # Connection rules: the callers and the callees of each rule
+      forbid_list = [ ({ x for x in graph_dict if rule.caller_matcher.match(info_dict[x]) },
+                       { x for x in node_list if rule.callee_matcher.match(info_dict[x]) })
+                      for rule in self.forbid_rule_list ]
+
+      allow_dict = {}
+      for rule in self.allow_rule_list:
+         callee_set = { x for x in node_list if rule.callee_matcher.match(info_dict[x]) }
+         for caller in graph_dict:
+            if rule.caller_matcher.match(info_dict[caller]):
+               allow_dict.setdefault(caller,set()).update(callee_set)
+
+      filtered_graph_dict = {}
+      for node, successors in graph_dict.items():
+         if node in hidden:
+            continue
+
+         allowed = allow_dict.get(node)
+         forbidden_list = [ callee_set for caller_set, callee_set in forbid_list if node in caller_set ]
+
+         filtered_graph_dict[node] = { x: None for x in successors
+                                       if x not in hidden
+                                       and ( allowed is None or x in allowed )
+                                       and not any( x in callee_set for callee_set in forbidden_list ) }
+
+      return filtered_graph_dict
+
+def get_connection_rule_list(path_to_dict):
+   """
+   Connection rules from a YAML file of connections {node: [successors]}
+   (the format of the --allowed-connections and --forbidden-connections files).
+   The nodes are name rules: they match the qualified names and the bare names (see NodeMatcher.match).
+   """
+   with open(path_to_dict ,'r') as stream:
+      connection_dict = load(stream,Loader=Loader) or {}
+
+   return [ {'caller': {'name': str(node)}, 'callee': {'name': [ str(x) for x in successors ]}} for node, successors in connection_dict.items() ]
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
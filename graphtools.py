@@ -4,9 +4,10 @@
 Tools for graphviz parametrization
 """
 
-import time,sys, warnings
+import os, time,sys, warnings
 import pygraphviz as pgv
-from collections import OrderedDict
+import fastlayout
+from collections import OrderedDict, deque
 
 import yaml
 
@@ -42,7 +43,7 @@ def print_default_graph_param():
       ('node','shape')    : 'rectangle',
       ('graph','overlap') : 'false',
       ('graph','rankdir') : 'LR',
-      ('graph','layout')  : 'dot', # 'dot', 'fdp', 'neato', 'twopi'
+      ('graph','layout')  : 'dot', # 'dot', 'fdp', 'neato', 'twopi', 'fast' (layered layout of the large graphs, see fastlayout)
       ('graph','pad')     : 0.1,
       ('node','fontsize') : 14,
       ('node','style') : 'filled',
@@ -51,149 +52,363 @@ def print_default_graph_param():
 
    return graph_param_dict 
 
-def get_node_depth(graph,node,depth=0):
+def get_node_depth_dict(graph_dict,root_node):
    """
-   Get the depth of the node (an integer starting from 0) using the predecessors method.
+   Get the depth of all the nodes of the graph in a single pass: {node: depth}.
+   graph_dict is the adjacency dict of the graph {node: {successor: None}} (see create_call_graph_dict).
+   The depth is the shortest distance from the root node (breadth-first search, every node
+   is visited once, so cycles are allowed). The nodes that are not reachable from the root node
+   get their distance from the nearest node without predecessors (or from the first remaining node
+   of a cycle).
    """
+   node_list = list(graph_dict.keys())
 
-   predecessors = graph.predecessors(node)
+   has_predecessor = set()
+   for node, successors in graph_dict.items():
+      has_predecessor.update( x for x in successors if x != node )
 
-   if len(predecessors) > 0:
-      depth = get_node_depth(graph,predecessors[0],depth=depth+1)
+   depth_dict = {}
 
-   return depth
+   def visit(seed_list):
+      queue = deque()
+      for seed in seed_list:
+         if seed not in depth_dict:
+            depth_dict[seed] = 0
+            queue.append(seed)
 
-def get_all_graph_successors(graph,node,glob_list=None):
-   """
-   Get all the successors of a node recursively.
-   """
-   if glob_list is None:
-      glob_list = []
+      while queue:
+         node = queue.popleft()
+         for successor in graph_dict.get(node,{}):
+            if successor not in depth_dict:
+               depth_dict[successor] = depth_dict[node] + 1
+               queue.append(successor)
 
-   successors = graph.successors(node)
+   if root_node in graph_dict:
+      visit([root_node])
 
-   glob_list += successors
+   visit([ node for node in node_list if node not in has_predecessor ])
 
-   for successor in successors:
-      get_all_graph_successors(graph,successor,glob_list=glob_list)
+   for node in node_list:
+      if node not in depth_dict:
+         visit([node])
 
-   return glob_list
+   return depth_dict
 
-def create_call_graph(graph_dict,callable_dict,root_node_name,hide_from_files=None,hide_nodes=None,allowed_connections=None,forbidden_connections=None):
+def get_reachable_nodes(graph_dict,root_node_name):
    """
-   Create a pygraphviz graph based on callable_dict
+   Get the set of nodes reachable from the root node in graph_dict (including the root node).
+   The traversal is iterative and every node is visited once, so cycles are allowed.
    """
-   t1 = tnow()
-   print('\nCreating graph')
+   reachable = {root_node_name}
+   stack = [root_node_name]
 
-   call_graph = pgv.AGraph(graph_dict,strict=False,directed=True)#.reverse()
+   while stack:
+      node = stack.pop()
+      for successor in graph_dict.get(node,{}):
+         if successor not in reachable:
+            reachable.add(successor)
+            stack.append(successor)
 
-   root_node = call_graph.get_node(root_node_name)
+   return reachable
+
+def get_pgv_graph_dict(graph):
+   """
+   Adjacency dict {node: {successor: None}} of a pygraphviz graph
+   """
+   return { str(node): { str(x): None for x in graph.successors_iter(node) } for node in graph.nodes_iter() }
+
+def create_call_graph_dict(graph_dict,callable_dict,root_node_name,graph_filter=None,max_depth=None,condense_cycles=True,verbose=True):
+   """
+   Create the adjacency dict {node: {successor: None}} of the graph to draw from the root node:
+   the subgraph of graph_dict reachable from the root node, without the hidden nodes and connections.
+   Every node of the result is a key (also the nodes without successors).
+   graph_filter is a filtertools.GraphFilter applied to the subgraph, or None if graph_dict is already filtered.
+   If condense_cycles is True, each recursion cycle is collapsed into a single node (see condense_graph_dict).
+   If max_depth is specified, the graph is cut at this distance from the root node (see truncate_graph_dict).
+   Return the adjacency dict, the dict of the stub nodes {stub: (node, number of truncated nodes)}
+   and the dict of the cycle nodes {cycle: [members]}.
+   """
+   t1 = tnow()
+   if verbose:
+      print('\nCreating graph')
 
    #
-   # Remove the nodes that are from the files in hide_from_files list
-   # or if a node is in hide_nodes list
+   # Only the subgraph reachable from the root node is kept,
+   # in the order of graph_dict (the layout depends on the order of the nodes and edges)
    #
-   if hide_from_files is not None or hide_nodes is not None:
-      remove_nodes_from_file_or_list(call_graph,callable_dict,hide_from_files,hide_nodes)
+   reachable = get_reachable_nodes(graph_dict,root_node_name)
+
+   call_graph_dict = { node: dict(successors) for node, successors in graph_dict.items() if node in reachable }
+   for successors in list(call_graph_dict.values()):
+      for node in successors:
+         call_graph_dict.setdefault(node,{})
+   call_graph_dict.setdefault(root_node_name,{})
 
    #
-   # Allowed connections for specific nodes
+   # Hidden nodes and connections, then the nodes that are not the successors
+   # of the root node anymore (their callers or connections were removed)
    #
-   if allowed_connections is not None:
-      modify_node_connections(call_graph,allowed_connections,action='keep')
+   if graph_filter is not None and not graph_filter.is_empty():
+      call_graph_dict = graph_filter.apply(call_graph_dict,callable_dict)
 
-   if forbidden_connections is not None:
-      modify_node_connections(call_graph,forbidden_connections,action='exclude')
+      if root_node_name in call_graph_dict:
+         reachable = get_reachable_nodes(call_graph_dict,root_node_name)
+         delete_nodes(call_graph_dict,[ node for node in call_graph_dict if node not in reachable ])
 
    #
-   # Remove all the nodes that are not the successors of the root node
+   # Recursion cycles: the depth, the truncation and the layout work on the condensed graph (a DAG, except for the self calls)
    #
-   all_successors = get_all_graph_successors(call_graph,root_node)
+   cycle_dict = {}
+   graph_root_node = root_node_name
+   if condense_cycles:
+      call_graph_dict, cycle_dict = condense_graph_dict(call_graph_dict)
+
+      for cycle, member_list in cycle_dict.items():
+         if root_node_name in member_list:
+            graph_root_node = cycle
+
+   stub_dict = {}
+   if max_depth is not None:
+      stub_dict = truncate_graph_dict(call_graph_dict,graph_root_node,max_depth)
+
+      # The graph of a truncated cycle is the graph of its first member
+      for stub, (node, ntruncated) in stub_dict.items():
+         if node in cycle_dict:
+            stub_dict[stub] = (cycle_dict[node][0], ntruncated)
+
+      # The cycles cut away by the truncation are not in the graph anymore
+      cycle_dict = { cycle: member_list for cycle, member_list in cycle_dict.items() if cycle in call_graph_dict }
+
+   if verbose:
+      nedges = sum( len(successors) for successors in call_graph_dict.values() )
+      print('Graph: {:} nodes, {:} edges'.format(len(call_graph_dict),nedges))
+      if len(cycle_dict) > 0:
+         print('Recursion cycles: {:} ({:} nodes)'.format(len(cycle_dict),sum( len(x) for x in cycle_dict.values() )))
+      if len(stub_dict) > 0:
+         print('Truncated at depth {:}: {:} stub nodes'.format(max_depth,len(stub_dict)))
+      print('Done: {:.2f} s'.format(tnow() - t1))
+
+   return call_graph_dict, stub_dict, cycle_dict
+
+def get_strongly_connected_components(graph_dict):
+   """
+   Strongly connected components of the graph (Tarjan's algorithm, iterative, so the depth of the graph is not limited
+   by the recursion limit). Return the list of the components (lists of nodes), in reverse topological order.
+   """
+   index_dict = {}
+   lowlink_dict = {}
+   on_stack = set()
+   stack = []
+   component_list = []
+
+   def push(node):
+      index_dict[node] = lowlink_dict[node] = len(index_dict)
+      stack.append(node)
+      on_stack.add(node)
+
+   for start_node in graph_dict.keys():
+      if start_node in index_dict:
+         continue
+
+      push(start_node)
+      work_stack = [(start_node,iter(graph_dict.get(start_node,{})))]
+
+      while work_stack:
+         node, successor_iter = work_stack[-1]
+
+         for successor in successor_iter:
+            if successor not in index_dict:
+               push(successor)
+               work_stack.append((successor,iter(graph_dict.get(successor,{}))))
+               break
+            elif successor in on_stack:
+               lowlink_dict[node] = min(lowlink_dict[node],index_dict[successor])
+         else:
+            # All the successors of node are visited
+            work_stack.pop()
+            if work_stack:
+               parent = work_stack[-1][0]
+               lowlink_dict[parent] = min(lowlink_dict[parent],lowlink_dict[node])
+
+            if lowlink_dict[node] == index_dict[node]:
+               component = []
+               while True:
+                  member = stack.pop()
+                  on_stack.discard(member)
+                  component.append(member)
+                  if member == node:
+                     break
+
+               component_list.append(component)
+
+   return component_list
+
+def get_cycle_name(member_list):
+   """
+   Name of the node of a recursion cycle (a Fortran name cannot start with _)
+   """
+   return '_cycle_' + member_list[0]
+
+def condense_graph_dict(graph_dict):
+   """
+   Collapse each recursion cycle (strongly connected component with more than one node) into a single node,
+   placed at the first member in the order of graph_dict. The self calls of the other nodes are kept.
+   Return the condensed adjacency dict and the dict of the cycle nodes {cycle: [members in the order of graph_dict]}
+   """
+   order_dict = { node: i for i, node in enumerate(graph_dict.keys()) }
 
-   #for node in call_graph.nodes():
-   #   if node not in all_successors and node != root_node:
-   #      safely_delete_node(call_graph,node)
+   cycle_dict = {}
+   cycle_of_node = {}
+   for component in get_strongly_connected_components(graph_dict):
+      if len(component) > 1:
+         member_list = sorted(component, key = lambda x: order_dict.get(x,len(order_dict)))
+         cycle = get_cycle_name(member_list)
 
-   print('Done: {:.2f} s'.format(tnow() - t1))
+         cycle_dict[cycle] = member_list
+         for member in member_list:
+            cycle_of_node[member] = cycle
 
-   return call_graph
+   if len(cycle_dict) == 0:
+      return graph_dict, cycle_dict
+
+   condensed_graph_dict = {}
+   for node, successors in graph_dict.items():
+      source = cycle_of_node.get(node,node)
+      condensed_successors = condensed_graph_dict.setdefault(source,{})
+
+      for successor in successors:
+         target = cycle_of_node.get(successor,successor)
+         if target != source or source not in cycle_dict:
+            condensed_successors[target] = None
+
+   return condensed_graph_dict, cycle_dict
+
+def get_stub_name(node):
+   """
+   Name of the stub node that replaces the truncated successors of a node
+   """
+   return '+' + node
 
-def remove_nodes_from_file_or_list(graph,callable_dict,hide_from_files,hide_nodes):
+def truncate_graph_dict(graph_dict,root_node_name,max_depth):
    """
-   Remove the nodes from the graph. The nodes that belong to specific files or
-   that are listed will be removed.
+   Cut the graph (reachable from the root node) at max_depth from the root node: the nodes that are deeper
+   are removed, and the successors that a node loses are replaced by a single stub node "+N more",
+   where N is the number of removed nodes reachable from this node.
+   Return the dict of the stub nodes {stub: (node, N)}
    """
+   depth_dict = get_node_depth_dict(graph_dict,root_node_name)
+   kept_nodes = { node for node, depth in depth_dict.items() if depth <= max_depth }
 
-   for node in graph.nodes():
+   stub_dict = {}
+   for node, successors in graph_dict.items():
+      if node in kept_nodes and any( x not in kept_nodes for x in successors ):
+         ntruncated = len(get_reachable_nodes(graph_dict,node) - kept_nodes)
+         stub_dict[get_stub_name(node)] = (node, ntruncated)
 
-      # Nodes specified explicitly by name
-      node_in_list = node in hide_nodes
+   delete_nodes(graph_dict,[ node for node in graph_dict if node not in kept_nodes ])
 
-      # Nodes that belong to a file from the file list
-      node_from_hid_file = \
-         node in callable_dict.keys() and \
-         callable_dict[node].filename in hide_from_files
+   for stub, (node, ntruncated) in stub_dict.items():
+      graph_dict[node][stub] = None
+      graph_dict[stub] = {}
 
-      if node_in_list or node_from_hid_file:
-         safely_delete_node(graph,node)
+   return stub_dict
 
-def safely_delete_node(graph,node):
+def get_cycle_label(member_list,nmax=5):
    """
-   Safely delete a node from a graph
+   Label of the node of a recursion cycle: the first nmax members
    """
-   try:
-      if graph.has_node(node):
-         graph.delete_node(node)
-      else:
-         warn_message = f'Attempt to delete a node {node}, which is not in the graph.'
-         warnings.warn(warn_message)
+   label_list = ['recursion cycle'] + member_list[:nmax]
+   if len(member_list) > nmax:
+      label_list.append('+{:} more'.format(len(member_list)-nmax))
 
-   except Exception:
-      raise RuntimeError(f'node error: node {node} !')
+   return '\n'.join(label_list)
 
-def modify_node_connections(graph,path_to_dict,action='keep'):
+def create_call_graph(call_graph_dict,stub_dict=None,cycle_dict=None):
    """
-   Remove or to keep only some connections of specific nodes.
+   Create the pygraphviz graph to draw from the adjacency dict (see create_call_graph_dict)
    """
-   with open(path_to_dict ,'r') as stream:
-      action_dict = load(stream,Loader=yaml.FullLoader)
+   graph = pgv.AGraph(call_graph_dict,strict=False,directed=True)#.reverse()
 
-   for node_name, connections in  action_dict.items():
+   if cycle_dict is not None:
+      for cycle, member_list in cycle_dict.items():
+         cycle_node = graph.get_node(cycle)
+         cycle_node.attr['label'] = get_cycle_label(member_list)
+         cycle_node.attr['peripheries'] = 2
 
-      # TODO try expect blocks
-      # Segmentation fault sometimes occures
+   if stub_dict is not None:
+      for stub, (node, ntruncated) in stub_dict.items():
+         stub_node = graph.get_node(stub)
+         stub_node.attr['label'] = '+{:} more'.format(ntruncated)
+         stub_node.attr['style'] = 'dashed,filled'
 
-      if graph.has_node(node_name):
-         node = graph.get_node(node_name)
+   return graph
 
-         for successor in graph.itersucc(node):
+def get_layout_prog(graph_param_dict):
+   """
+   Layout engine of the graph parameters (see print_default_graph_param)
+   """
+   return graph_param_dict.get(('graph','layout'),'dot')
 
-            if action == 'keep':
-               if successor not in connections:
-                  safely_delete_node(graph,successor)
+def draw_graph(graph,output_path_list,prog='dot',graph_dict=None):
+   """
+   Render the output files of a graph (the format is the extension of the path, e.g. .svg, .png, .dot, .json)
+   from a single layout: the positions are computed once, if the layout parameter did not do it already
+   (see apply_graph_param), and every format is rendered from the positions attached to the graph.
+   With the fast layout, the positions and the SVG files are computed without graphviz from graph_dict,
+   the adjacency dict of the graph (see fastlayout.draw_graph).
+   """
+   if prog == fastlayout.FAST_LAYOUT:
+      if graph_dict is None:
+         graph_dict = get_pgv_graph_dict(graph)
+      output_path_list = fastlayout.draw_graph(graph,graph_dict,output_path_list)
 
-            elif action == 'exclude':
-               if successor in connections:
-                  safely_delete_node(graph,successor)
+   elif not graph.has_layout:
+      graph.layout(prog=prog)
 
-            else:
-               sys.exit(f'Wrong action: {action}')
+   # The DOT files first: a rendering changes the format of the graph attributes (e.g. bb)
+   for output_path in output_path_list:
+      if output_path.endswith('.dot'):
+         graph.write(output_path)
 
-      else:
-         warn_message = f'Attempt to access a node {node}, which is not in the graph.'
-         warnings.warn(warn_message)
+   for output_path in output_path_list:
+      if not output_path.endswith('.dot'):
+         # With the positions attached, pygraphviz renders without a new layout (nop2)
+         graph.draw(output_path)
 
-def apply_node_size_depth(graph,size_init,size_delta,root_node):
+def delete_nodes(graph_dict,node_list):
    """
-   Make the size of the node change as a function of depth.
+   Delete the nodes and their edges from the adjacency dict, in a single pass over the edges
    """
-   
-   node_list = graph.nodes()
+   node_set = set(node_list)
+   if len(node_set) == 0:
+      return
+
+   for node in node_set:
+      graph_dict.pop(node,None)
+
+   for successors in graph_dict.values():
+      for node in node_set.intersection(successors):
+         del successors[node]
+
+def safely_delete_node(graph_dict,node):
+   """
+   Safely delete a node from a graph
+   """
+   if node in graph_dict:
+      delete_nodes(graph_dict,[node])
+   else:
+      warn_message = f'Attempt to delete a node {node}, which is not in the graph.'
+      warnings.warn(warn_message)
 
-   depth_list = [get_node_depth(graph,x) for x in node_list]
+def apply_node_size_depth(graph,size_init,size_delta,root_node,depth_dict=None):
+   """
+   Make the size of the node change as a function of depth (see get_node_depth_dict).
+   """
+   if depth_dict is None:
+      depth_dict = get_node_depth_dict(get_pgv_graph_dict(graph),str(root_node))
 
-   for node_name, depth in zip(node_list,depth_list):
+   for node_name in graph.nodes():
+      depth = depth_dict[str(node_name)]
 
       fontsize = size_init - size_delta * depth
 
@@ -224,18 +439,19 @@ def get_meta_graph_dict(graph,param_dict,root_node):
 
    return meta_graph_dict
 
-def apply_meta_properties(graph,meta_graph_dict,root_node):
+def apply_meta_properties(graph,meta_graph_dict,root_node,depth_dict=None):
    """
    Properties of the graph that cannot be tuned with standard graphviz tools.
    """
    
    if meta_graph_dict['node_size_depth']:
-      apply_node_size_depth(graph,meta_graph_dict['size_depth_init'],meta_graph_dict['size_depth_delta'],root_node)
+      apply_node_size_depth(graph,meta_graph_dict['size_depth_init'],meta_graph_dict['size_depth_delta'],root_node,depth_dict=depth_dict)
 
-def apply_graph_param(graph,param_dict,root_node):
+def apply_graph_param(graph,param_dict,root_node,depth_dict=None):
    """
    Apply graph parameters to graph.
    Order in which parameters apply is important.
+   depth_dict is the depth of the nodes (see get_node_depth_dict), computed if it is None
    """
 
    # Dictionary of graph properties
@@ -246,7 +462,9 @@ def apply_graph_param(graph,param_dict,root_node):
       if key[0] == 'graph':
          param = key[1]
          if param == 'layout':
-            graph.layout(prog=value)
+            # The fast layout is computed when the graph is drawn (see draw_graph)
+            if value != fastlayout.FAST_LAYOUT:
+               graph.layout(prog=value)
          else:
             graph.graph_attr[param]=value
 
@@ -286,7 +504,7 @@ def apply_graph_param(graph,param_dict,root_node):
             if meta_graph_dict['node_size_depth']:
                size_init = meta_graph_dict['size_depth_init']
                size_delta = meta_graph_dict['size_depth_delta']
-               apply_node_size_depth(graph,size_init,size_delta,root_node)
+               apply_node_size_depth(graph,size_init,size_delta,root_node,depth_dict=depth_dict)
 
       else:
          print(type(key))
@@ -313,9 +531,19 @@ def load_manual_param_dict(manual_param_path):
 
    return key_tuple_dict
 
-def set_graph_param(graph, root_node, manual_param_path = None):
+class GraphConfig:
    """
-   Wrapper to apply different sets of parameters to a graph
+   Configuration of the graphs, loaded once for all the root nodes:
+   param_dict: graph parameters, the defaults updated with the manual parameters (YAML file)
+   graph_filter: hidden nodes and connections (see filtertools.GraphFilter), or None
+   """
+   def __init__(self,manual_param_path=None,graph_filter=None):
+      self.param_dict = get_graph_param_dict(manual_param_path)
+      self.graph_filter = graph_filter
+
+def get_graph_param_dict(manual_param_path = None):
+   """
+   Default graph parameters, updated with the custom ones if manual_param_path is specified
    """
 
    # First, read the default parameters
@@ -328,5 +556,14 @@ def set_graph_param(graph, root_node, manual_param_path = None):
 
       graph_param_dict = graph_param_dict | manual_graph_param_dict
 
-   apply_graph_param(graph,graph_param_dict,root_node)
+   return graph_param_dict
+
+def set_graph_param(graph, root_node, manual_param_path = None, depth_dict = None, graph_param_dict = None):
+   """
+   Wrapper to apply different sets of parameters to a graph
+   graph_param_dict (see get_graph_param_dict) is read from manual_param_path if it is None
+   """
+   if graph_param_dict is None:
+      graph_param_dict = get_graph_param_dict(manual_param_path)
 
+   apply_graph_param(graph,graph_param_dict,root_node,depth_dict=depth_dict)
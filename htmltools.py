@@ -20,7 +20,7 @@ def get_node_coord(svg_path, node_list, node_type_dict):
       lines = f.readlines()
 
       # insted of "Subroutine-boltz_setup", "boltz_setup", to match with svg file node names
-      node_list_wo_prefix = [l.split('-')[1] for l in node_list]
+      node_list_wo_prefix = set( l.split('-')[1] for l in node_list )
 
       for i,line in enumerate(lines):
 
@@ -62,9 +62,10 @@ def get_node_coord(svg_path, node_list, node_type_dict):
 
    return image_width, image_height, corner_dict
 
-def print_image_map(html, image_width, image_height, corner_dict):
+def print_image_map(html, image_width, image_height, corner_dict, stub_corner_dict = None, stub_link_dict = None):
    """
    Print the map for the nodes of the callgraph
+   The stub nodes of a truncated graph (stub_corner_dict) link to the HTML files in stub_link_dict
    """
 
    html.write('<map name="callgraph">\n')
@@ -73,9 +74,23 @@ def print_image_map(html, image_width, image_height, corner_dict):
 
       html.write('  <area class="graph_node_block" id={0:<15} shape="rect" coords={1:<30} alt={0:<15} href="">\n'.format('"'+node+'"','"'+corner_dict[node]+'"'))
 
+   if stub_corner_dict is not None:
+      for node,corner in stub_corner_dict.items():
+
+         html.write('  <area class="graph_stub_block" shape="rect" coords={0:<30} alt={1:<15} href={2:}>\n'.format('"'+corner+'"','"'+node+'"','"'+stub_link_dict[node]+'"'))
+
    html.write('</map>\n\n')
 
 
+def get_html_filename(root_node, module_tree = False):
+   """
+   Name of the HTML file of a root node
+   """
+   if module_tree:
+      return 'module_tree_{:}.html'.format(root_node)
+   else:
+      return 'call_graph_{:}.html'.format(root_node)
+
 def get_nodes_with_prefix(node_list,prefix):
 
    node_list_with_prefix = []
@@ -113,7 +128,8 @@ def print_collapsible_button(html,node_name,id_content,prefix,text):
 
 def print_uses_modules(html,node_obj,node_name):
 
-   if len(node_obj.uses) == 0:
+   # Not computed below the 'uses' analysis level
+   if not node_obj.uses:
       return
 
    prefix = 'modules'
@@ -135,7 +151,8 @@ def print_uses_modules(html,node_obj,node_name):
 
 def print_array_allocations(html,node_obj,node_name):
 
-   if len(node_obj.alloc) == 0:
+   # Not computed below the 'full' analysis level
+   if not node_obj.alloc:
       return
 
    prefix = 'arrays'
@@ -158,7 +175,33 @@ def print_array_allocations(html,node_obj,node_name):
    html.write('</div>\n')
    html.write('<br>\n'*2)
 
-def print_node_info(html, callable_dict, node_list, action_dict, module_tree = False):
+def print_cycle_members(html,member_list,callable_dict,node_name):
+   """
+   Collapsible list of the members of a recursion cycle
+   """
+
+   prefix = 'members'
+   id_content = get_id_content(node_name,prefix)
+   print_collapsible_button(html,node_name,id_content,prefix,'Members')
+
+   html.write(f'<div class="collapsibleContent" id="{id_content}">\n')
+   html.write('<div class="collapsibleText">\n')
+
+   for member in member_list:
+      if member in callable_dict.keys():
+         member_obj = callable_dict[member]
+         html.write(f'<code>{member}</code> ({member_obj.type}, {member_obj.filename})<br>\n')
+      else:
+         html.write(f'<code>{member}</code> (External)<br>\n')
+
+   html.write('\n<!--collapsibleText -->\n')
+   html.write('</div>\n\n')
+
+   html.write('\n<!--collapsibleContent -->\n')
+   html.write('</div>\n')
+   html.write('<br>\n'*2)
+
+def print_node_info(html, callable_dict, node_list, action_dict, module_tree = False, cycle_dict = None, recursive_node_list = None):
 
    html.write('<!-- Nodes description -->\n\n')
 
@@ -180,18 +223,31 @@ def print_node_info(html, callable_dict, node_list, action_dict, module_tree = F
       # Close "button"
       html.write('<div onclick="CloseDivById(\'{:}\')" class="closeDiv">&#215;</div>\n\n'.format(node))
 
-      if node_name in callable_dict.keys():
+      if node_type == 'Cycle':
+         member_list = cycle_dict[node_name]
+
+         html.write('<p style="font-size:1.2em;"><i>Recursion cycle</i>:&nbsp; <b>{:}</b> procedures</p>\n'.format(len(member_list)))
+         html.write('<p>These procedures call each other recursively, they are drawn as a single node.</p>\n')
+
+         print_cycle_members(html,member_list,callable_dict,node_name)
+
+      elif node_name in callable_dict.keys():
          node_obj = callable_dict[node_name]
 
          html.write('<p style="font-size:1.2em;"><i>{:}</i>:&nbsp; <b>{:}</b></p>\n'.format(node_obj.type,node_obj.name))
          html.write('<p><i>File</i>: {:}</p>\n'.format(node_obj.filename))
 
+         if recursive_node_list is not None and node_name in recursive_node_list:
+            html.write('<p><i>Recursive</i>: calls itself</p>\n')
+
          if module_tree:
             pass
             # print_module_info()
 
          else:
-            html.write('<p><i>Line</i>: {:} &ensp;<i>Num. of lines</i>: {:}</p>\n\n'.format(node_obj.nfirst_line,node_obj.nlines))
+            if node_obj.nfirst_line is not None:
+               html.write('<p><i>Line</i>: {:} &ensp;<i>Num. of lines</i>: {:}</p>\n\n'.format(node_obj.nfirst_line,node_obj.nlines))
+               html.write('<p><i>Code lines</i>: {:} &ensp;<i>Comment lines</i>: {:}</p>\n\n'.format(node_obj.ncode_lines,node_obj.ncomment_lines))
 
             print_uses_modules(html,node_obj,node_name)
 
@@ -261,11 +317,23 @@ def set_action_dict():
          'func' : 'ShowExt',
          'text': 'Show external nodes',
          },
+      'Cycle': { 
+         'backgr' : 'd9c6e8', 
+         'backgr2' : 'efe6f5', 
+         'font'   : '3a1a54',
+         'func' : 'ShowCycle',
+         'text': 'Show recursion cycles',
+         },
    }
 
    return action_dict
 
-def create_html(callable_dict, svg_path, node_list, node_type_dict, path, root_node, module_tree = False):
+def create_html(callable_dict, svg_path, node_list, node_type_dict, path, root_node, module_tree = False, stub_dict = None, cycle_dict = None, recursive_node_list = None):
+   """
+   stub_dict: stub nodes of a truncated graph {stub: (node, number of truncated nodes)}, linked to the HTML files of their nodes
+   cycle_dict: nodes of the recursion cycles {cycle: [members]}, described with their members
+   recursive_node_list: procedures that call themselves
+   """
 
    #
    # Dictionary that contains colors and actions for each node type
@@ -277,14 +345,20 @@ def create_html(callable_dict, svg_path, node_list, node_type_dict, path, root_n
    #
    image_width, image_height, corner_dict = get_node_coord(svg_path, node_list, node_type_dict)
 
+   stub_corner_dict = {}
+   stub_link_dict = {}
+   if stub_dict:
+      stub_type_dict = { stub: 'More' for stub in stub_dict.keys() }
+      image_width, image_height, stub_corner_dict = get_node_coord(svg_path, [ 'More-'+x for x in stub_dict.keys() ], stub_type_dict)
+      stub_link_dict = { 'More-'+stub: get_html_filename(node, module_tree = module_tree) for stub, (node, ntruncated) in stub_dict.items() }
+
    #
    # HTML file
    #
+   html_filename = get_html_filename(root_node, module_tree = module_tree)
    if module_tree:
-      html_filename = 'module_tree_{:}.html'.format(root_node)
       title = f'{root_node} module tree'
    else:
-      html_filename = 'call_graph_{:}.html'.format(root_node)
       title = f'{root_node} call graph'
 
    html = open(html_filename,'w')
@@ -345,7 +419,7 @@ def create_html(callable_dict, svg_path, node_list, node_type_dict, path, root_n
    html.write('<br>\n'*2)
    html.write('\n'*2)
 
-   print_image_map(html, image_width, image_height, corner_dict)
+   print_image_map(html, image_width, image_height, corner_dict, stub_corner_dict, stub_link_dict)
 
    #
    # Wrapper
@@ -364,7 +438,7 @@ def create_html(callable_dict, svg_path, node_list, node_type_dict, path, root_n
    #
    # Nodes description
    #
-   print_node_info(html, callable_dict, node_list, action_dict, module_tree = module_tree)
+   print_node_info(html, callable_dict, node_list, action_dict, module_tree = module_tree, cycle_dict = cycle_dict, recursive_node_list = recursive_node_list)
 
    html.write('<!-- wrapper div -->\n')
    html.write('</div>\n\n')
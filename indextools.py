@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+
+"""
+Persistent call graph index in a SQLite database (tables: files, nodes, edges, uses, allocations),
+updated file by file, and the query subcommand (callers, callees, uses, stats)
+"""
+
+import os, sys, time, sqlite3
+import argparse
+
+tnow = time.perf_counter
+
+INDEX_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE files (
+   id       INTEGER PRIMARY KEY,
+   path     TEXT NOT NULL UNIQUE,
+   mtime_ns INTEGER,
+   size     INTEGER
+);
+CREATE TABLE nodes (
+   id       INTEGER PRIMARY KEY,
+   file_id  INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+   kind     TEXT NOT NULL,
+   key      TEXT NOT NULL,
+   name     TEXT NOT NULL,
+   scope    TEXT NOT NULL,
+   type     TEXT NOT NULL,
+   nfirst_line    INTEGER,
+   nlast_line     INTEGER,
+   nlines         INTEGER,
+   ncode_lines    INTEGER,
+   ncomment_lines INTEGER
+);
+CREATE TABLE edges (
+   caller_id INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+   callee    TEXT NOT NULL
+);
+CREATE TABLE uses (
+   node_id  INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+   module   TEXT NOT NULL
+);
+CREATE TABLE allocations (
+   node_id  INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+   action   TEXT NOT NULL,
+   array    TEXT NOT NULL,
+   ftype    TEXT,
+   shape    TEXT
+);
+CREATE INDEX nodes_file_id ON nodes(file_id);
+CREATE INDEX nodes_key ON nodes(key);
+CREATE INDEX nodes_name ON nodes(name);
+CREATE INDEX edges_caller_id ON edges(caller_id);
+CREATE INDEX edges_callee ON edges(callee);
+CREATE INDEX uses_node_id ON uses(node_id);
+CREATE INDEX uses_module ON uses(module);
+CREATE INDEX allocations_node_id ON allocations(node_id);
+CREATE INDEX allocations_array ON allocations(array);
+'''
+
+stat_attrname_list = ['nfirst_line','nlast_line','nlines','ncode_lines','ncomment_lines']
+
+def get_node_rows(key,node):
+   """
+   Rows of a node: (node columns, edges, uses, allocations). The attributes that are not computed
+   at the analysis level of the node (None) give no rows.
+   """
+   node_columns = (key, node.name.lower(), '::'.join(node.scope), node.type) + \
+                  tuple( node.__dict__.get(attrname) for attrname in stat_attrname_list )
+
+   edge_rows = tuple(sorted(set( x.lower() for x in (node.__dict__.get('calls') or []) )))
+   use_rows = tuple(sorted(set( x.lower() for x in (node.__dict__.get('uses') or []) )))
+
+   allocation_rows = []
+   for action in ['alloc','dealloc']:
+      for myarray in node.__dict__.get(action) or []:
+         shape = ','.join(myarray.shape_list) if myarray.shape_list is not None else None
+         allocation_rows.append((action,myarray.name.lower(),myarray.ftype,shape))
+
+   return node_columns, edge_rows, use_rows, tuple(sorted(allocation_rows, key=str))
+
+class CallGraphIndex:
+   """
+   SQLite database of the nodes of the source code. The kind of a node is 'callable'
+   (subroutines, functions, interfaces and programs of the call graph) or 'module'
+   (modules and programs of the module tree).
+   """
+   def __init__(self,db_path):
+      self.db_path = db_path
+      self.connection = sqlite3.connect(db_path)
+      self.connection.execute('PRAGMA foreign_keys = ON')
+
+      if self.connection.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+         self.create_schema()
+
+   def create_schema(self):
+      """
+      Create the tables (the tables of another index version are dropped)
+      """
+      with self.connection:
+         for table in ['allocations','uses','edges','nodes','files']:
+            self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+         self.connection.executescript(SCHEMA)
+         self.connection.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+   def close(self):
+      self.connection.close()
+
+   def insert_node(self,file_id,kind,node_rows):
+      node_columns, edge_rows, use_rows, allocation_rows = node_rows
+
+      cursor = self.connection.execute('INSERT INTO nodes (file_id,kind,key,name,scope,type,' + ','.join(stat_attrname_list) + ') '
+                                       'VALUES (?,?,?,?,?,?,?,?,?,?,?)', (file_id,kind) + node_columns)
+      node_id = cursor.lastrowid
+
+      self.connection.executemany('INSERT INTO edges (caller_id,callee) VALUES (?,?)', [ (node_id,x) for x in edge_rows ])
+      self.connection.executemany('INSERT INTO uses (node_id,module) VALUES (?,?)', [ (node_id,x) for x in use_rows ])
+      self.connection.executemany('INSERT INTO allocations (node_id,action,array,ftype,shape) VALUES (?,?,?,?,?)',
+                                  [ (node_id,) + x for x in allocation_rows ])
+
+   def replace_file(self,filename,stamp,node_rows_list):
+      """
+      Replace the rows of a file in a single transaction
+      node_rows_list: list of (kind, node rows) (see get_node_rows)
+      """
+      with self.connection:
+         self.connection.execute('DELETE FROM files WHERE path = ?',(filename,))
+         cursor = self.connection.execute('INSERT INTO files (path,mtime_ns,size) VALUES (?,?,?)',(filename,)+stamp)
+         file_id = cursor.lastrowid
+
+         for kind, node_rows in node_rows_list:
+            self.insert_node(file_id,kind,node_rows)
+
+   def remove_file(self,filename):
+      with self.connection:
+         self.connection.execute('DELETE FROM files WHERE path = ?',(filename,))
+
+   def get_file_stamps(self):
+      return { path: (mtime_ns,size) for path, mtime_ns, size in self.connection.execute('SELECT path,mtime_ns,size FROM files') }
+
+   def get_stored_node_rows(self,filename_set):
+      """
+      Rows of the nodes of the files of filename_set: {(filename, kind, key): (node_id, node rows)}
+      """
+      node_dict = {}
+      for node_id, path, kind, *node_columns in self.connection.execute(
+            'SELECT nodes.id, files.path, kind, key, name, scope, type, ' + ','.join(stat_attrname_list) +
+            ' FROM nodes JOIN files ON nodes.file_id = files.id'):
+         if path in filename_set:
+            node_dict[node_id] = (path, kind, tuple(node_columns))
+
+      child_dict = { node_id: ([],[],[]) for node_id in node_dict.keys() }
+      for node_id, callee in self.connection.execute('SELECT caller_id, callee FROM edges'):
+         if node_id in child_dict:
+            child_dict[node_id][0].append(callee)
+      for node_id, module in self.connection.execute('SELECT node_id, module FROM uses'):
+         if node_id in child_dict:
+            child_dict[node_id][1].append(module)
+      for node_id, *allocation_row in self.connection.execute('SELECT node_id, action, array, ftype, shape FROM allocations'):
+         if node_id in child_dict:
+            child_dict[node_id][2].append(tuple(allocation_row))
+
+      stored_dict = {}
+      for node_id, (path, kind, node_columns) in node_dict.items():
+         edge_rows, use_rows, allocation_rows = child_dict[node_id]
+         stored_dict[(path,kind,node_columns[0])] = (node_id, (node_columns, tuple(sorted(edge_rows)), tuple(sorted(use_rows)),
+                                                              tuple(sorted(allocation_rows, key=str))))
+
+      return stored_dict
+
+   def sync(self,path,callable_dict,module_dict=None,source_file_list=None):
+      """
+      Update the index with the analysed source code:
+      - the rows of the new and changed source files (file stamps) are replaced, one transaction per file
+      - the rows of the removed files are deleted
+      - the nodes of the unchanged files whose resolved attributes changed (e.g. the calls to
+        a procedure defined in a changed file) are updated in a last transaction
+      source_file_list defaults to the files of the nodes
+      Return the number of replaced files and of updated nodes
+      """
+      t1 = tnow()
+      print('\nUpdating the index: {:}'.format(self.db_path))
+
+      node_dict_list = [('callable',callable_dict)]
+      if module_dict is not None:
+         node_dict_list.append(('module',module_dict))
+
+      if source_file_list is None:
+         source_file_list = sorted({ node.filename for kind, node_dict in node_dict_list for node in node_dict.values() })
+
+      # Rows of the nodes per file
+      rows_per_file = { filename: [] for filename in source_file_list }
+      for kind, node_dict in node_dict_list:
+         for key, node in node_dict.items():
+            if node.filename in rows_per_file:
+               rows_per_file[node.filename].append((kind,get_node_rows(key,node)))
+
+      stored_stamp_dict = self.get_file_stamps()
+
+      for filename in stored_stamp_dict.keys() - rows_per_file.keys():
+         self.remove_file(filename)
+
+      nreplaced = 0
+      unchanged_file_set = set()
+      for filename, node_rows_list in rows_per_file.items():
+         stat = os.stat(os.path.join(path,filename))
+         stamp = (stat.st_mtime_ns, stat.st_size)
+
+         if stored_stamp_dict.get(filename) == stamp:
+            unchanged_file_set.add(filename)
+         else:
+            self.replace_file(filename,stamp,node_rows_list)
+            nreplaced += 1
+
+      #
+      # The unchanged files: only the nodes whose rows differ are rewritten
+      #
+      nupdated = 0
+      stored_dict = self.get_stored_node_rows(unchanged_file_set)
+      with self.connection:
+         file_id_dict = dict(self.connection.execute('SELECT path, id FROM files'))
+
+         for filename in unchanged_file_set:
+            for kind, node_rows in rows_per_file[filename]:
+               node_id, stored_rows = stored_dict.pop((filename,kind,node_rows[0][0]),(None,None))
+
+               if stored_rows != node_rows:
+                  if node_id is not None:
+                     self.connection.execute('DELETE FROM nodes WHERE id = ?',(node_id,))
+                  self.insert_node(file_id_dict[filename],kind,node_rows)
+                  nupdated += 1
+
+         # Nodes that are not in the analysis anymore (e.g. a key that changed)
+         for node_id, stored_rows in stored_dict.values():
+            self.connection.execute('DELETE FROM nodes WHERE id = ?',(node_id,))
+            nupdated += 1
+
+      print('Replaced files: {:}, updated nodes: {:}'.format(nreplaced,nupdated))
+      print('Done: {:.2f} s'.format(tnow() - t1))
+
+      return nreplaced, nupdated
+
+   #
+   # Queries
+   #
+   def find_node_keys(self,name,kind='callable'):
+      """
+      Keys of the nodes named name (a key, e.g. mod::name, or a plain name)
+      """
+      name = name.lower()
+      row_list = self.connection.execute('SELECT DISTINCT key FROM nodes WHERE kind = ? AND (key = ? OR name = ?) ORDER BY key',(kind,name,name)).fetchall()
+
+      if len(row_list) > 0:
+         return [ x[0] for x in row_list ]
+      else:
+         # External procedures (called but not defined in the source code)
+         return [name] if self.connection.execute('SELECT 1 FROM edges WHERE callee = ? LIMIT 1',(name,)).fetchone() else []
+
+   def get_callers(self,key_list,depth=1):
+      """
+      Nodes that call the nodes of key_list, up to depth levels: [(depth, key, filename, line)]
+      """
+      return self.connection.execute(f'''
+         WITH RECURSIVE callers(key, depth) AS (
+            SELECT column1, 0 FROM (VALUES {get_placeholders(key_list)})
+            UNION
+            SELECT nodes.key, callers.depth + 1 FROM callers
+               JOIN edges ON edges.callee = callers.key
+               JOIN nodes ON nodes.id = edges.caller_id
+               WHERE callers.depth < ? AND nodes.kind = 'callable'
+         )
+         SELECT MIN(callers.depth), callers.key, files.path, nodes.nfirst_line FROM callers
+            JOIN nodes ON nodes.key = callers.key AND nodes.kind = 'callable'
+            JOIN files ON files.id = nodes.file_id
+            WHERE callers.depth > 0
+            GROUP BY callers.key ORDER BY MIN(callers.depth), callers.key''',tuple(key_list)+(depth,)).fetchall()
+
+   def get_callees(self,key_list,depth=1):
+      """
+      Nodes called by the nodes of key_list, up to depth levels: [(depth, key, filename, line)]
+      (filename and line are None for the external procedures)
+      """
+      return self.connection.execute(f'''
+         WITH RECURSIVE callees(key, depth) AS (
+            SELECT column1, 0 FROM (VALUES {get_placeholders(key_list)})
+            UNION
+            SELECT edges.callee, callees.depth + 1 FROM callees
+               JOIN nodes ON nodes.key = callees.key AND nodes.kind = 'callable'
+               JOIN edges ON edges.caller_id = nodes.id
+               WHERE callees.depth < ?
+         )
+         SELECT MIN(callees.depth), callees.key, files.path, nodes.nfirst_line FROM callees
+            LEFT JOIN nodes ON nodes.key = callees.key AND nodes.kind = 'callable'
+            LEFT JOIN files ON files.id = nodes.file_id
+            WHERE callees.depth > 0
+            GROUP BY callees.key ORDER BY MIN(callees.depth), callees.key''',tuple(key_list)+(depth,)).fetchall()
+
+   def get_module_users(self,module):
+      """
+      Nodes that use a module: [(filename, kind, key)]
+      """
+      return self.connection.execute('''
+         SELECT DISTINCT files.path, nodes.kind, nodes.key FROM uses
+            JOIN nodes ON nodes.id = uses.node_id
+            JOIN files ON files.id = nodes.file_id
+            WHERE uses.module = ? ORDER BY files.path, nodes.key''',(module.lower(),)).fetchall()
+
+   def get_largest_nodes(self,sort_attrname='nlines',top=20):
+      """
+      Largest callables: [(key, type, filename, nfirst_line, value)]
+      """
+      if sort_attrname not in stat_attrname_list:
+         raise ValueError(f'Unknown attribute: {sort_attrname}')
+
+      return self.connection.execute(f'''
+         SELECT nodes.key, nodes.type, files.path, nodes.nfirst_line, nodes.{sort_attrname} FROM nodes
+            JOIN files ON files.id = nodes.file_id
+            WHERE nodes.kind = 'callable' AND nodes.{sort_attrname} IS NOT NULL
+            ORDER BY nodes.{sort_attrname} DESC, nodes.key LIMIT ?''',(top,)).fetchall()
+
+   def get_counts(self):
+      return { table: self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] \
+               for table in ['files','nodes','edges','uses','allocations'] }
+
+def get_placeholders(value_list):
+   """
+   Placeholders of a VALUES list with one column
+   """
+   return ','.join( '(?)' for x in value_list )
+
+def print_node_table(row_list):
+   for depth, key, filename, nline in row_list:
+      location = '{:}:{:}'.format(filename,nline) if filename is not None else 'external'
+      print('{:>3}  {:<40} {:}'.format(depth,key,location))
+
+def query_main(argv):
+   """
+   Query subcommand: answer the questions from the index database, without parsing
+   """
+   help_description = 'Query the call graph index (see --index-db).'
+
+   cmd_parser = argparse.ArgumentParser(prog='runparse.py query',description=help_description)
+   cmd_parser.add_argument('--db',help='Index database file.',type=str,required = False,default='fortrantree.db')
+
+   subparsers = cmd_parser.add_subparsers(dest='query',required=True)
+
+   callers_parser = subparsers.add_parser('callers',help='Callables that call a callable.')
+   callers_parser.add_argument('name',help='Name of the callable (or mod::name).')
+   callers_parser.add_argument('-d','--depth',help='Number of levels (transitive callers).',type=int,default=1)
+
+   callees_parser = subparsers.add_parser('callees',help='Callables called by a callable.')
+   callees_parser.add_argument('name',help='Name of the callable (or mod::name).')
+   callees_parser.add_argument('-d','--depth',help='Number of levels (transitive callees).',type=int,default=1)
+
+   uses_parser = subparsers.add_parser('uses',help='Files and nodes that use a module.')
+   uses_parser.add_argument('module',help='Name of the module.')
+
+   stats_parser = subparsers.add_parser('stats',help='Index statistics and largest callables.')
+   stats_parser.add_argument('--sort',help='Size attribute.',choices=stat_attrname_list[2:],default='nlines')
+   stats_parser.add_argument('--top',help='Number of callables.',type=int,default=20)
+
+   args = cmd_parser.parse_args(argv)
+
+   if not os.path.isfile(args.db):
+      sys.exit(f'Index database not found: {args.db} (create it with --index-db)')
+
+   index = CallGraphIndex(args.db)
+
+   if args.query in ['callers','callees']:
+      key_list = index.find_node_keys(args.name)
+      if len(key_list) == 0:
+         sys.exit(f'Unknown callable: {args.name}')
+
+      if args.query == 'callers':
+         row_list = index.get_callers(key_list,depth=args.depth)
+      else:
+         row_list = index.get_callees(key_list,depth=args.depth)
+
+      print_node_table(row_list)
+
+   elif args.query == 'uses':
+      for filename, kind, key in index.get_module_users(args.module):
+         print('{:<40} {:<8} {:}'.format(filename,kind,key))
+
+   elif args.query == 'stats':
+      print(', '.join( '{:}: {:}'.format(table,count) for table,count in index.get_counts().items() ))
+      print()
+      for key, ntype, filename, nline, value in index.get_largest_nodes(args.sort,top=args.top):
+         print('{:>7}  {:<40} {:<12} {:}:{:}'.format(value,key,ntype,filename,nline))
+
+   index.close()
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
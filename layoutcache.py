@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Persistent on-disk cache of the graphviz outputs (.svg, .dot, .png, .json) of the root nodes.
+The key of an entry is the hash of the final subgraph and of the graph parameters,
+so the layout is computed again only if the graph or its parameters changed.
+"""
+
+import os, sys, shutil, hashlib, importlib.metadata
+
+LAYOUT_CACHE_VERSION = 1
+
+def get_pygraphviz_version():
+   try:
+      return importlib.metadata.version('pygraphviz')
+   except importlib.metadata.PackageNotFoundError:
+      return 'unknown'
+
+class LayoutCache:
+   """
+   Cache directory with one folder per entry, containing the output files of a graph.
+   The modification time of a folder is the time of its last use: when the size of the cache
+   exceeds max_size (bytes), the least recently used entries are evicted (see evict).
+   No index file is shared, so that the render worker processes can use the cache concurrently.
+   """
+   def __init__(self,cache_dir,max_size=1024**3):
+      self.cache_dir = cache_dir
+      self.max_size = max_size
+      self.pygraphviz_version = get_pygraphviz_version()
+
+      self.hits   = 0
+      self.misses = 0
+
+      os.makedirs(self.cache_dir, exist_ok=True)
+
+   def get_key(self,graph_dict,root_node,graph_param_dict,output_ext_list,stub_dict=None,cycle_dict=None):
+      """
+      Hash of the subgraph {node: {successor: None}} (nodes and edges in their order, which changes the layout),
+      of the root node (the node attributes can depend on the depth), of the graph parameters,
+      of the output formats, of the stub nodes of a truncated graph and of the cycle nodes (their labels)
+      """
+      sha = hashlib.sha256()
+
+      header = '{:}|{:}|{:}|{:}'.format(LAYOUT_CACHE_VERSION,self.pygraphviz_version,root_node,','.join(output_ext_list))
+      sha.update(header.encode())
+      sha.update(repr(list(graph_param_dict.items())).encode())
+      sha.update(repr(list((stub_dict or {}).items())).encode())
+      sha.update(repr(list((cycle_dict or {}).items())).encode())
+
+      for node, successors in graph_dict.items():
+         sha.update('\n{:}:'.format(node).encode())
+         sha.update(','.join(successors).encode())
+
+      return sha.hexdigest()
+
+   def get_entry_path(self,key):
+      return os.path.join(self.cache_dir,key)
+
+   def load(self,key,output_path_list):
+      """
+      Copy the cached output files to output_path_list, return False if the entry is not in the cache
+      """
+      entry_path = self.get_entry_path(key)
+
+      cached_path_list = [ os.path.join(entry_path,'graph'+os.path.splitext(x)[1]) for x in output_path_list ]
+
+      if not all( os.path.isfile(x) for x in cached_path_list ):
+         self.misses += 1
+         return False
+
+      for cached_path, output_path in zip(cached_path_list,output_path_list):
+         shutil.copyfile(cached_path,output_path)
+
+      # Last use of the entry
+      os.utime(entry_path)
+
+      self.hits += 1
+      return True
+
+   def store(self,key,output_path_list):
+      """
+      Store the output files of a graph. The entry is written in a temporary folder
+      and renamed, so that a concurrent process never sees a partial entry.
+      """
+      entry_path = self.get_entry_path(key)
+      tmp_path = '{:}.tmp{:}'.format(entry_path,os.getpid())
+
+      shutil.rmtree(tmp_path,ignore_errors=True)
+      os.makedirs(tmp_path)
+
+      for output_path in output_path_list:
+         shutil.copyfile(output_path,os.path.join(tmp_path,'graph'+os.path.splitext(output_path)[1]))
+
+      try:
+         os.rename(tmp_path,entry_path)
+      except OSError:
+         # Stored by another process in the meantime
+         shutil.rmtree(tmp_path,ignore_errors=True)
+
+   def get_entry_size(self,entry_path):
+      return sum( x.stat().st_size for x in os.scandir(entry_path) if x.is_file() )
+
+   def evict(self):
+      """
+      Remove the least recently used entries until the size of the cache is below max_size
+      """
+      entry_list = []
+      for entry in os.scandir(self.cache_dir):
+         if entry.is_dir() and '.tmp' not in entry.name:
+            entry_list.append((entry.stat().st_mtime,self.get_entry_size(entry.path),entry.path))
+
+      total_size = sum( x[1] for x in entry_list )
+      nevicted = 0
+
+      for mtime, size, entry_path in sorted(entry_list):
+         if total_size <= self.max_size:
+            break
+
+         shutil.rmtree(entry_path,ignore_errors=True)
+         total_size -= size
+         nevicted += 1
+
+      return nevicted
+
+   def print_stats(self,nevicted=0):
+      print('Layout cache: {:} hits, {:} misses, {:} evicted ({:})'.format(self.hits,self.misses,nevicted,self.cache_dir))
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+Memory used by the extracted nodes of a source code folder: the compact representation
+(interned names, slotted variables and arrays) compared with the plain one
+(names not interned, __dict__ based variables and arrays)
+"""
+
+import sys, gc, time, pickle
+import argparse
+import tracemalloc
+import multiprocessing
+
+import runparse
+from parsetools import MyNode
+
+tnow = time.perf_counter
+
+class PlainObject:
+   """
+   __dict__ based copy of a slotted object (variable or array)
+   """
+   pass
+
+def copy_plain(value):
+   """
+   Copy of a value where the slotted objects are replaced by __dict__ based objects
+   """
+   if isinstance(value,(list,tuple)):
+      return type(value)(copy_plain(x) for x in value)
+
+   elif isinstance(value,dict):
+      return { key: copy_plain(x) for key,x in value.items() }
+
+   elif isinstance(value,MyNode):
+      for attrname, x in value.__dict__.items():
+         value.__dict__[attrname] = copy_plain(x)
+      return value
+
+   elif hasattr(value,'__slots__') and not isinstance(value,type):
+      plain_obj = PlainObject()
+      for attrname in value.__slots__:
+         setattr(plain_obj,attrname,getattr(value,attrname))
+      return plain_obj
+
+   return value
+
+def measure_retained(pickled_dicts,plain):
+   """
+   Size of the memory retained by the node dicts after unpickling (in a fresh process).
+   The nodes are pickled one by one (as they come from the worker processes or the parse cache),
+   so that the pickle memo does not share the strings between the nodes
+   """
+   if plain:
+      # Representation without the compaction: the names are not interned
+      MyNode.intern_names = lambda self: None
+
+   gc.collect()
+   tracemalloc.start()
+
+   node_dicts = [ { name: pickle.loads(x) for name, x in pickled_dict.items() } for pickled_dict in pickled_dicts ]
+
+   if plain:
+      node_dicts = copy_plain(node_dicts)
+
+   gc.collect()
+   size = tracemalloc.get_traced_memory()[0]
+   tracemalloc.stop()
+
+   return size
+
+def print_size(label,size,ref_size):
+   print('{:<8}: {:8.2f} MB ({:.0%})'.format(label,size/1024**2,size/ref_size))
+
+def main():
+
+   help_description = 'Measure the memory used by the extracted nodes (compact vs plain representation).'
+
+   cmd_parser = argparse.ArgumentParser(description=help_description)
+
+   cmd_parser.add_argument('-p','--path',help='Path to the source code',required=True)
+   cmd_parser.add_argument('--exclude-files',help='List of file to exclude from parsing',nargs='*',required = False,default=[])
+   cmd_parser.add_argument('-j','--jobs',help='Number of processes used to parse the source files.',type=int,required = False,default=1)
+   cmd_parser.add_argument('--engine',help='Parsing engine.',choices=['fparser','fast'],required = False,default='fparser')
+   cmd_parser.add_argument('--analysis',help='Analysis level.',choices=runparse.ANALYSIS_LEVELS,required = False,default='full')
+
+   args = cmd_parser.parse_args()
+
+   source_file_list = runparse.get_source_file_list(args.path,exclude_files=args.exclude_files)
+
+   node_dicts = runparse.create_node_dicts(args.path,source_file_list,with_modules=True,jobs=args.jobs,engine=args.engine,analysis=args.analysis)
+   nnodes = sum(len(x) for x in node_dicts)
+
+   pickled_dicts = [ { name: pickle.dumps(x,protocol=pickle.HIGHEST_PROTOCOL) for name, x in node_dict.items() } \
+                     for node_dict in node_dicts ]
+   del node_dicts
+
+   #
+   # Each measurement is done in a fresh process, so that the interned strings
+   # of this process are not shared with the measured nodes
+   #
+   t1 = tnow()
+   print('\nMeasuring the memory of {:} nodes'.format(nnodes))
+
+   context = multiprocessing.get_context('spawn')
+   with context.Pool(processes=1,maxtasksperchild=1) as pool:
+      compact_size = pool.apply(measure_retained,(pickled_dicts,False))
+      plain_size   = pool.apply(measure_retained,(pickled_dicts,True))
+
+   print('Done: {:.2f} s\n'.format(tnow() - t1))
+
+   print_size('plain',plain_size,plain_size)
+   print_size('compact',compact_size,plain_size)
+
+if __name__ == '__main__':
+   main()
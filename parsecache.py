@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+Persistent on-disk cache of the MyNode objects extracted from each source file.
+A file is parsed again only if its content (or the fparser version) changed.
+"""
+
+import os, sys, json, pickle, hashlib, array
+import importlib.metadata
+
+from parsetools import get_local_dict_per_file
+
+CACHE_VERSION = 4
+
+def get_fparser_version():
+   try:
+      return importlib.metadata.version('fparser')
+   except importlib.metadata.PackageNotFoundError:
+      return 'unknown'
+
+def get_types_signature(fparser_types_list):
+   """
+   String representation of the fparser types used for the extraction
+   """
+   return ';'.join( ','.join(t.__name__ for t in fparser_types) for fparser_types in fparser_types_list )
+
+class ParseCache:
+   """
+   Cache directory with one pickle file per source file and an index file.
+   The key of an entry is the hash of the file content, file name, fparser version,
+   engine, analysis level and fparser types used for the extraction.
+   If the files are preprocessed (see cpptools.Preprocessor), the preprocessed source and its line map
+   replace the file content, so the build configurations (macro sets) share the entries of the files
+   whose preprocessed source is the same.
+   """
+   index_filename = 'index.json'
+
+   def __init__(self,cache_dir,fparser_types_list,engine='fparser',analysis='full',preprocessor=None):
+      self.cache_dir = cache_dir
+      self.types_signature = engine+':'+analysis+':'+get_types_signature(fparser_types_list)
+      self.preprocessor = preprocessor
+
+      # The entries of each file are indexed per build configuration
+      self.index_signature = self.types_signature
+      if preprocessor is not None:
+         self.index_signature += '#' + hashlib.sha256(preprocessor.get_signature().encode()).hexdigest()[:16]
+      self.fparser_version = get_fparser_version()
+
+      self.hits   = 0
+      self.misses = 0
+
+      os.makedirs(self.cache_dir, exist_ok=True)
+      self.index = self.load_index()
+
+   def load_index(self):
+      index_path = os.path.join(self.cache_dir,self.index_filename)
+
+      if not os.path.isfile(index_path):
+         return {}
+
+      with open(index_path,'r') as f:
+         index = json.load(f)
+
+      if index.get('version') != CACHE_VERSION:
+         return {}
+
+      return index['entries']
+
+   def save_index(self):
+      index_path = os.path.join(self.cache_dir,self.index_filename)
+
+      with open(index_path,'w') as f:
+         json.dump({'version': CACHE_VERSION, 'entries': self.index}, f, indent=1)
+
+   def get_index_key(self,filepath):
+      return '{:}|{:}'.format(os.path.abspath(filepath),self.index_signature)
+
+   def get_key(self,filepath,filename):
+      """
+      Content hash key of a source file
+      """
+      sha = hashlib.sha256()
+
+      header = '{:}|{:}|{:}|{:}'.format(CACHE_VERSION,self.fparser_version,self.types_signature,filename)
+      sha.update(header.encode())
+
+      if self.preprocessor is not None:
+         text, line_map = self.preprocessor.preprocess(filepath)
+         sha.update(text.encode())
+         sha.update(array.array('i',line_map).tobytes())
+      else:
+         with open(filepath,'rb') as f:
+            sha.update(f.read())
+
+      return sha.hexdigest()
+
+   def get_entry_path(self,key):
+      return os.path.join(self.cache_dir,key+'.pkl')
+
+   def load(self,key,filepath):
+      """
+      Return the local_node_dict_list stored for the key, or None if it is not in the cache
+      """
+      entry_path = self.get_entry_path(key)
+
+      if not os.path.isfile(entry_path):
+         self.misses += 1
+         return None
+
+      try:
+         with open(entry_path,'rb') as f:
+            local_node_dict_list = pickle.load(f)
+      except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+         self.misses += 1
+         return None
+
+      self.hits += 1
+      self.index[self.get_index_key(filepath)] = key
+
+      return local_node_dict_list
+
+   def store(self,key,filepath,local_node_dict_list):
+      """
+      Store the local node dicts of a file, evict the previous entry of this file
+      """
+      index_key = self.get_index_key(filepath)
+      old_key = self.index.get(index_key)
+
+      tmp_path = self.get_entry_path(key)+'.tmp'
+      with open(tmp_path,'wb') as f:
+         pickle.dump(local_node_dict_list,f,protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_path,self.get_entry_path(key))
+
+      self.index[index_key] = key
+
+      if old_key is not None and old_key not in self.index.values():
+         os.remove(self.get_entry_path(old_key))
+
+   def evict_stale(self):
+      """
+      Remove the entries of the source files that do not exist anymore
+      and the pickle files that are not referenced by the index
+      """
+      for index_key in list(self.index.keys()):
+         filepath, index_signature = index_key.rsplit('|',1)
+         if index_signature == self.index_signature and not os.path.isfile(filepath):
+            del self.index[index_key]
+
+      referenced_keys = set(self.index.values())
+      for entry in os.listdir(self.cache_dir):
+         if entry.endswith('.pkl') and entry[:-len('.pkl')] not in referenced_keys:
+            os.remove(os.path.join(self.cache_dir,entry))
+
+   def print_stats(self):
+      print('Parse cache: {:} hits, {:} misses ({:})'.format(self.hits,self.misses,self.cache_dir))
+
+
+def get_local_dict_per_file_cached(path,source_file_list,fparser_types_list,cache_dir,jobs=1,engine='fparser',analysis='full',preprocessor=None,result_callback=None):
+   """
+   Same as parsetools.get_local_dict_per_file, but the files that did not change
+   since the previous run are taken from the cache
+   source_file_list can be an iterator, the missed files are then parsed as they come
+   result_callback is called for the files of the cache as they are loaded, then for the parsed files
+   """
+   parse_cache = ParseCache(cache_dir,fparser_types_list,engine=engine,analysis=analysis,preprocessor=preprocessor)
+
+   local_dict_per_file = {}
+   key_dict = {}
+
+   def iter_missed_files():
+      for filename in source_file_list:
+         filepath = os.path.join(path,filename)
+         key = parse_cache.get_key(filepath,filename)
+
+         local_node_dict_list = parse_cache.load(key,filepath)
+
+         if local_node_dict_list is None:
+            key_dict[filename] = key
+            yield filename
+         else:
+            local_dict_per_file[filename] = local_node_dict_list
+
+            if result_callback is not None:
+               result_callback(filename,local_node_dict_list)
+
+   if isinstance(source_file_list,list):
+      missed_file_list = list(iter_missed_files())
+   else:
+      missed_file_list = iter_missed_files()
+
+   if not isinstance(missed_file_list,list) or len(missed_file_list) > 0:
+      parsed_dict_per_file = get_local_dict_per_file(path,missed_file_list,fparser_types_list,jobs=jobs,engine=engine,analysis=analysis,preprocessor=preprocessor,result_callback=result_callback)
+
+      for filename, local_node_dict_list in parsed_dict_per_file.items():
+         parse_cache.store(key_dict[filename],os.path.join(path,filename),local_node_dict_list)
+
+      local_dict_per_file.update(parsed_dict_per_file)
+
+   parse_cache.evict_stale()
+   parse_cache.save_index()
+   parse_cache.print_stats()
+
+   return local_dict_per_file
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
@@ -5,15 +5,48 @@ Tools for the FORTRAN source code parsing
 """
 
 import os, sys, time, warnings
+import functools, multiprocessing
 
-from fparser.common.readfortran import FortranFileReader
-from fparser.two.utils import walk
+from fparser.common.readfortran import FortranFileReader, FortranStringReader
+from fparser.common.sourceinfo import get_source_info
+from fparser.two.utils import walk, Base, BlockBase
 
 from fparser.two.parser import ParserFactory
 from fparser.two import Fortran2003
 
+from cpptools import map_line
+
+try:
+   from fparser.two.symbol_table import SYMBOL_TABLES
+except ImportError:
+   # Older fparser versions do not have symbol tables
+   SYMBOL_TABLES = None
+
 tnow = time.time
 
+#
+# Analysis levels, each level includes the attributes of the previous ones:
+#   calls: call graph (calls, subroutines, functions, procedures)
+#   uses:  modules used by the callables
+#   full:  line statistics, declared variables and array allocations (HTML node info)
+#
+ANALYSIS_LEVELS = ['calls','uses','full']
+
+# Number of files of an iterator sorted together by size (see LargestFirstScheduler)
+SCHEDULE_BATCH_SIZE = 256
+
+def analysis_includes(analysis,attr_analysis):
+   """
+   True if the attributes of the attr_analysis level are computed in the analysis level
+   """
+   return ANALYSIS_LEVELS.index(attr_analysis) <= ANALYSIS_LEVELS.index(analysis)
+
+def keep_comments(analysis):
+   """
+   The comments are only needed for the line statistics
+   """
+   return analysis_includes(analysis,'full')
+
 def print_object_attributes(obj,show_hidden = False):
    print('\n'*2)
    for key,value in obj.__dict__.items():
@@ -26,6 +59,57 @@ def print_object_attributes(obj,show_hidden = False):
 
    return
 
+def create_f2008_parser():
+   """
+   Create the fparser F2008 parser. It can be reused for all the files of the source code.
+   """
+   return ParserFactory().create(std="f2008")
+
+def parse_file(filepath,f2008_parser=None,ignore_comments=False):
+   """
+   Parse a single FORTRAN file using fparser and return the parse tree
+   """
+   if f2008_parser is None:
+      f2008_parser = create_f2008_parser()
+
+   reader = FortranFileReader(filepath,ignore_comments=ignore_comments)
+
+   return f2008_parser(reader)
+
+def parse_preprocessed_file(filepath,preprocessor,f2008_parser=None,ignore_comments=False):
+   """
+   Preprocess a single FORTRAN file (see cpptools.Preprocessor), parse the output using fparser
+   and return the parse tree and the line map to the original file
+   """
+   if f2008_parser is None:
+      f2008_parser = create_f2008_parser()
+
+   text, line_map = preprocessor.preprocess(filepath)
+
+   # The source format (free or fixed) is the one of the original file
+   reader = FortranStringReader(text,include_dirs=[os.path.dirname(filepath) or '.'],ignore_comments=ignore_comments)
+   reader.set_format(get_source_info(filepath))
+
+   return f2008_parser(reader), line_map
+
+def print_progress_line(i,nfiles,filename,print_len,nfound=None):
+   """
+   Print the parsing progress on the same line, return the length of the printed message
+   If nfiles is None (files from an iterator), print the number of parsed files,
+   and the number of files found so far (nfound) if it is known
+   """
+   if nfiles is None and nfound is not None:
+      status_message = '  {:}/{:}+  {:}'.format(i+1, nfound, filename)
+   elif nfiles is None:
+      status_message = '  {:}  {:}'.format(i+1, filename)
+   else:
+      status_message = '  {:2.1%}  {:}'.format((i+1)/nfiles, filename)
+
+   print(' '*print_len, end='\r')
+   print(status_message, end='\r', flush=True)
+
+   return len(status_message)+1
+
 def get_parse_tree_dict(path,source_file_list,print_progress=True):
    """
    Parse all the files of the source code (from source_file_list) using fparser into parse_tree_dict
@@ -35,72 +119,426 @@ def get_parse_tree_dict(path,source_file_list,print_progress=True):
    print_len = 0
    print('Parsing the source code directory: {:}'.format(path))
    parse_tree_dict = {}
+   f2008_parser = create_f2008_parser()
    for i,filename in enumerate(source_file_list):
 
       filepath = os.path.join(path,filename)
 
-      reader = FortranFileReader(filepath,ignore_comments=False)
-      f2008_parser = ParserFactory().create(std="f2008")
-      parse_tree = f2008_parser(reader)
+      parse_tree_dict[filename] = parse_file(filepath,f2008_parser)
 
-      parse_tree_dict[filename] = parse_tree
-      
-      
       if print_progress:
-         status_message = '  {:2.1%}  {:}'.format((i+1)/(len(source_file_list)), filename)
-         
-         print(' '*print_len, end='\r')
-         print(status_message, end='\r', flush=True)
-
-         print_len = len(status_message)+1
+         print_len = print_progress_line(i,len(source_file_list),filename,print_len)
 
    if print_progress:
       print(' '*print_len, end='\r')
 
    print('\nDone: {:.2f} s'.format(tnow() - t1))
    return parse_tree_dict
- 
 
-def get_global_node_dict(parse_tree_dict,fparser_types,debug=False):
+
+#
+# Parallel parsing. fparser trees are slow to pickle, so the workers return
+# the extracted MyNode objects (detached from the tree) instead of the trees.
+#
+_worker_f2008_parser = None
+
+def init_parse_worker():
    """
-   Get the dictionary of all the nodes in the source code directory (global_node_dict)
+   Initialize a worker process of the pool with a long-lived parser
    """
-   global_node_dict = {}
-   for filename,parse_tree in parse_tree_dict.items():
+   global _worker_f2008_parser
+   if _worker_f2008_parser is None:
+      _worker_f2008_parser = create_f2008_parser()
+
+def extract_file(path,fparser_types_list,filename,f2008_parser=None,analysis='full',preprocessor=None):
+   """
+   Parse one file and return the local node dicts for each tuple of fparser_types_list.
+   The MyNode objects are detached from the parse tree and the tree is released,
+   so the memory is bounded by the largest file, not by the whole source code.
+   Only the attributes of the analysis level are computed (see ANALYSIS_LEVELS).
+   If preprocessor is specified (see cpptools.Preprocessor), the file is preprocessed before the parsing.
+   """
+   filepath = os.path.join(path,filename)
+   if preprocessor is not None:
+      parse_tree, line_map = parse_preprocessed_file(filepath,preprocessor,f2008_parser,ignore_comments=not keep_comments(analysis))
+   else:
+      parse_tree, line_map = parse_file(filepath,f2008_parser,ignore_comments=not keep_comments(analysis)), None
+
+   context = ParseTreeContext(line_map=line_map)
+
+   local_node_dict_list = []
+   for fparser_types in fparser_types_list:
+      local_node_dict = get_local_node_dict(parse_tree,filename,fparser_types,context=context)
+
+      for mynode in local_node_dict.values():
+         mynode.detach(analysis)
+
+      local_node_dict_list.append(local_node_dict)
+
+   release_parse_tree()
+
+   return filename, local_node_dict_list
+
+def release_parse_tree():
+   """
+   fparser keeps a symbol table per scoping unit, which references the parse tree nodes.
+   Clear them so that the tree of the file can be freed.
+   """
+   if SYMBOL_TABLES is not None:
+      SYMBOL_TABLES.clear()
+
+def parse_and_extract_file(path,fparser_types_list,filename,analysis='full',preprocessor=None):
+   """
+   Worker function: parse one file with the parser of the worker process
+   """
+   return extract_file(path,fparser_types_list,filename,_worker_f2008_parser,analysis=analysis,preprocessor=preprocessor)
+
+class LargestFirstScheduler:
+   """
+   Files of source_file_list for the process pool, the largest files first.
+   A list is sorted at once. The files of an iterator are read in batches of batch_size,
+   each batch is sorted, so the parsing still starts before the iterator (directory walk) is exhausted.
+   nfound is the number of files read so far, nfiles is the total once the iterator is exhausted.
+   """
+   def __init__(self,path,source_file_list,batch_size=SCHEDULE_BATCH_SIZE):
+      self.path = path
+      self.source_file_list = source_file_list
+      self.batch_size = batch_size
+
+      self.nfound = 0
+      self.nfiles = len(source_file_list) if isinstance(source_file_list,list) else None
+
+   def sort_batch(self,batch):
+      return sorted(batch, key = lambda x: os.path.getsize(os.path.join(self.path,x)), reverse=True)
+
+   def __iter__(self):
+      if isinstance(self.source_file_list,list):
+         self.nfound = self.nfiles
+         yield from self.sort_batch(self.source_file_list)
+         return
+
+      batch = []
+      for filename in self.source_file_list:
+         batch.append(filename)
+         self.nfound += 1
+
+         if len(batch) == self.batch_size:
+            yield from self.sort_batch(batch)
+            batch = []
+
+      self.nfiles = self.nfound
+      yield from self.sort_batch(batch)
 
-      node_list = walk(parse_tree, fparser_types, debug=False)
+def get_local_dict_per_file(path,source_file_list,fparser_types_list,jobs=1,print_progress=True,engine='fparser',analysis='full',preprocessor=None,result_callback=None):
+   """
+   Parse the files of source_file_list and return a dict {filename: local_node_dict_list}.
+   If jobs > 1, the files are parsed in a pool of jobs processes, the largest files are scheduled first.
+   source_file_list can also be an iterator, the files are then parsed as they come
+   (with jobs > 1, the largest first in each batch of files, see LargestFirstScheduler).
+   engine is 'fparser' (full parse tree) or 'fast' (line-oriented scan, see fastscan.py)
+   analysis is one of ANALYSIS_LEVELS
+   preprocessor (see cpptools.Preprocessor) is applied to the files before the parsing, if specified
+   result_callback(filename, local_node_dict_list) is called as soon as each file is parsed, if specified
+   (with jobs > 1, in the order in which the files are done, not in the order of source_file_list)
+   """
+   t1 = tnow()
+   print_len = 0
+   local_dict_per_file = {}
+
+   if engine == 'fast':
+      import fastscan
+      worker_func = functools.partial(fastscan.extract_file_fast,path,fparser_types_list,analysis=analysis,preprocessor=preprocessor)
+      initializer = None
+   elif engine == 'fparser':
+      worker_func = functools.partial(parse_and_extract_file,path,fparser_types_list,analysis=analysis,preprocessor=preprocessor)
+      initializer = init_parse_worker
+   else:
+      raise ValueError(f'Unknown engine: {engine}')
+
+   nfiles = len(source_file_list) if isinstance(source_file_list,list) else None
+
+   if jobs > 1:
+      print('Parsing the source code directory: {:} ({:} processes)'.format(path,jobs))
+
+      # Largest files first, so that no single file holds up the end of the run.
+      # An iterator is consumed by the pool as the files come
+      scheduler = LargestFirstScheduler(path,source_file_list)
+
+      with multiprocessing.Pool(processes=jobs,initializer=initializer) as pool:
+         result_iter = pool.imap_unordered(worker_func,scheduler,chunksize=1)
+
+         for i,(filename,local_node_dict_list) in enumerate(result_iter):
+            local_dict_per_file[filename] = local_node_dict_list
+
+            if result_callback is not None:
+               result_callback(filename,local_node_dict_list)
+
+            if print_progress:
+               print_len = print_progress_line(i,scheduler.nfiles,filename,print_len,nfound=scheduler.nfound)
+
+   else:
+      print('Parsing the source code directory: {:}'.format(path))
+
+      # The parser of the main process is created once and reused for all the files
+      if initializer is not None:
+         initializer()
+
+      for i,filename in enumerate(source_file_list):
+         filename, local_node_dict_list = worker_func(filename)
+         local_dict_per_file[filename] = local_node_dict_list
+
+         if result_callback is not None:
+            result_callback(filename,local_node_dict_list)
+
+         if print_progress:
+            print_len = print_progress_line(i,nfiles,filename,print_len)
+
+   if print_progress:
+      print(' '*print_len, end='\r')
+
+   print('\nDone: {:.2f} s'.format(tnow() - t1))
+
+   return local_dict_per_file
+
+def merge_local_dict_per_file(source_file_list,local_dict_per_file,ntypes):
+   """
+   Merge the local node dicts in the order of source_file_list (as in get_global_node_dict)
+   and return the list of ntypes global node dicts
+   """
+   global_node_dict_list = []
+   for itype in range(ntypes):
+      global_node_dict = {}
+      for filename in source_file_list:
+         merge_node_dict(global_node_dict,local_dict_per_file[filename][itype])
+
+      global_node_dict_list.append(global_node_dict)
+
+   return global_node_dict_list
+
+def get_local_node_dict(parse_tree,filename,fparser_types,debug=False,context=None):
+   """
+   Get the dictionary of the nodes of a single file (local_node_dict)
+   The keys are the qualified names (see MyNode.get_qualified_name), so that the procedures
+   with the same name in different scopes are kept
+   """
+   if context is None:
+      context = ParseTreeContext()
+
+   node_list = walk(parse_tree, fparser_types, debug=False)
 
-      local_node_dict = {}
-      for node in node_list:
-         mynode = MyClassFactory(node,filename)
-         local_node_dict[mynode.name.lower()] = mynode
+   local_node_dict = {}
+   for node in node_list:
+      mynode = MyClassFactory(node,filename,context=context)
+      qualified_name = mynode.get_qualified_name()
 
-         if debug:
-            print(mynode.name)
+      # The implementation of a procedure has priority over its interface body
+      if qualified_name in local_node_dict.keys() and mynode.interface_body:
+         continue
 
-      keys_intersection = local_node_dict.keys() & global_node_dict.keys()
+      local_node_dict[qualified_name] = mynode
 
-      if len(keys_intersection) > 0:
-         warn_message = 'Non-zero intersection between local_node_dict and global_node_dict: {:}'.format(keys_intersection)
-         warnings.warn(warn_message)
+      if debug:
+         print(mynode.name)
 
-      global_node_dict = global_node_dict | local_node_dict
+   return local_node_dict
+
+def merge_node_dict(global_node_dict,local_node_dict):
+   """
+   Update global_node_dict with local_node_dict in place, warn if the keys intersect
+   """
+   keys_intersection = local_node_dict.keys() & global_node_dict.keys()
+
+   if len(keys_intersection) > 0:
+      warn_message = 'Non-zero intersection between local_node_dict and global_node_dict: {:}'.format(keys_intersection)
+      warnings.warn(warn_message)
+
+   global_node_dict.update(local_node_dict)
+
+def get_global_node_dict(parse_tree_dict,fparser_types,debug=False):
+   """
+   Get the dictionary of all the nodes in the source code directory (global_node_dict)
+   """
+   global_node_dict = {}
+   for filename,parse_tree in parse_tree_dict.items():
+
+      local_node_dict = get_local_node_dict(parse_tree,filename,fparser_types,debug=debug)
+
+      merge_node_dict(global_node_dict,local_node_dict)
 
    return global_node_dict
    
 
-def MyClassFactory(node, filename):
+def MyClassFactory(node, filename, context=None):
    """
    Return a subclass of MyNode or MyNode depending on the fparser type
    """
+   return get_node_class(type(node))(node,filename,context=context)
 
+def get_node_class(fparser_type):
+   """
+   Return the subclass of MyNode (or MyNode) that supports the fparser type
+   """
    for subclass in MyNode.get_all_subclasses():
       if hasattr(subclass,'supported_fparser_types'):
-         if type(node) in subclass.supported_fparser_types():
-            return subclass(node,filename)
+         if fparser_type in subclass.supported_fparser_types():
+            return subclass
+
+   warnings.warn('Type {:} is not supported by MyNode subclasses, assigning the MyNode class (base)'.format(fparser_type))
+   return MyNode
+
+
+#
+# Single pass over a subtree: the nodes are dispatched into the lists of all the
+# collected types at once, instead of walking the same subtree once per type.
+#
+_dispatch_cache = {}
+
+def get_matched_types(node_type,collected_types):
+   """
+   Return the types of collected_types that node_type is an instance of (cached per class)
+   """
+   key = (node_type,collected_types)
+   if key not in _dispatch_cache:
+      _dispatch_cache[key] = [t for t in collected_types if issubclass(node_type,t)]
+
+   return _dispatch_cache[key]
+
+def collect_subtree(root,collected_types):
+   """
+   Walk the subtree of root once (in the same order as fparser walk) and return a dict
+   {type: [(node, internal), ...]} for each type of collected_types.
+   internal is True if the node is inside a 'contains' block (Internal_Subprogram_Part) of the subtree.
+   """
+   collected = {t: [] for t in collected_types}
+
+   stack = [(root,False)]
+   while stack:
+      node, internal = stack.pop()
+
+      if isinstance(node,Base):
+         for t in get_matched_types(type(node),collected_types):
+            collected[t].append((node,internal))
+
+         children = node.children
+         if type(node) is Fortran2003.Internal_Subprogram_Part:
+            internal = True
+
+      elif isinstance(node,(list,tuple)):
+         children = node
+
+      else:
+         continue
+
+      for child in reversed(children):
+         if child is not None and not isinstance(child,str):
+            stack.append((child,internal))
+
+   return collected
+
+def get_sorted_name_list(node_list):
+   return sorted(list(set( MyNode.get_node_name(x) for x in node_list )))
+
+class AncestorIndex:
+   """
+   Index of the ancestors of all the nodes of a parse tree, built with a single walk:
+   for each node, its enclosing program unit, whether it is inside a 'contains' block
+   of a subroutine (Internal_Subprogram_Part) and its enclosing module.
+   """
+   unit_types = (Fortran2003.Main_Program, Fortran2003.Module,
+                 Fortran2003.Subroutine_Subprogram, Fortran2003.Function_Subprogram,
+                 Fortran2003.Subroutine_Body, Fortran2003.Function_Body, Fortran2003.Interface_Block)
+
+   def __init__(self,root):
+      # {id(node): (unit, internal, module)}, the node itself is not one of its ancestors
+      self.record_dict = {}
+
+      stack = [(root,None,False,None)]
+      while stack:
+         node, unit, internal, module = stack.pop()
+
+         if isinstance(node,Base):
+            self.record_dict[id(node)] = (unit,internal,module)
+
+            if type(node) is Fortran2003.Internal_Subprogram_Part:
+               internal = True
+            elif type(node) is Fortran2003.Module:
+               module = node
+
+            if isinstance(node,self.unit_types):
+               unit = node
+
+            children = node.children
+
+         elif isinstance(node,(list,tuple)):
+            children = node
+
+         else:
+            continue
+
+         for child in children:
+            if child is not None and not isinstance(child,str):
+               stack.append((child,unit,internal,module))
 
-   warnings.warn('Type {:} is not supported by MyNode subclasses, assigning the MyNode class (base)'.format(type(node)))
-   return MyNode(node,filename)
+   def get_unit(self,node):
+      return self.record_dict[id(node)][0]
+
+   def is_internal(self,node):
+      return self.record_dict[id(node)][1]
+
+   def get_module(self,node):
+      return self.record_dict[id(node)][2]
+
+# Program units that define a scope for the procedures they contain
+scoping_unit_types = (Fortran2003.Main_Program, Fortran2003.Module,
+                      Fortran2003.Subroutine_Subprogram, Fortran2003.Function_Subprogram)
+
+def get_unit_name(unit):
+   """
+   Name of a program unit, from its first statement (e.g. Module_Stmt)
+   """
+   for item in unit.content:
+      if isinstance(item,(Fortran2003.Module_Stmt, Fortran2003.Program_Stmt,
+                          Fortran2003.Subroutine_Stmt, Fortran2003.Function_Stmt)):
+         return MyNode.get_node_name(item)
+
+   return ''
+
+class ParseTreeContext:
+   """
+   Data shared by all the MyNode objects extracted from the same parse tree
+   """
+   def __init__(self,line_map=None):
+      # Modules used in each module: {id(module node): list of names}
+      self.module_uses_dict = {}
+
+      # Line of the original file for each line of the preprocessed source (None if not preprocessed)
+      self.line_map = line_map
+
+      # Built on the first request (see get_ancestor_index)
+      self.ancestor_index = None
+
+   def get_ancestor_index(self,node):
+      """
+      Ancestor index of the parse tree of node
+      """
+      if self.ancestor_index is None:
+         root = node
+         while getattr(root,'parent',None) is not None:
+            root = root.parent
+         self.ancestor_index = AncestorIndex(root)
+
+      return self.ancestor_index
+
+   def get_module_uses(self,module):
+      """
+      List of the modules used anywhere in a module, computed once per module
+      """
+      key = id(module)
+      if key not in self.module_uses_dict:
+         use_list = collect_subtree(module,(Fortran2003.Use_Stmt,))[Fortran2003.Use_Stmt]
+         self.module_uses_dict[key] = get_sorted_name_list(x for x,internal in use_list)
+
+      return list(self.module_uses_dict[key])
 
 
 class MyNode:
@@ -109,47 +547,290 @@ class MyNode:
    calls are any objects belonging to Fortran2003.Call_Stmt (Subroutine,Interface)
    functions can be added to the self.calls attribute, once the all function names are known
    """
-   def __init__(self,node,filename):
+   # fparser types collected in the single pass over the subtree of the node
+   collected_types = (Fortran2003.Subroutine_Stmt, Fortran2003.Function_Stmt)
+
+   # Attributes that are lists of names (see intern_names)
+   name_list_attrs = ['uses','calls','arrays_or_funcs','arrays','subroutines','functions','procedures']
+
+   # Attributes computed on first access and then memoised:
+   # {attrname: (analysis level, name of the method that sets the attribute)}
+   lazy_attr_dict = {
+      'nfirst_line'    : ('full','set_line_statistics'),
+      'nlast_line'     : ('full','set_line_statistics'),
+      'nlines'         : ('full','set_line_statistics'),
+      'ncode_lines'    : ('full','set_line_statistics'),
+      'ncomment_lines' : ('full','set_line_statistics'),
+   }
+
+   def __init__(self,node,filename,context=None):
+      if context is None:
+         context = ParseTreeContext()
+
       self._node    = node
       self.fparser_type = type(node)
       self.type = self.interprete_fparser_type(self.fparser_type)
       self.filename = filename
+      # All the attributes can be computed as long as the node is attached to the parse tree
+      self.analysis = 'full'
       self.name     = self.get_node_name(node)
       self.parent_types  = self.get_parents(node)
-      self.uses     = None
+      self.scope    = self.get_scope(context)
+      self.interface_body = type(node.parent) in [Fortran2003.Subroutine_Body, Fortran2003.Function_Body]
+      if 'uses' not in self.lazy_attr_dict:
+         self.uses  = None
       self.calls    = None
       self.arrays_or_funcs  = None
       
+      # Single pass over the subtree of the node, the collected nodes are
+      # kept for the lazy attributes until the node is detached
+      self._collected = collect_subtree(self._node.parent,self.collected_types)
+      self._context   = context
+
       # Implemented subroutine abd functions inside the node
-      self.subroutines   = self.get_type_list( (Fortran2003.Subroutine_Stmt) )
-      self.functions     = self.get_type_list( (Fortran2003.Function_Stmt) )
-      
-      # Line statistics
-      self.nfirst_line, self.nlines = self.get_line_numbers()
+      self.subroutines   = self.get_collected_name_list(self._collected[Fortran2003.Subroutine_Stmt])
+      self.functions     = self.get_collected_name_list(self._collected[Fortran2003.Function_Stmt])
 
-   def get_line_numbers(self):
-      
-      if self._node.parent.content[0] is not None:
-         start = self._node.parent.content[0]
+      self.set_collected_attrs(self._collected,context)
+
+   def set_collected_attrs(self,collected,context):
+      """
+      Set the attributes of the subclasses from the collected nodes (see collect_subtree)
+      """
+      pass
+
+   def __getattr__(self,attrname):
+      """
+      Compute a lazy attribute (see lazy_attr_dict) on its first access
+      """
+      lazy_attr = type(self).lazy_attr_dict.get(attrname)
+
+      if lazy_attr is None or self.__dict__.get('_node') is None:
+         raise AttributeError(f"'{type(self).__name__}' object has no attribute '{attrname}'")
+
+      getattr(self,lazy_attr[1])()
+
+      return self.__dict__[attrname]
+
+   def set_analysis_level(self,analysis):
+      """
+      Compute the lazy attributes of the analysis level, set the others to None
+      """
+      for attrname, (attr_analysis, setter_name) in self.lazy_attr_dict.items():
+         if analysis_includes(analysis,attr_analysis):
+            getattr(self,attrname)
+         else:
+            setattr(self,attrname,None)
+
+      self.analysis = analysis
+
+      self.intern_names()
+
+   def set_line_statistics(self):
+      self.__dict__.update(self.get_line_statistics())
+
+   @classmethod
+   def from_attrs(cls,attr_dict):
+      """
+      Create a node without the fparser node (e.g. for the fast engine), 
+      all the attributes are taken from attr_dict
+      """
+      obj = cls.__new__(cls)
+      obj._node = None
+      obj.__dict__.update(attr_dict)
+      return obj
+
+   def detach(self,analysis='full'):
+      """
+      Drop the reference to the fparser node, so that the object can be pickled
+      and the parse tree can be freed. The lazy attributes of the analysis level
+      are computed before.
+      """
+      self.set_analysis_level(analysis)
+
+      self._node = None
+      self._collected = None
+      self._context = None
+
+   def __getstate__(self):
+      """
+      The fparser node and the parse tree data are never pickled
+      """
+      state = self.__dict__.copy()
+      state['_node'] = None
+      state['_collected'] = None
+      state['_context'] = None
+      return state
+
+   def __setstate__(self,state):
+      """
+      The names are interned again after unpickling (parse cache, worker processes, snapshot)
+      """
+      self.__dict__.update(state)
+      self.intern_names()
+
+   def intern_names(self):
+      """
+      Intern the names stored in the node, so that a routine, module or type name is a single
+      string object shared by all the nodes instead of a copy in every list where it appears
+      """
+      for attrname in ['name','filename','type','analysis']:
+         value = self.__dict__.get(attrname)
+         if isinstance(value,str):
+            self.__dict__[attrname] = sys.intern(value)
+
+      scope = self.__dict__.get('scope')
+      if scope is not None:
+         self.scope = tuple(intern_name_list(scope))
+
+      for attrname in self.name_list_attrs:
+         value = self.__dict__.get(attrname)
+         if value is not None:
+            self.__dict__[attrname] = intern_name_list(value)
+
+      var_dict = self.__dict__.get('var_dict')
+      if var_dict is not None:
+         for var in var_dict.values():
+            var.intern_names()
+         self.var_dict = { sys.intern(name): var for name, var in var_dict.items() }
+
+      for attrname in ['alloc','dealloc','alloc_wo_dealloc','dealloc_wo_alloc']:
+         for myarray in self.__dict__.get(attrname) or []:
+            myarray.intern_names()
+
+   def get_line_statistics(self):
+      """
+      Line statistics of the program unit, from the spans of the reader items (statements and comments)
+      in a single pass over the blocks of the unit:
+        nfirst_line, nlast_line: first line (including the comments before the unit) and last line
+        nlines: number of items (statements, comments and blank lines) minus one
+        ncode_lines: number of lines with a statement (continuation lines included)
+        ncomment_lines: number of lines with a comment only
+      """
+      unit = self._node.parent
+
+      if unit.content[0] is not None:
+         start = unit.content[0]
       else:
-         start = self._node.parent.content[1]
-      
-      nfirst_line = start.item.span[0]
-      nlines      = self._node.parent.tostr().count('\n')
-      
-      return nfirst_line, nlines
+         start = unit.content[1]
+
+      nitems = 0
+      nlast_line = start.item.span[1]
+      code_line_set = set()
+      comment_line_set = set()
+
+      block_stack = [unit]
+      while block_stack:
+         block = block_stack.pop()
+
+         for item in block.content:
+            if isinstance(item,BlockBase):
+               block_stack.append(item)
+               continue
+
+            if item is None:
+               continue
+
+            nitems += 1
+
+            if getattr(item,'item',None) is None:
+               continue
+
+            first_line, last_line = item.item.span
+            nlast_line = max(nlast_line,last_line)
+
+            if isinstance(item,Fortran2003.Comment):
+               if item.items[0].strip() != '':
+                  comment_line_set.add(first_line)
+            else:
+               code_line_set.update(range(first_line,last_line+1))
+
+      # Lines of the original file if the source was preprocessed
+      line_map = self._context.line_map if self._context is not None else None
+      if line_map is not None:
+         code_line_set = { map_line(line_map,x) for x in code_line_set }
+         comment_line_set = { map_line(line_map,x) for x in comment_line_set }
+
+      return {
+         'nfirst_line'    : map_line(line_map,start.item.span[0]),
+         'nlast_line'     : map_line(line_map,nlast_line),
+         'nlines'         : nitems - 1,
+         'ncode_lines'    : len(code_line_set),
+         'ncomment_lines' : len(comment_line_set - code_line_set),
+      }
+
+   def get_scope(self,context):
+      """
+      Lower case names of the enclosing program units (module, program, host procedure), outermost first.
+      An interface body declares an external procedure, its scope is empty.
+      """
+      ancestor_index = context.get_ancestor_index(self._node)
+
+      scope = []
+      unit = ancestor_index.get_unit(self._node.parent)
+      while unit is not None:
+         if type(unit) is Fortran2003.Interface_Block:
+            return ()
+
+         if isinstance(unit,scoping_unit_types):
+            scope.append(get_unit_name(unit).lower())
+
+         unit = ancestor_index.get_unit(unit)
+
+      return tuple(reversed(scope))
+
+   def get_qualified_name(self):
+      """
+      Lower case name with the scope, e.g. module::name (see get_scope)
+      """
+      return '::'.join(self.scope + (self.name.lower(),))
 
-   def get_uses(self,include_from_module=True):
+   def get_uses(self,include_from_module=True,collected=None,context=None):
       """
       Get the list of modules used by a node
       By default, if a node is inside a module, the modules used by this one are accounted
+      If collected and context are given, the collected Use_Stmt and the module uses of the context are used
       """
+      if context is not None:
+         module = context.get_ancestor_index(self._node).get_module(self._node)
+
+         if include_from_module and module is not None:
+            return context.get_module_uses(module)
+
+         if collected is not None:
+            return self.get_collected_name_list(collected[Fortran2003.Use_Stmt])
+
       root = None
       if include_from_module and Fortran2003.Module in self.parent_types:
          root = [ parent for parent in self.get_parents(self._node,obj=True) if type(parent) == Fortran2003.Module ][0]
       
       return self.get_type_list( (Fortran2003.Use_Stmt), root = root)
 
+   def is_internal(self,context=None):
+      """
+      True if the node is inside the 'contains' block of a subroutine (Internal_Subprogram_Part)
+      """
+      if context is not None:
+         return context.get_ancestor_index(self._node).is_internal(self._node)
+      else:
+         return Fortran2003.Internal_Subprogram_Part in self.parent_types
+
+   def get_collected_obj_list(self, collected_list, non_internal=True, context=None):
+      """
+      Return the list of the collected nodes (except the node itself)
+      If non_internal is True, the same rules as in get_non_internal_type_list apply
+      """
+      if non_internal and not self.is_internal(context):
+         return [x for x,internal in collected_list if not internal and x is not self._node]
+      else:
+         return [x for x,internal in collected_list if x is not self._node]
+
+   def get_collected_name_list(self, collected_list, non_internal=False, context=None):
+      """
+      Return the sorted list of the names of the collected nodes (except the node itself)
+      """
+      return get_sorted_name_list(self.get_collected_obj_list(collected_list,non_internal=non_internal,context=context))
+
    def get_type_list(self, types, root = None):
       """
       Returns a list of all the childs if the type of child matches the types from input
@@ -165,21 +846,25 @@ class MyNode:
 
       return sorted(list(set(type_name_list)))
    
-   def get_non_internal_type_list(self, types, obj=False):
+   def get_non_internal_type_list(self, types, obj=False, context=None):
       """
       Returns a list of the childs if the type of child matches the types from input
       Children inside the 'contains' block of a subroutine (Internal_Subprogram_Part) will be excluded 
       If the node itself is a part of contains block of a subroutine, then return all the calls
       If obj is True, return a list of objects
       """
+      if context is None:
+         context = ParseTreeContext()
+      ancestor_index = context.get_ancestor_index(self._node)
+
       type_list = walk(self._node.parent, types=types, debug=False)
       if self in type_list:
          type_list.remove(self)
 
       # Check if the node itself is a part of the contains block
-      if Fortran2003.Internal_Subprogram_Part not in self.get_parents(self._node):
+      if not ancestor_index.is_internal(self._node):
          non_internal_type_list = \
-            [x for x in type_list if Fortran2003.Internal_Subprogram_Part not in self.get_parents(x)]
+            [x for x in type_list if not ancestor_index.is_internal(x)]
 
       else:
          non_internal_type_list = type_list
@@ -224,28 +909,21 @@ class MyNode:
 
       raise ValueError('No attribute of the Fortran2003.Name type in {:}'.format(node))
 
-   @staticmethod
-   def get_parents_generator(node):
-      if hasattr(node,'parent'):
-         yield type(node.parent)
-         yield from MyNode.get_parents_generator(node.parent)
-   
-   @staticmethod
-   def get_parents_obj_generator(node):
-      if hasattr(node,'parent'):
-         yield node.parent
-         yield from MyNode.get_parents_obj_generator(node.parent)
-
    @staticmethod
    def get_parents(node,obj=False):
       """
       Return a list of parent types (if obj == False) or
       Return a list of parent objects (if obj == True)
       """
+      parent_list = []
+      while hasattr(node,'parent'):
+         node = node.parent
+         parent_list.append(node)
+
       if obj:
-         return list(MyNode.get_parents_obj_generator(node))
+         return parent_list
       else:
-         return list(MyNode.get_parents_generator(node))
+         return [type(x) for x in parent_list]
 
 
 def check_fparser_type(fparser_object,fparser_types):
@@ -257,15 +935,29 @@ def check_fparser_type(fparser_object,fparser_types):
       raise TypeError('fparser type of {:} is {:} which is not expected. Expected fparser types are: {:}'.format(fparser_object,type(fparser_object),' '.join(map(str,fparser_types))))
 
 
+def intern_name_list(name_list):
+   """
+   Return the list with the interned strings
+   """
+   return [ sys.intern(x) if isinstance(x,str) else x for x in name_list ]
+
 class MyFortranVariable():
    """
    Fortran variable (any type, any shape), taken from the declaration statement
    """
+   # There is one instance per declared variable, no __dict__
+   __slots__ = ('name','ftype','shape_list')
+
    def __init__(self,name=None,ftype=None):
       self.name = name
       self.ftype = ftype
       self.shape_list = None
 
+   def intern_names(self):
+      self.name, self.ftype = intern_name_list([self.name, self.ftype])
+      if self.shape_list is not None:
+         self.shape_list = intern_name_list(self.shape_list)
+
    def __repr__(self):
       if self.shape_list is None:
          return "({:}, {:})".format(str(self.name),str(self.ftype))
@@ -277,6 +969,8 @@ class MyFortranArray():
    """
    Fortran array
    """
+   __slots__ = ('name','shape_list','ftype')
+
    def __init__(self):
       self.name  = None
       self.shape_list = None
@@ -284,6 +978,11 @@ class MyFortranArray():
       # Type of the array (complex, real, etc.)
       self.ftype = None
 
+   def intern_names(self):
+      self.name, self.ftype = intern_name_list([self.name, self.ftype])
+      if self.shape_list is not None:
+         self.shape_list = intern_name_list(self.shape_list)
+
    def __str__(self):
       return str(self.name)
    
@@ -298,22 +997,40 @@ class MySubrOrFunc(MyNode):
    """
    Subroutine or Function
    """
-   def __init__(self,node,filename):
-      super().__init__(node,filename)
-      self.uses   = self.get_uses()
-      self.calls  = self.get_non_internal_type_list( (Fortran2003.Call_Stmt) )
+   collected_types = MyNode.collected_types + \
+      (Fortran2003.Use_Stmt, Fortran2003.Call_Stmt, Fortran2003.Part_Ref,
+       Fortran2003.Type_Declaration_Stmt, Fortran2003.Allocation, Fortran2003.Deallocate_Stmt)
+
+   lazy_attr_dict = MyNode.lazy_attr_dict | {
+      'uses'             : ('uses','set_uses'),
+      'var_dict'         : ('full','set_var_dict'),
+      'alloc'            : ('full','set_allocations'),
+      'dealloc'          : ('full','set_allocations'),
+      'alloc_wo_dealloc' : ('full','set_allocations'),
+      'dealloc_wo_alloc' : ('full','set_allocations'),
+   }
+
+   def set_collected_attrs(self,collected,context):
+      self.calls  = self.get_collected_name_list(collected[Fortran2003.Call_Stmt],non_internal=True,context=context)
 
       self.arrays = None
-      self.arrays_or_funcs  = self.get_non_internal_type_list( (Fortran2003.Part_Ref) )
-      
-      self.var_dict = self.get_var_dict()
+      self.arrays_or_funcs  = self.get_collected_name_list(collected[Fortran2003.Part_Ref],non_internal=True,context=context)
 
-      self.alloc  = self.get_alloc()
-      self.dealloc = self.get_dealloc()
+   def set_uses(self):
+      self.uses = self.get_uses(collected=self._collected,context=self._context)
+
+   def set_var_dict(self):
+      decl_stmt_list = self.get_collected_obj_list(self._collected[Fortran2003.Type_Declaration_Stmt],context=self._context)
+      self.var_dict = self.get_var_dict(decl_stmt_list)
+
+   def set_allocations(self):
+      collected, context = self._collected, self._context
+
+      self.alloc  = self.get_alloc(self.get_collected_obj_list(collected[Fortran2003.Allocation],context=context))
+      self.dealloc = self.get_dealloc(self.get_collected_obj_list(collected[Fortran2003.Deallocate_Stmt],context=context))
       
       self.alloc_wo_dealloc = self.get_alloc_wo_dealloc()
       self.dealloc_wo_alloc = self.get_dealloc_wo_alloc()
-      
 
    @staticmethod
    def supported_fparser_types():
@@ -347,7 +1064,7 @@ class MySubrOrFunc(MyNode):
 
       return dealloc_wo_alloc_list
 
-   def get_var_dict(self):
+   def get_var_dict(self,decl_stmt_list=None):
       """
       Get a dict of MyFortranVariable() objects, that correspond to the declared variables 
       in the subroutine or function
@@ -355,7 +1072,8 @@ class MySubrOrFunc(MyNode):
       
       var_dict = {}
 
-      decl_stmt_list = self.get_non_internal_type_list( (Fortran2003.Type_Declaration_Stmt),obj=True )
+      if decl_stmt_list is None:
+         decl_stmt_list = self.get_non_internal_type_list( (Fortran2003.Type_Declaration_Stmt),obj=True )
       #decl_stmt_list = walk(self._node.parent, Fortran2003.Type_Declaration_Stmt, debug=False)
 
       for decl_stmt in decl_stmt_list:
@@ -382,14 +1100,15 @@ class MySubrOrFunc(MyNode):
 
       return var_dict
 
-   def get_alloc(self):
+   def get_alloc(self,alloc_obj_list=None):
       """
       Get the allocated arrays in the subroutine (excluding a possible contains block), from the
       Allocate fparser type
       """
       my_alloc_list = []
 
-      alloc_obj_list = self.get_non_internal_type_list( (Fortran2003.Allocation),obj=True )
+      if alloc_obj_list is None:
+         alloc_obj_list = self.get_non_internal_type_list( (Fortran2003.Allocation),obj=True )
       
       for alloc in alloc_obj_list:
          myarray = MyFortranArray()
@@ -408,7 +1127,7 @@ class MySubrOrFunc(MyNode):
 
       return sorted(my_alloc_list, key=lambda x: x.name)
 
-   def get_dealloc(self):
+   def get_dealloc(self,dealloc_obj_list=None):
       """
       Get the deallocated arrays in the subroutine (excluding a possible contains block), from the
       Deallocate_Stmt fparser type
@@ -416,7 +1135,8 @@ class MySubrOrFunc(MyNode):
       """
       my_dealloc_list = []
 
-      dealloc_obj_list = self.get_non_internal_type_list( (Fortran2003.Deallocate_Stmt), obj=True )
+      if dealloc_obj_list is None:
+         dealloc_obj_list = self.get_non_internal_type_list( (Fortran2003.Deallocate_Stmt), obj=True )
       
       for dealloc in dealloc_obj_list:
          
@@ -439,9 +1159,7 @@ class MySubrOrFunc(MyNode):
       """
       loc_func_list = list( set(self.arrays_or_funcs) & set(function_list))
 
-      self.calls += loc_func_list
-      
-      self.calls = sorted(self.calls)
+      self.calls = sorted(self.calls + loc_func_list)
 
       self.arrays = list(set(self.arrays_or_funcs) - set(loc_func_list))
 
@@ -452,21 +1170,35 @@ class MySubrOrFunc(MyNode):
 
 
 class MyInterface(MyNode):
-   def __init__(self,node,filename):
-      super().__init__(node,filename)
-      self.procedures = self.get_procedure_name_list()
+   collected_types = MyNode.collected_types + (Fortran2003.Procedure_Name_List,)
+
+   def set_collected_attrs(self,collected,context):
+      self.procedures = self.get_procedure_name_list(collected)
    
+   # Attributes merged from the module procedures, for each analysis level
+   merged_attr_dict = {
+      'calls' : ['calls','subroutines','functions'],
+      'uses'  : ['uses'],
+      'full'  : ['alloc','dealloc','alloc_wo_dealloc','dealloc_wo_alloc'],
+   }
+
    def update_interface_attrs(self,callable_dict):
-      #attrname_list = ['calls','uses','subroutines','functions']
-      attrname_list = ['calls','uses','subroutines','functions','alloc','dealloc','alloc_wo_dealloc','dealloc_wo_alloc']
-      
-      for attrname in attrname_list:
-         setattr(self,attrname,[])
+      attrname_list = []
+      for attr_analysis, merged_attrname_list in self.merged_attr_dict.items():
+         for attrname in merged_attrname_list:
+            if analysis_includes(self.analysis,attr_analysis):
+               setattr(self,attrname,[])
+               attrname_list.append(attrname)
+            else:
+               setattr(self,attrname,None)
 
       self.merge_attrs(callable_dict,attrname_list)
 
-   def get_procedure_name_list(self):
-      procedure_name_list = walk(self._node.parent,Fortran2003.Procedure_Name_List,debug=False)
+   def get_procedure_name_list(self,collected=None):
+      if collected is not None:
+         procedure_name_list = [x for x,internal in collected[Fortran2003.Procedure_Name_List]]
+      else:
+         procedure_name_list = walk(self._node.parent,Fortran2003.Procedure_Name_List,debug=False)
       procedure_name_str_list = [self.get_node_name(x) for x in procedure_name_list]
 
       return sorted(procedure_name_str_list)
@@ -498,9 +1230,10 @@ class MyModule(MyNode):
    """
    Module only
    """
-   def __init__(self,node,filename):
-      super().__init__(node,filename)
-      self.uses   = self.get_type_list( (Fortran2003.Use_Stmt) )
+   collected_types = MyNode.collected_types + (Fortran2003.Use_Stmt,)
+
+   def set_collected_attrs(self,collected,context):
+      self.uses   = context.get_module_uses(self._node.parent)
 
    @staticmethod
    def supported_fparser_types():
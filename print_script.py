@@ -57,6 +57,7 @@ def print_maphilight(html, node_list):
    print_jquery_highlight_action(html,'actionShowFunc',node_list,'Function')
    print_jquery_highlight_action(html,'actionShowInter',node_list,'Interface')
    print_jquery_highlight_action(html,'actionShowExt',node_list,'External')
+   print_jquery_highlight_action(html,'actionShowCycle',node_list,'Cycle')
 
    html.write('   });\n')
    html.write('</script>\n\n')
@@ -189,6 +190,13 @@ def print_script_show_blocks(html):
    html.write('     }\n')
    html.write('}\n\n')
 
+   html.write('function ShowCycle() {\n')
+   html.write('   var modeblocks = document.querySelectorAll("[id^=node_Cycle]");\n')
+   html.write('      for (var i = 0; i < modeblocks.length; i++) {\n')
+   html.write('      modeblocks[i].style.display = "block";\n')
+   html.write('     }\n')
+   html.write('}\n\n')
+
    html.write('</script>\n\n')
 
 def print_collapsible_func(html):
@@ -4,17 +4,19 @@
 Run the code parsing and create the subroutine/module interactive graphs
 """
 
-import os, sys, shutil
+import os, sys, re, shutil, functools, multiprocessing, warnings
 import pygraphviz as pgv
 import textwrap
 import argparse
 
-import htmltools, graphtools
+import htmltools, graphtools, filtertools, parsecache, layoutcache, watchtools, fastscan, symboltools, sourcetools, cpptools, indextools
 
-from parsetools import  get_parse_tree_dict, \
-                        get_global_node_dict, \
+from parsetools import  get_local_dict_per_file, \
+                        create_f2008_parser, \
+                        extract_file, \
+                        merge_node_dict, \
                         print_object_attributes, \
-                        MySubrOrFunc, MyInterface
+                        ANALYSIS_LEVELS, analysis_includes
 
 from fparser.two.utils import walk
 
@@ -35,52 +37,101 @@ except ImportError:
 #tnow = time.time
 tnow = time.perf_counter
 
-def create_callable_dict(path,source_file_list,module_tree=False):
+# Output formats of the graphs (graphviz formats, see graphtools.draw_graph)
+OUTPUT_FORMATS = ['svg','png','dot','json']
+
+def merge_module_dict(source_file_list,local_dict_per_file):
    """
-   Create a dictionary of the calls (functions, subroutines, and interfaces) if module_tree is False
-   or (modules) if module_tree is True
+   Merge the local module dicts in the order of source_file_list
+   """
+   module_dict = {}
+   for filename in source_file_list:
+      merge_node_dict(module_dict,local_dict_per_file[filename][1])
+
+   return module_dict
+
+def get_analysis_level(analysis,with_modules=False):
+   """
+   The module tree is built from the uses attribute (of the modules and the programs),
+   so the analysis level is at least 'uses' if the module dict is created
+   """
+   if with_modules and not analysis_includes(analysis,'uses'):
+      return 'uses'
+
+   return analysis
+
+def create_node_dicts(path,source_file_list,with_modules=False,jobs=1,cache_dir=None,engine='fparser',analysis='full',preprocessor=None):
+   """
+   Create a dictionary of the calls (functions, subroutines, and interfaces) and
+   a dictionary of the modules (if with_modules is True, None otherwise)
    from all the files from source_file_list
+   source_file_list can be an iterator (e.g. sourcetools.iter_source_files): the parsing starts
+   before the end of the directory walk, and the files are merged in the alphabetic order
+   If jobs > 1, the files are parsed in a pool of jobs processes
+   If cache_dir is specified, only the files that changed since the previous run are parsed
+   engine is 'fparser' or 'fast' (see fastscan.py)
+   analysis is the level of the node attributes computation (see parsetools.ANALYSIS_LEVELS)
+   preprocessor (see cpptools.Preprocessor) is applied to the files before the parsing, if specified
    """
+   module_tree = with_modules
+   module_dict = None
+
+   analysis = get_analysis_level(analysis,with_modules=with_modules)
+
+   types_tuple_callable = (Fortran2003.Subroutine_Stmt,Fortran2003.Function_Stmt,Fortran2003.Interface_Stmt, Fortran2003.Program_Stmt)
+   types_tuple_module = (Fortran2003.Module_Stmt, Fortran2003.Program_Stmt)
+
    #
-   # fparser provides a parse tree per file.
-   # So here, we run over all the files of the source directory and create a dictionary of parse trees
+   # The files are parsed one by one (or taken from the cache). The MyNode instances
+   # are extracted from each parse tree, then the tree is dropped, so that only the
+   # extracted data is kept in memory.
    #
-   parse_tree_dict = get_parse_tree_dict(path,source_file_list)
+   fparser_types_list = [types_tuple_callable]
+   if module_tree:
+      fparser_types_list.append(types_tuple_module)
 
    #
-   # Get the dictionary of MyNode instances 
-   # for Fortran "callables": subroutines, functions, and interfaces
+   # The global symbol index of the callables (see symboltools.SymbolIndex) is filled as the files
+   # come (in the order in which they are done with jobs > 1), the files are ordered by their position
+   # in source_file_list, or by their name if source_file_list is an iterator
    #
+   symbol_index = symboltools.SymbolIndex()
 
-   types_tuple_callable = (Fortran2003.Subroutine_Stmt,Fortran2003.Function_Stmt,Fortran2003.Interface_Stmt, Fortran2003.Program_Stmt)
+   if isinstance(source_file_list,list):
+      file_order_dict = { filename: i for i, filename in enumerate(source_file_list) }
+   else:
+      file_order_dict = None
 
-   callable_dict = get_global_node_dict(parse_tree_dict,types_tuple_callable,debug=False)
+   def add_file_to_index(filename,local_node_dict_list):
+      order = filename if file_order_dict is None else file_order_dict[filename]
+      symbol_index.add_file(filename,local_node_dict_list[0],order=order)
 
-   if module_tree:
-      types_tuple_module = (Fortran2003.Module_Stmt, Fortran2003.Program_Stmt)
-      module_dict = get_global_node_dict(parse_tree_dict,types_tuple_module,debug=False)
+   if cache_dir is not None:
+      local_dict_per_file = parsecache.get_local_dict_per_file_cached(path,source_file_list,fparser_types_list,cache_dir,jobs=jobs,engine=engine,analysis=analysis,preprocessor=preprocessor,result_callback=add_file_to_index)
+   else:
+      local_dict_per_file = get_local_dict_per_file(path,source_file_list,fparser_types_list,jobs=jobs,engine=engine,analysis=analysis,preprocessor=preprocessor,result_callback=add_file_to_index)
 
-   function_list = [ x.name for x in callable_dict.values() if x.fparser_type == Fortran2003.Function_Stmt]
+   if not isinstance(source_file_list,list):
+      source_file_list = sorted(local_dict_per_file.keys())
 
    #
-   # Once the function list is known, add the function calls to the .calls attribute
-   # It was not possible to do before the function list is known since the Fortran syntax 
-   # for a function and an array is the same
+   # Dictionaries of MyNode instances for Fortran "callables": subroutines, functions, and interfaces
+   # (with the calls resolved by the symbol index) and for modules
    #
+   callable_dict = symbol_index.create_callable_dict(source_file_list)
 
-   for obj in callable_dict.values():
-      if isinstance(obj,MySubrOrFunc):
-         # append the function calls of obj
-         obj.append_func_calls(function_list)
+   if module_tree:
+      module_dict = merge_module_dict(source_file_list,local_dict_per_file)
 
-   #
-   # Once the callable_dict is filled entirely for functions and subroutines, we can update
-   # the interfaces attributes to encorporate all the calls, etc. of the module procedures 
-   # that they contain
-   #
-   for obj in callable_dict.values():
-      if isinstance(obj,MyInterface):
-         obj.update_interface_attrs(callable_dict)
+   return callable_dict, module_dict
+
+def create_callable_dict(path,source_file_list,module_tree=False,jobs=1,cache_dir=None,engine='fparser',analysis='full',preprocessor=None):
+   """
+   Create a dictionary of the calls (functions, subroutines, and interfaces) if module_tree is False
+   or (modules) if module_tree is True
+   from all the files from source_file_list
+   """
+   callable_dict, module_dict = create_node_dicts(path,source_file_list,with_modules=module_tree,jobs=jobs,cache_dir=cache_dir,engine=engine,analysis=analysis,preprocessor=preprocessor)
 
    if module_tree:
       return module_dict
@@ -114,23 +165,24 @@ def create_callable_graph_dict(callable_dict,module_tree = False):
 
    return graph_dict
 
-def get_sorted_node_list(graph):
+def get_sorted_node_list(graph_dict,depth_dict):
    """
-   Sort the graph nodes according to their depth in the graph and then alphabetic oreder
+   Sort the graph nodes according to their depth in the graph (see graphtools.get_node_depth_dict)
+   and then alphabetic oreder
    """
 
-   node_list = graph.nodes()
-
-   node_list = sorted(node_list, key = lambda x: (graphtools.get_node_depth(graph,x), x ))
+   node_list = sorted(graph_dict.keys(), key = lambda x: (depth_dict[x], x ))
 
    return node_list
 
-def get_node_type_dict(callable_dict, node_list):
+def get_node_type_dict(callable_dict, node_list, cycle_dict = None):
    
    node_type_dict = {}
 
    for node in node_list:
-      if node in callable_dict.keys():
+      if cycle_dict is not None and node in cycle_dict.keys():
+         node_type_dict[node] = 'Cycle'
+      elif node in callable_dict.keys():
          ntype = callable_dict[node].type
          node_type_dict[node] = ntype
       else:
@@ -138,12 +190,14 @@ def get_node_type_dict(callable_dict, node_list):
 
    return node_type_dict
 
-def get_prefix_node_list(callable_dict, node_list):
+def get_prefix_node_list(callable_dict, node_list, cycle_dict = None):
    
    prefix_node_list = []
 
    for node in node_list:
-      if node in callable_dict.keys():
+      if cycle_dict is not None and node in cycle_dict.keys():
+         prefix_node_list.append('Cycle'+'-'+node)
+      elif node in callable_dict.keys():
          ntype = callable_dict[node].type
          prefix_node_list.append(ntype+'-'+node)
       else:
@@ -151,31 +205,60 @@ def get_prefix_node_list(callable_dict, node_list):
 
    return prefix_node_list
 
-def create_graph_for_node(root_node,graph_dict,callable_dict,args,hide_nodes,img_dir,svg_path, module_tree = False):
+def create_graph_for_node(root_node,graph_dict,callable_dict,args,graph_config,img_dir,svg_path, module_tree = False, layout_cache = None):
    """
    Callable graph creation (including HTML) for a given root node
+   graph_dict is the filtered graph (see filter_graph_dict)
+   If layout_cache is specified (see layoutcache.LayoutCache), the graphviz outputs are taken from the cache
+   when the subgraph and the graph parameters did not change. Return True in case of a cache hit.
    """
 
-   call_graph = graphtools.create_call_graph(graph_dict,callable_dict,root_node,hide_from_files=args.hide_from_files,hide_nodes=hide_nodes,allowed_connections=args.allowed_connections, forbidden_connections = args.forbidden_connections )
+   # The filters and traversals work on the adjacency dict, pygraphviz is only used to draw the result
+   call_graph_dict, stub_dict, cycle_dict = graphtools.create_call_graph_dict(graph_dict,callable_dict,root_node, max_depth = args.max_depth, condense_cycles = not args.expand_cycles )
 
-   graphtools.set_graph_param(call_graph, root_node, manual_param_path = args.param_dict)
+   if all( len(successors) == 0 for successors in call_graph_dict.values() ):
+      print(f'No calls from {root_node} in the graph (hidden or leaf node): the graph has a single node')
 
-   t1 = tnow()
-   print('\nDrawing graph')
+   # The depth of the nodes is computed once, for the node sizes and the node list of the HTML
+   depth_dict = graphtools.get_node_depth_dict(call_graph_dict,root_node)
 
    if module_tree:
       basename = f'module_tree_{root_node}'
    else:
       basename = f'call_graph_{root_node}'
 
-   call_graph.write(f'{basename}.dot')
-   call_graph.draw(f'{basename}.png')
-   call_graph.draw(svg_path)
-   print(f'Done: {tnow() - t1:.2f} s')
+   # The SVG is always rendered, it is the image of the HTML file
+   output_path_list = [svg_path] + [ f'{basename}.{fmt}' for fmt in args.formats if fmt != 'svg' ]
+
+   cache_hit = False
+   if layout_cache is not None:
+      layout_key = layout_cache.get_key(call_graph_dict,root_node,graph_config.param_dict,[ os.path.splitext(x)[1] for x in output_path_list ],stub_dict=stub_dict,cycle_dict=cycle_dict)
+      cache_hit = layout_cache.load(layout_key,output_path_list)
+
+   if cache_hit:
+      print('\nGraph layout taken from the cache')
+
+   else:
+      call_graph = graphtools.create_call_graph(call_graph_dict,stub_dict=stub_dict,cycle_dict=cycle_dict)
+
+      graphtools.set_graph_param(call_graph, root_node, depth_dict = depth_dict, graph_param_dict = graph_config.param_dict)
+
+      t1 = tnow()
+      print('\nDrawing graph')
+
+      graphtools.draw_graph(call_graph,output_path_list,prog=graphtools.get_layout_prog(graph_config.param_dict),graph_dict=call_graph_dict)
+      print(f'Done: {tnow() - t1:.2f} s')
 
-   sorted_node_list = get_sorted_node_list(call_graph)
-   prefix_node_list = get_prefix_node_list(callable_dict,sorted_node_list)
-   node_type_dict = get_node_type_dict(callable_dict,sorted_node_list)
+      if layout_cache is not None:
+         layout_cache.store(layout_key,output_path_list)
+
+   # The stub nodes of a truncated graph are links to other graphs, they are not described in the HTML
+   sorted_node_list = [ x for x in get_sorted_node_list(call_graph_dict,depth_dict) if x not in stub_dict ]
+   prefix_node_list = get_prefix_node_list(callable_dict,sorted_node_list,cycle_dict)
+   node_type_dict = get_node_type_dict(callable_dict,sorted_node_list,cycle_dict)
+
+   # The procedures that call themselves (the other recursions are in the cycle nodes)
+   recursive_node_list = [ x for x in sorted_node_list if x in call_graph_dict[x] ]
 
    #
    # Dump HTML
@@ -183,10 +266,12 @@ def create_graph_for_node(root_node,graph_dict,callable_dict,args,hide_nodes,img
    t1 = tnow()
    print('\nCreating HTML file')
 
-   htmltools.create_html(callable_dict, svg_path, prefix_node_list, node_type_dict, args.path, root_node, module_tree = args.module_tree)
+   htmltools.create_html(callable_dict, svg_path, prefix_node_list, node_type_dict, args.path, root_node, module_tree = args.module_tree, stub_dict = stub_dict, cycle_dict = cycle_dict, recursive_node_list = recursive_node_list)
 
    print('Done: {:.2f} s'.format(tnow() - t1))
 
+   return cache_hit
+
 def parse_arguments():
    """
    Parse command line arguments
@@ -197,21 +282,50 @@ def parse_arguments():
    cmd_parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,description=help_description)
 
    cmd_parser.add_argument('-p','--path',help='Path to the source code',default=None)
-   cmd_parser.add_argument('-r','--root-node-list',help='List of root node names. The call tree will be ploted from the root nodes of the list.', nargs='*', type=str, required=True)
+   cmd_parser.add_argument('-r','--root-node-list',help='List of root node names. The call tree will be ploted from the root nodes of the list.', nargs='*', type=str, required=False, default=[])
+   cmd_parser.add_argument('--all-programs',action='store_true',help='Plot the tree of every program of the source code (in addition to the root nodes of --root-node-list).',default=False)
    cmd_parser.add_argument('-y','--hide-from-yaml',help='Hide the callables that are in specific files or select them by name, contained in the yaml file. The file must have the dictionary structure with the following keys: files: [List of files] and/or nodes: [List of nodes].',type=str,required = False,default=None)
    
    cmd_parser.add_argument('--exclude-files',help='List of file to exclude from parsing',nargs='*',required = False,default=[])
+   cmd_parser.add_argument('--extensions',help='Extensions of the source files (case insensitive).',nargs='+',required = False,default=sourcetools.DEFAULT_EXTENSIONS)
+   cmd_parser.add_argument('--include',help='Glob patterns of the source files to parse (relative to the path, ** matches any number of folders). By default all the files with the extensions are parsed.',nargs='*',required = False,default=[])
+   cmd_parser.add_argument('--exclude',help='Glob patterns of the source files and folders to exclude from parsing.',nargs='*',required = False,default=[])
+   cmd_parser.add_argument('--ignore-files',help='Names of the ignore files (.gitignore syntax) read in each folder, e.g. .gitignore',nargs='*',required = False,default=[])
    cmd_parser.add_argument('--hide-from-files',help='List of files. If a suboutine/function is implemented in one of these files, it will be hidden in the graph.',nargs='*',required = False,default=[])
    cmd_parser.add_argument('--hide-nodes',help='List of nodes to hide in the graph',nargs='*',required = False,default=[])
 
    cmd_parser.add_argument('--param-dict',help='YAML file contatining the graph and node parameters that will overwrite the default ones. ',type=str,required = False,default=None)
    cmd_parser.add_argument('--allowed-connections',help='YAML file contatining the list of allowed graph connections for specific nodes.',type=str,required = False,default=None)
    cmd_parser.add_argument('--forbidden-connections',help='YAML file contatining the list of forbidden graph connections for specific nodes.',type=str,required = False,default=None)
+   cmd_parser.add_argument('--filter',help='YAML file of the graph filter: hide, forbid and allow rules on the node names (glob or regex), files, modules and types (see filtertools). Combined with the other hide and connection options.',type=str,required = False,default=None)
    
+   cmd_parser.add_argument('-j','--jobs',help='Number of processes used to parse the source files.',type=int,required = False,default=1)
+   cmd_parser.add_argument('--render-jobs',help='Number of processes used to render the graphs of the root nodes (default: --jobs).',type=int,required = False,default=None)
+
+   cmd_parser.add_argument('--engine',help='Parsing engine: fparser (full parse tree) or fast (line-oriented scan of the free-form source, less accurate).',choices=['fparser','fast'],required = False,default='fparser')
+   cmd_parser.add_argument('--analysis',help='Analysis level: calls (call graph only), uses (and the used modules) or full (and the line statistics, variables and array allocations shown in the HTML).',choices=ANALYSIS_LEVELS,required = False,default='full')
+   cmd_parser.add_argument('--cpp',action='store_true',help='Run the C preprocessor on the source files before the parsing (#ifdef, #include, #define).',default=False)
+   cmd_parser.add_argument('-D','--define',help='Macro definition for the preprocessor: NAME or NAME=VALUE (with --cpp).',action='append',required = False,default=[])
+   cmd_parser.add_argument('-I','--include-dir',help='Include folder for the preprocessor (with --cpp).',action='append',required = False,default=[])
+   cmd_parser.add_argument('--cpp-command',help='Preprocessor: auto (cpp if it is installed, the built-in Python preprocessor otherwise), python, or the cpp executable.',type=str,required = False,default='auto')
+   cmd_parser.add_argument('--cache-dir',help='Directory of the persistent parse cache. Only the files that changed since the previous run will be parsed.',type=str,required = False,default=None)
+   cmd_parser.add_argument('--layout-cache-size',help='Maximum size (MB) of the graph layout cache, in the layout subfolder of the cache directory (with --cache-dir). The least recently used graphs are evicted.',type=float,required = False,default=1024)
+
+   cmd_parser.add_argument('--max-depth',help='Cut the graphs at this distance from the root node. The truncated calls of a node are drawn as a "+N more" stub that links to the graph of the node.',type=int,required = False,default=None)
+   cmd_parser.add_argument('--no-stub-graphs',action='store_true',help='With --max-depth, do not render the graphs of the stub nodes in the same run (render them on demand with -r).',default=False)
+   cmd_parser.add_argument('--expand-cycles',action='store_true',help='Draw the recursion cycles procedure by procedure. By default, each cycle of mutually recursive procedures is collapsed into one node.',default=False)
+   cmd_parser.add_argument('--formats',help='Comma separated output formats of the graphs: {:}. The SVG is always rendered for the HTML file.'.format(','.join(OUTPUT_FORMATS)),type=str,required = False,default='svg,dot')
+
    cmd_parser.add_argument('-m','--module-tree',action='store_true',help='Build the module tree',default=False)
 
-   cmd_parser.add_argument('-s','--save',action='store_true',help='Save the parse tree in a file to save time for following runs.',default=False)
-   cmd_parser.add_argument('--load',action='store_true',help='Save the parse tree in a file to save time for following runs.',default=False)
+   cmd_parser.add_argument('-w','--watch',action='store_true',help='Keep running, watch the source directory and update the graphs when the source files change.',default=False)
+   cmd_parser.add_argument('--watch-interval',help='Polling interval of the watch mode in seconds.',type=float,required = False,default=1.0)
+
+   cmd_parser.add_argument('--index-db',help='SQLite database of the call graph index, updated with the analysed source code (see: runparse.py query --help).',type=str,required = False,default=None)
+
+   cmd_parser.add_argument('-s','--save',action='store_true',help='Save the analysed source code in a snapshot file to save time for following runs.',default=False)
+   cmd_parser.add_argument('--load',action='store_true',help='Load the analysed source code from the snapshot file instead of parsing.',default=False)
+   cmd_parser.add_argument('--restart-file',help='Snapshot file used by --save and --load.',type=str,required = False,default='restart_call_dict')
 
    args = cmd_parser.parse_args()
 
@@ -219,77 +333,149 @@ def parse_arguments():
    if args.path is None and not args.load:
       sys.exit('One of the options must be specified: \n Path (-p) or Load (--load).')
 
+   if args.watch and args.path is None:
+      sys.exit('The watch mode requires the path (-p) to the source code.')
+
+   if len(args.root_node_list) == 0 and not args.all_programs:
+      sys.exit('One of the options must be specified: \n Root nodes (-r) or All programs (--all-programs).')
+
+   if args.render_jobs is None:
+      args.render_jobs = args.jobs
+
+   if args.max_depth is not None and args.max_depth < 0:
+      sys.exit('The maximum depth (--max-depth) must be a non-negative number.')
+
+   args.formats = [ x.strip().lower() for x in args.formats.split(',') if x.strip() != '' ]
+   for fmt in args.formats:
+      if fmt not in OUTPUT_FORMATS:
+         sys.exit('Unknown output format: {:} (choose from {:})'.format(fmt,', '.join(OUTPUT_FORMATS)))
+
    return args
 
-def call_dict_from_path(path,exclude_files=None, module_tree = False):
+def get_source_file_list(path,exclude_files=None,source_filter=None):
    """
-   Parse the source folder and return the dictionary of callables
+   Return the sorted list of the source files in the path folder and its subfolders
+   (see sourcetools.SourceFilter for the selection of the files)
    """
-   source_folder = os.path.abspath(path)
+   if source_filter is None:
+      source_filter = sourcetools.SourceFilter(exclude_files=exclude_files)
 
-   if exclude_files is None:
-      exclude_files = []
+   return sourcetools.get_source_file_list(path,source_filter=source_filter)
 
-   source_file_list = []
-   for filename in os.listdir(path):
-      if filename.upper().endswith('.F90') and filename not in exclude_files:
-         source_file_list.append(filename)
+def call_dict_from_path(path,exclude_files=None, module_tree = False, jobs = 1, cache_dir = None, engine = 'fparser', analysis = 'full', source_filter = None, preprocessor = None):
+   """
+   Parse the source folder and return the dictionary of callables
+   The files are parsed as the directory walk finds them
+   """
+   if source_filter is None:
+      source_filter = sourcetools.SourceFilter(exclude_files=exclude_files)
 
-   source_file_list = sorted(source_file_list)
+   source_file_iter = sourcetools.iter_source_files(path,source_filter=source_filter)
 
-   callable_dict = create_callable_dict(path,source_file_list,module_tree = module_tree)
+   callable_dict = create_callable_dict(path,source_file_iter,module_tree = module_tree, jobs = jobs, cache_dir = cache_dir, engine = engine, analysis = analysis, preprocessor = preprocessor)
 
    return callable_dict
 
-def save_call_dict(callable_dict,filename='restart_call_dict'):
+def node_dicts_from_path(path,exclude_files=None, jobs = 1, cache_dir = None, engine = 'fparser', analysis = 'full', source_filter = None, preprocessor = None):
+   """
+   Parse the source folder and return both the dictionary of callables and the dictionary of modules
+   The files are parsed as the directory walk finds them
+   """
+   if source_filter is None:
+      source_filter = sourcetools.SourceFilter(exclude_files=exclude_files)
+
+   source_file_iter = sourcetools.iter_source_files(path,source_filter=source_filter)
+
+   return create_node_dicts(path,source_file_iter,with_modules=True,jobs=jobs,cache_dir=cache_dir,engine=engine,analysis=analysis,preprocessor=preprocessor)
 
-   sys.exit('RESTART IS NOT IMPLEMENTED')
+#
+# Restart snapshot: a header (checked before anything else is loaded)
+# followed by the callable and module dicts. The MyNode objects are pickled
+# without the fparser trees (see MyNode.__getstate__).
+#
+SNAPSHOT_FORMAT  = 'FortranTree snapshot'
+SNAPSHOT_VERSION = 4
+
+def save_call_dict(callable_dict,module_dict,path,filename='restart_call_dict'):
+   """
+   Save the analysed callable_dict and module_dict in a versioned snapshot file
+   """
+   t1 = tnow()
+   print(f'\nSaving the snapshot: {filename}')
+
+   header = {
+      'format'  : SNAPSHOT_FORMAT,
+      'version' : SNAPSHOT_VERSION,
+      'fparser_version' : parsecache.get_fparser_version(),
+      'path'    : os.path.abspath(path),
+      'created' : datetime.now().isoformat(timespec='seconds'),
+   }
+
+   tmp_filename = filename+'.tmp'
+   with open(tmp_filename,'wb') as f:
+      pickle.dump(header,f,protocol=pickle.HIGHEST_PROTOCOL)
+      pickle.dump({'callable_dict': callable_dict, 'module_dict': module_dict},f,protocol=pickle.HIGHEST_PROTOCOL)
+   os.replace(tmp_filename,filename)
 
-   with open(filename,'wb') as f:
-      for k,v in callable_dict.items():
-         print(k,v)
-         pickle.dump(callable_dict,f,protocol=pickle.HIGHEST_PROTOCOL) 
-         #json.dump(callable_dict,f) 
+   print('Done: {:.2f} s'.format(tnow() - t1))
 
 def load_call_dict(filename='restart_call_dict'):
-   sys.exit('RESTART IS NOT IMPLEMENTED')
+   """
+   Load the snapshot saved with save_call_dict.
+   Return callable_dict, module_dict, and the path of the source code.
+   """
+   t1 = tnow()
+   print(f'\nLoading the snapshot: {filename}')
 
-def main():
+   if not os.path.isfile(filename):
+      sys.exit(f'Snapshot file {filename} does not exist, run with --save first.')
 
-   args = parse_arguments()
+   with open(filename,'rb') as f:
+      try:
+         header = pickle.load(f)
+      except Exception:
+         header = None
 
-   #
-   # Create the source code tree fparser
-   #
-   if args.path is not None:
-      callable_dict = call_dict_from_path(args.path, exclude_files = args.exclude_files, module_tree = args.module_tree)
+      if not isinstance(header,dict) or header.get('format') != SNAPSHOT_FORMAT:
+         sys.exit(f'{filename} is not a FortranTree snapshot.')
 
-      if args.save:
-         save_call_dict(callable_dict,filename='restart_call_dict')
+      if header['version'] != SNAPSHOT_VERSION:
+         sys.exit(f'Snapshot {filename} has version {header["version"]}, expected {SNAPSHOT_VERSION}. Run with --save again.')
 
-   elif args.load:
-      callable_dict = load_call_dict(filename='restart_call_dict')
-   else:
-      sys.exit('One of the options must be specified: \n Path (-p) or Load (--load).')
+      payload = pickle.load(f)
 
-   #
-   # Test
-   #
-   #obj = callable_dict['transport']
-   #print_object_attributes(obj)
+   print('  source path: {:}, created: {:}'.format(header['path'],header['created']))
+   print('Done: {:.2f} s'.format(tnow() - t1))
 
-   # maybe, the built in comparison works...
-   #print(callable_dict['transport']==callable_dict['transport'])
+   return payload['callable_dict'], payload['module_dict'], header['path']
 
-   # tostr() takes into account the comments that are before!
-   #print(obj._node.parent.tostr())
+def update_index(db_path,path,callable_dict,module_dict,source_file_list=None):
+   """
+   Update the call graph index database (see indextools.CallGraphIndex)
+   """
+   index = indextools.CallGraphIndex(db_path)
+   index.sync(path,callable_dict,module_dict,source_file_list=source_file_list)
+   index.close()
 
-   graph_dict = create_callable_graph_dict(callable_dict, module_tree = args.module_tree)
+def get_preprocessor(args):
+   """
+   Preprocessor of the source files (None without --cpp). The preprocessed sources are cached
+   in the cpp subfolder of the parse cache directory
+   """
+   if not args.cpp:
+      return None
 
-   #
-   # Nodes to hide
-   #
+   cpp_cache_dir = os.path.join(args.cache_dir,'cpp') if args.cache_dir is not None else None
+
+   try:
+      return cpptools.Preprocessor(defines=args.define,include_dirs=args.include_dir,cpp_command=args.cpp_command,cache_dir=cpp_cache_dir)
+   except cpptools.PreprocessorError as error:
+      sys.exit(str(error))
 
+def get_hide_nodes(args):
+   """
+   Nodes to hide: the lists from the command line are extended with the ones from the YAML file
+   """
    hide_from_files = args.hide_from_files
    hide_nodes      = args.hide_nodes
    
@@ -304,27 +490,374 @@ def main():
       if 'nodes' in hide_dict.keys():
          hide_nodes += hide_dict['nodes']
 
+   return hide_nodes
+
+def get_graph_config(args):
+   """
+   Configuration of the graphs (see graphtools.GraphConfig), loaded once for all the root nodes
+   """
+   hide_nodes = get_hide_nodes(args)
+
+   try:
+      graph_filter = filtertools.GraphFilter.from_options(filter_path=args.filter,
+                                                          hide_nodes=hide_nodes,hide_from_files=args.hide_from_files,
+                                                          allowed_connections_path=args.allowed_connections,
+                                                          forbidden_connections_path=args.forbidden_connections)
+   except (ValueError, re.error) as error:
+      sys.exit(f'Error in the graph filter: {error}')
+
+   return graphtools.GraphConfig(manual_param_path=args.param_dict,graph_filter=graph_filter)
+
+def find_root_node_keys(name,callable_dict,graph_dict):
+   """
+   Keys of the nodes named name (a key, e.g. mod::name, or a plain name, see indextools.CallGraphIndex.find_node_keys):
+   a plain name defined in several modules gives all the qualified keys
+   """
+   name = name.lower()
+
+   if name in callable_dict:
+      return [name]
+
+   key_list = sorted( key for key, node in callable_dict.items() if node.name.lower() == name )
+   if len(key_list) > 0:
+      return key_list
+
+   # External procedures (called but not defined in the source code)
+   if any( name in successors for successors in graph_dict.values() ):
+      return [name]
+
+   return []
+
+def get_root_node_list(args,callable_dict,graph_dict):
+   """
+   Root nodes of --root-node-list (see find_root_node_keys), then the programs of the source code with --all-programs
+   """
+   root_node_list = []
+   for name in args.root_node_list:
+      key_list = find_root_node_keys(name,callable_dict,graph_dict)
+
+      if len(key_list) == 0:
+         warnings.warn(f'Root node {name} is not in the source code, no graph is created.')
+      elif len(key_list) > 1:
+         print('Root node {:}: {:}'.format(name,', '.join(key_list)))
+
+      root_node_list += [ x for x in key_list if x not in root_node_list ]
+
+   if args.all_programs:
+      program_list = sorted( name.lower() for name, node in callable_dict.items() if node.type == 'Program' )
+      root_node_list += [ x for x in program_list if x not in root_node_list ]
+
+   return root_node_list
+
+def get_layout_cache(args):
+   """
+   Cache of the graphviz outputs (None without --cache-dir), in the layout subfolder of the parse cache directory
+   """
+   if args.cache_dir is None:
+      return None
+
+   return layoutcache.LayoutCache(os.path.join(args.cache_dir,'layout'),max_size=int(args.layout_cache_size*1024**2))
+
+def render_root_node(root_node,graph_dict,callable_dict,args,graph_config,layout_cache=None):
+   """
+   Callable graph creation (including HTML) for a given root node, return True if the layout was taken from the cache
+   """
+   print(f'\n=== ROOT NODE: {root_node} ===\n')
+
+   img_dir = 'images/callgraph'
+   os.makedirs(img_dir, exist_ok=True)
+   svg_path = os.path.join(img_dir,'{:}.svg'.format(root_node))
+
+   return create_graph_for_node(root_node,graph_dict,callable_dict,args,graph_config,img_dir,svg_path, module_tree = args.module_tree, layout_cache = layout_cache)
+
+# Data shared by the root nodes in a worker process (see init_render_worker)
+_render_worker_data = None
+
+def init_render_worker(graph_dict,callable_dict,args,graph_config,layout_cache):
+   """
+   Initializer of the render worker processes: the graph and the configuration
+   are passed once per process, not once per root node
+   """
+   global _render_worker_data
+   _render_worker_data = (graph_dict,callable_dict,args,graph_config,layout_cache)
+
+def render_root_node_worker(root_node):
+   """
+   Worker function: render one root node with the data of the worker process
+   """
+   graph_dict, callable_dict, args, graph_config, layout_cache = _render_worker_data
+
+   return render_root_node(root_node,graph_dict,callable_dict,args,graph_config,layout_cache=layout_cache)
+
+def add_stub_root_nodes(root_node_list,graph_dict,callable_dict,args,graph_config):
+   """
+   With --max-depth, add the nodes of the stubs of the truncated graphs to the root nodes,
+   then the nodes of the stubs of their graphs, etc.
+   """
+   root_node_list = list(root_node_list)
+   root_node_set = set(root_node_list)
+
+   i = 0
+   while i < len(root_node_list):
+      call_graph_dict, stub_dict, cycle_dict = graphtools.create_call_graph_dict(graph_dict,callable_dict,root_node_list[i], max_depth = args.max_depth, condense_cycles = not args.expand_cycles, verbose = False)
+
+      for stub, (node, ntruncated) in stub_dict.items():
+         if node not in root_node_set:
+            root_node_set.add(node)
+            root_node_list.append(node)
+
+      i += 1
+
+   return root_node_list
+
+def filter_graph_dict(graph_dict,callable_dict,graph_filter):
+   """
+   Remove the hidden nodes and connections (see filtertools.GraphFilter) from the graph shared by all the root nodes
+   """
+   if graph_filter is None or graph_filter.is_empty():
+      return graph_dict
+
+   t1 = tnow()
+   print('\nFiltering graph')
+
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   nedges = sum( len(successors) for successors in graph_dict.values() )
+   nfiltered_edges = sum( len(successors) for successors in filtered_graph_dict.values() )
+   print('Removed: {:} nodes, {:} edges'.format(len(graph_dict)-len(filtered_graph_dict),nedges-nfiltered_edges))
+   print('Done: {:.2f} s'.format(tnow() - t1))
+
+   return filtered_graph_dict
+
+def render_root_nodes(root_node_list,graph_dict,callable_dict,args,graph_config):
+   """
+   Render the graphs of the root nodes. The filter is applied once to the graph
+   shared by all the root nodes. If args.render_jobs > 1, the root nodes are rendered in a pool of processes.
+   With --max-depth, the graphs of the stub nodes are rendered as well (see add_stub_root_nodes).
+   """
+   t1 = tnow()
+
+   graph_dict = filter_graph_dict(graph_dict,callable_dict,graph_config.graph_filter)
+
+   if args.max_depth is not None and not args.no_stub_graphs:
+      nroots = len(root_node_list)
+      root_node_list = add_stub_root_nodes(root_node_list,graph_dict,callable_dict,args,graph_config)
+      print('\nGraphs of the stub nodes: {:} more root nodes'.format(len(root_node_list) - nroots))
+
+   layout_cache = get_layout_cache(args)
+
+   jobs = min(args.render_jobs,len(root_node_list))
+
+   if jobs > 1:
+      print('\nRendering {:} root nodes ({:} processes)'.format(len(root_node_list),jobs))
+
+      with multiprocessing.Pool(processes=jobs,initializer=init_render_worker,initargs=(graph_dict,callable_dict,args,graph_config,layout_cache)) as pool:
+         cache_hit_list = list(pool.imap_unordered(render_root_node_worker,root_node_list,chunksize=1))
+
+   else:
+      cache_hit_list = [ render_root_node(root_node,graph_dict,callable_dict,args,graph_config,layout_cache=layout_cache) for root_node in root_node_list ]
+
+   if layout_cache is not None:
+      # The hits and misses of the worker processes are counted here
+      layout_cache.hits = sum(cache_hit_list)
+      layout_cache.misses = len(cache_hit_list) - layout_cache.hits
+
+      nevicted = layout_cache.evict()
+
+      print('')
+      layout_cache.print_stats(nevicted)
+
+   if len(root_node_list) > 1:
+      print('\nRendered {:} root nodes: {:.2f} s'.format(len(root_node_list),tnow() - t1))
+
+def copy_js_files():
+   """
+   Copy the js scipt for the node highlights
+   """
+   js_source_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),'js','jquery.maphilight.min.js')
+   js_dir = 'js'
+   os.makedirs(js_dir, exist_ok=True)
+   shutil.copy(js_source_path,js_dir)
+
+def watch_and_render(args,graph_config):
+   """
+   Watch mode: keep the parser and the extracted nodes in memory, poll the source directory,
+   reparse only the changed files and render only the root nodes whose reachable subgraph changed
+   """
+   types_tuple_callable = (Fortran2003.Subroutine_Stmt,Fortran2003.Function_Stmt,Fortran2003.Interface_Stmt, Fortran2003.Program_Stmt)
+   types_tuple_module = (Fortran2003.Module_Stmt, Fortran2003.Program_Stmt)
+   fparser_types_list = [types_tuple_callable, types_tuple_module]
+
+   analysis = get_analysis_level(args.analysis,with_modules=True)
+
+   source_filter = sourcetools.SourceFilter.from_args(args)
+   preprocessor = get_preprocessor(args)
+   source_file_list = get_source_file_list(args.path,source_filter=source_filter)
+   watcher = watchtools.SourceWatcher(args.path,source_file_list)
+
+   #
+   # The symbol index is filled as the files are parsed, then updated file by file when the sources change
+   # (the files are ordered by their name, as in source_file_list), the callable dict (with the resolved calls)
+   # is made of shallow copies of its nodes
+   #
+   symbol_index = symboltools.SymbolIndex()
+
+   def add_file_to_index(filename,local_node_dict_list):
+      symbol_index.add_file(filename,local_node_dict_list[0],order=filename)
+
+   if args.cache_dir is not None:
+      local_dict_per_file = parsecache.get_local_dict_per_file_cached(args.path,source_file_list,fparser_types_list,args.cache_dir,jobs=args.jobs,engine=args.engine,analysis=analysis,preprocessor=preprocessor,result_callback=add_file_to_index)
+   else:
+      local_dict_per_file = get_local_dict_per_file(args.path,source_file_list,fparser_types_list,jobs=args.jobs,engine=args.engine,analysis=analysis,preprocessor=preprocessor,result_callback=add_file_to_index)
+
+   if args.engine == 'fast':
+      extract_func = functools.partial(fastscan.extract_file_fast,args.path,fparser_types_list,analysis=analysis,preprocessor=preprocessor)
+   else:
+      f2008_parser = create_f2008_parser()
+      extract_func = functools.partial(extract_file,args.path,fparser_types_list,f2008_parser=f2008_parser,analysis=analysis,preprocessor=preprocessor)
+
+   signature_dict = {}
+
+   while True:
+      t1 = tnow()
+
+      callable_dict = symbol_index.create_callable_dict(source_file_list)
+      module_dict = merge_module_dict(source_file_list,local_dict_per_file)
+
+      if args.index_db is not None:
+         update_index(args.index_db,args.path,callable_dict,module_dict,source_file_list=source_file_list)
+
+      if args.module_tree:
+         callable_dict = module_dict
+
+      graph_dict = create_callable_graph_dict(callable_dict, module_tree = args.module_tree)
+
+      root_node_list = get_root_node_list(args,callable_dict,graph_dict)
+
+      changed_root_node_list = []
+      for root_node in root_node_list:
+         signature = watchtools.get_subgraph_signature(graph_dict,callable_dict,root_node)
+
+         if signature != signature_dict.get(root_node):
+            changed_root_node_list.append(root_node)
+            signature_dict[root_node] = signature
+
+      if len(changed_root_node_list) > 0:
+         render_root_nodes(changed_root_node_list,graph_dict,callable_dict,args,graph_config)
+
+      print('\nUpdated {:} of {:} graphs: {:.2f} s'.format(len(changed_root_node_list),len(root_node_list),tnow() - t1))
+      print('Watching {:} (Ctrl+C to stop)'.format(args.path))
+
+      #
+      # Wait for the changes in the source directory
+      #
+      try:
+         while True:
+            time.sleep(args.watch_interval)
+
+            source_file_list = get_source_file_list(args.path,source_filter=source_filter)
+            changed_file_list, removed_file_list = watcher.poll(source_file_list)
+
+            if len(changed_file_list) > 0 or len(removed_file_list) > 0:
+               break
+
+      except KeyboardInterrupt:
+         print('\nStop watching')
+         return
+
+      for filename in removed_file_list:
+         print(f'\nRemoved: {filename}')
+         local_dict_per_file.pop(filename,None)
+         symbol_index.remove_file(filename)
+
+      for filename in changed_file_list:
+         print(f'\nChanged: {filename}')
+         try:
+            filename, local_node_dict_list = extract_func(filename)
+         except Exception as error:
+            # The file is probably being edited, keep the previous version of the nodes
+            print(f'Failed to parse {filename}: {error}')
+            if filename not in local_dict_per_file:
+               source_file_list.remove(filename)
+            continue
+
+         local_dict_per_file[filename] = local_node_dict_list
+         add_file_to_index(filename,local_node_dict_list)
+
+def main():
+
+   #
+   # Query subcommand: answer from the index database, without parsing
+   #
+   if len(sys.argv) > 1 and sys.argv[1] == 'query':
+      indextools.query_main(sys.argv[2:])
+      return
+
+   args = parse_arguments()
+
+   #
+   # Watch mode: parse once, then update the graphs on every change of the source files
+   #
+   if args.watch:
+      graph_config = get_graph_config(args)
+      copy_js_files()
+      watch_and_render(args,graph_config)
+      return
+
    #
-   # Callable graph creation (including HTML) for a given root node
+   # Create the source code tree fparser
    #
-   for root_node in args.root_node_list:
+   if args.path is not None:
+      if args.save or args.index_db is not None:
+         callable_dict, module_dict = node_dicts_from_path(args.path, jobs = args.jobs, cache_dir = args.cache_dir, engine = args.engine, analysis = args.analysis, source_filter = sourcetools.SourceFilter.from_args(args), preprocessor = get_preprocessor(args))
+
+         if args.save:
+            save_call_dict(callable_dict,module_dict,args.path,filename=args.restart_file)
 
-      print(f'\n=== ROOT NODE: {root_node} ===\n')
+         if args.index_db is not None:
+            update_index(args.index_db,args.path,callable_dict,module_dict)
 
-      img_dir = 'images/callgraph'
-      os.makedirs(img_dir, exist_ok=True)
-      svg_path = os.path.join(img_dir,'{:}.svg'.format(root_node))
+         if args.module_tree:
+            callable_dict = module_dict
 
-      create_graph_for_node(root_node,graph_dict,callable_dict,args,hide_nodes,img_dir,svg_path, module_tree = args.module_tree)
+      else:
+         callable_dict = call_dict_from_path(args.path, module_tree = args.module_tree, jobs = args.jobs, cache_dir = args.cache_dir, engine = args.engine, analysis = args.analysis, source_filter = sourcetools.SourceFilter.from_args(args), preprocessor = get_preprocessor(args))
+
+   elif args.load:
+      callable_dict, module_dict, args.path = load_call_dict(filename=args.restart_file)
+
+      if args.module_tree:
+         callable_dict = module_dict
+   else:
+      sys.exit('One of the options must be specified: \n Path (-p) or Load (--load).')
 
    #
-   # Copy the js scipt for the node highlights
+   # Test
    #
-   js_source_path = os.path.join(os.path.dirname(__file__),'js','jquery.maphilight.min.js')
-   js_dir = 'js'
-   os.makedirs(js_dir, exist_ok=True)
-   shutil.copy(js_source_path,js_dir)
+   #obj = callable_dict['transport']
+   #print_object_attributes(obj)
+
+   # maybe, the built in comparison works...
+   #print(callable_dict['transport']==callable_dict['transport'])
+
+   # tostr() takes into account the comments that are before!
+   #print(obj._node.parent.tostr())
+
+   graph_config = get_graph_config(args)
+
+   copy_js_files()
+
+   graph_dict = create_callable_graph_dict(callable_dict, module_tree = args.module_tree)
+
+   #
+   # Callable graph creation (including HTML) for the root nodes
+   #
+   root_node_list = get_root_node_list(args,callable_dict,graph_dict)
+
+   if len(root_node_list) == 0:
+      sys.exit('No root node to render: the root nodes are not in the source code (or there is no program with --all-programs).')
 
+   render_root_nodes(root_node_list,graph_dict,callable_dict,args,graph_config)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+Discovery of the source files: recursive walk of the source directory (os.scandir)
+with the file extensions, include/exclude glob patterns and .gitignore-style ignore files
+"""
+
+import os, sys, re
+
+DEFAULT_EXTENSIONS = ['.F90']
+
+def translate_glob(pattern):
+   """
+   Regular expression of a glob pattern: * and ? do not match /, ** matches any number of directories
+   """
+   regex = ''
+   i = 0
+   n = len(pattern)
+   while i < n:
+      c = pattern[i]
+
+      if pattern.startswith('**/',i):
+         regex += '(?:.*/)?'
+         i += 3
+      elif pattern.startswith('/**',i) and i+3 == n:
+         regex += '/.*'
+         i += 3
+      elif pattern.startswith('**',i):
+         regex += '.*'
+         i += 2
+      elif c == '*':
+         regex += '[^/]*'
+         i += 1
+      elif c == '?':
+         regex += '[^/]'
+         i += 1
+      elif c == '[':
+         j = pattern.find(']',i+2)
+         if j < 0:
+            regex += re.escape(c)
+            i += 1
+         else:
+            char_class = pattern[i+1:j]
+            if char_class.startswith('!'):
+               char_class = '^' + char_class[1:]
+            regex += '[' + char_class.replace('\\','\\\\') + ']'
+            i = j+1
+      elif c == '\\' and i+1 < n:
+         regex += re.escape(pattern[i+1])
+         i += 2
+      else:
+         regex += re.escape(c)
+         i += 1
+
+   return regex + r'\Z'
+
+class IgnoreRule:
+   """
+   One pattern of an ignore file (or of the include/exclude options), with the .gitignore rules:
+   a pattern with a / is relative to the directory of the ignore file, otherwise it matches
+   the name at any depth; a trailing / matches only directories; a leading ! re-includes
+   """
+   def __init__(self,pattern,base=''):
+      self.base    = base
+      self.negate  = pattern.startswith('!')
+      if self.negate:
+         pattern = pattern[1:]
+
+      self.dir_only = pattern.endswith('/')
+      pattern = pattern.rstrip('/')
+
+      self.anchored = '/' in pattern
+      pattern = pattern.lstrip('/')
+
+      self.regex = re.compile(translate_glob(pattern))
+
+   def match(self,relpath,is_dir):
+      """
+      Return True if the path (relative to the source directory) matches the pattern
+      """
+      if self.dir_only and not is_dir:
+         return False
+
+      if self.base:
+         relpath = relpath[len(self.base)+1:]
+
+      if self.anchored:
+         return self.regex.match(relpath) is not None
+      else:
+         return self.regex.match(relpath.rsplit('/',1)[-1]) is not None
+
+def read_ignore_file(filepath,base):
+   """
+   List of the IgnoreRule of an ignore file
+   """
+   rule_list = []
+   with open(filepath,'r',errors='replace') as f:
+      for line in f:
+         line = line.rstrip('\n').rstrip()
+         if line == '' or line.startswith('#'):
+            continue
+
+         rule_list.append(IgnoreRule(line,base=base))
+
+   return rule_list
+
+def is_ignored(rule_list,relpath,is_dir):
+   """
+   The last matching rule decides
+   """
+   ignored = False
+   for rule in rule_list:
+      if rule.match(relpath,is_dir):
+         ignored = not rule.negate
+
+   return ignored
+
+class SourceFilter:
+   """
+   Selection of the source files:
+   extensions: file extensions (case insensitive, e.g. .F90 also selects .f90)
+   include: glob patterns, if not empty only the matching files are selected
+   exclude: glob patterns of the excluded files and directories
+   ignore_file_names: names of the ignore files (e.g. .gitignore) read in each directory
+   exclude_files: names (or paths relative to the source directory) of the excluded files
+   """
+   def __init__(self,extensions=None,include=None,exclude=None,ignore_file_names=None,exclude_files=None):
+      if extensions is None:
+         extensions = DEFAULT_EXTENSIONS
+
+      self.extensions = tuple( x.lower() for x in extensions )
+      self.include_rule_list = [ IgnoreRule(x) for x in (include or []) ]
+      self.exclude_rule_list = [ IgnoreRule(x) for x in (exclude or []) ]
+      self.ignore_file_names = list(ignore_file_names or [])
+      self.exclude_files = set(exclude_files or [])
+
+   @classmethod
+   def from_args(cls,args):
+      """
+      Filter from the command line arguments (see runparse.parse_arguments)
+      """
+      return cls(extensions=args.extensions,include=args.include,exclude=args.exclude,
+                 ignore_file_names=args.ignore_files,exclude_files=args.exclude_files)
+
+   def select_file(self,relpath,name):
+      if not name.lower().endswith(self.extensions):
+         return False
+
+      if name in self.exclude_files or relpath in self.exclude_files:
+         return False
+
+      if len(self.include_rule_list) > 0 and not any( rule.match(relpath,False) for rule in self.include_rule_list ):
+         return False
+
+      return not is_ignored(self.exclude_rule_list,relpath,False)
+
+   def select_dir(self,relpath):
+      return not is_ignored(self.exclude_rule_list,relpath,True)
+
+def iter_source_files(path,source_filter=None):
+   """
+   Walk the source directory and yield the paths of the source files (relative to path, with /)
+   as they are found, so that the parsing can start before the end of the walk.
+   The entries of each directory are visited in the alphabetic order.
+   """
+   if source_filter is None:
+      source_filter = SourceFilter()
+
+   # Directories to visit: (relative path, inherited ignore rules)
+   dir_stack = [('',[])]
+
+   while dir_stack:
+      reldir, rule_list = dir_stack.pop()
+      dirpath = os.path.join(path,reldir) if reldir else path
+
+      try:
+         with os.scandir(dirpath) as it:
+            entry_list = sorted(it, key = lambda x: x.name)
+      except OSError:
+         continue
+
+      for ignore_file_name in source_filter.ignore_file_names:
+         ignore_file_path = os.path.join(dirpath,ignore_file_name)
+         if os.path.isfile(ignore_file_path):
+            rule_list = rule_list + read_ignore_file(ignore_file_path,reldir)
+
+      subdir_list = []
+      for entry in entry_list:
+         relpath = reldir + '/' + entry.name if reldir else entry.name
+
+         try:
+            # The symbolic links to directories are not followed (no cycles)
+            is_dir = entry.is_dir(follow_symlinks=False)
+            is_file = not is_dir and entry.is_file()
+         except OSError:
+            continue
+
+         if is_dir:
+            if not is_ignored(rule_list,relpath,True) and source_filter.select_dir(relpath):
+               subdir_list.append(relpath)
+
+         elif is_file:
+            if source_filter.select_file(relpath,entry.name) and not is_ignored(rule_list,relpath,False):
+               yield relpath
+
+      # The stack is LIFO: push in the reverse order to visit the subdirectories in the alphabetic order
+      for relpath in reversed(subdir_list):
+         dir_stack.append((relpath,rule_list))
+
+def get_source_file_list(path,source_filter=None):
+   """
+   Return the sorted list of the source files in the path folder (see iter_source_files)
+   """
+   return sorted(iter_source_files(path,source_filter=source_filter))
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
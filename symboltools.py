@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+"""
+Global symbol index of the callables. The nodes are keyed by (scope, name), where the scope
+is the tuple of the enclosing program units (module, host procedure), so that the procedures
+with the same name in different modules are kept as separate nodes.
+The references (calls and function references) of each procedure are resolved with its host
+scopes and the modules it uses.
+"""
+
+import sys, copy, warnings
+
+from fparser.two import Fortran2003
+
+from parsetools import MySubrOrFunc, MyInterface
+
+class SymbolIndex:
+   """
+   Index of the callables of the source code, built file by file (see add_file and remove_file)
+   """
+   def __init__(self):
+      # {(scope, name): node}, the selected definition of each symbol (see select_node)
+      self.symbol_dict = {}
+
+      # {(scope, name): [(order, node), ...]}, every definition of each symbol, sorted by the order of their files
+      self.candidate_dict = {}
+
+      # {name: {(scope, name): None}}, the symbols with the same name in the order they were added
+      self.name_dict = {}
+
+      # {filename: [(symbol, node), ...]}
+      self.file_dict = {}
+
+      # {filename: order}, the position of each file (see add_file)
+      self.order_dict = {}
+      self.norder = 0
+
+   @staticmethod
+   def get_symbol(node):
+      return (node.scope, node.name.lower())
+
+   @staticmethod
+   def select_node(node_list):
+      """
+      Definition of a symbol (node_list is in file order): the implementation of a procedure has
+      priority over its interface body, and the last definition has priority over the previous ones
+      """
+      implementation_list = [ x for x in node_list if not x.interface_body ]
+      return (implementation_list or node_list)[-1]
+
+   def add_file(self,filename,local_node_dict,order=None):
+      """
+      Add (or replace) the callables of a file. order is the position of the file (any comparable value,
+      e.g. the filename), the definitions of a symbol are selected in this order whatever the order
+      in which the files are added. By default, the files are in the order in which they are added.
+      """
+      self.remove_file(filename)
+
+      if order is None:
+         order = self.norder
+         self.norder += 1
+      self.order_dict[filename] = order
+
+      symbol_node_list = []
+      for node in local_node_dict.values():
+         symbol = self.get_symbol(node)
+
+         candidate_list = self.candidate_dict.setdefault(symbol,[])
+         candidate_list.append((order,node))
+         candidate_list.sort(key=lambda x: x[0])
+
+         previous_node = self.symbol_dict.get(symbol)
+         selected_node = self.select_node([ x for _, x in candidate_list ])
+         if previous_node is not None and not node.interface_body and not previous_node.interface_body:
+            other_node = previous_node if selected_node is node else node
+            warn_message = '{:} is defined in {:} and in {:}, the latter is kept.'.format('::'.join(symbol[0]+(symbol[1],)),other_node.filename,selected_node.filename)
+            warnings.warn(warn_message)
+
+         self.symbol_dict[symbol] = selected_node
+         self.name_dict.setdefault(symbol[1],{})[symbol] = None
+         symbol_node_list.append((symbol,node))
+
+      self.file_dict[filename] = symbol_node_list
+
+   def remove_file(self,filename):
+      """
+      Remove the callables of a file, the remaining definitions of their symbols (from other files) are restored
+      """
+      self.order_dict.pop(filename,None)
+
+      for symbol, node in self.file_dict.pop(filename,[]):
+         candidate_list = [ x for x in self.candidate_dict[symbol] if x[1] is not node ]
+
+         if len(candidate_list) > 0:
+            self.candidate_dict[symbol] = candidate_list
+            self.symbol_dict[symbol] = self.select_node([ x for _, x in candidate_list ])
+         else:
+            del self.candidate_dict[symbol]
+            del self.symbol_dict[symbol]
+
+            del self.name_dict[symbol[1]][symbol]
+            if len(self.name_dict[symbol[1]]) == 0:
+               del self.name_dict[symbol[1]]
+
+   def lookup(self,scope,name):
+      """
+      Node of a symbol, None if it is not in the index
+      """
+      return self.symbol_dict.get((scope,name.lower()))
+
+   def get_key(self,symbol):
+      """
+      Key of a symbol in the callable dict: the name if it is unique (or if the symbol is
+      an external procedure), the qualified name (module::name) otherwise
+      """
+      scope, name = symbol
+
+      if len(scope) == 0 or len(self.name_dict[name]) == 1:
+         return name
+      else:
+         return '::'.join(scope+(name,))
+
+   def get_module_uses_dict(self):
+      """
+      Modules used in each module: {module: set of module names}, from the procedures of the modules
+      """
+      module_uses_dict = {}
+      for (scope, name), node in self.symbol_dict.items():
+         if len(scope) > 0 and node.uses is not None:
+            module_uses_dict.setdefault(scope[0],set()).update( x.lower() for x in node.uses )
+
+      return module_uses_dict
+
+   def iter_used_modules(self,uses,module_uses_dict):
+      """
+      Modules used by a procedure, then the modules that they use (a module makes
+      its used entities accessible by default)
+      """
+      visited = set()
+      queue = [x.lower() for x in uses]
+
+      while queue:
+         module = queue.pop(0)
+         if module in visited:
+            continue
+
+         visited.add(module)
+         yield module
+
+         queue.extend(sorted(module_uses_dict.get(module,[])))
+
+   def resolve(self,node,name,module_uses_dict):
+      """
+      Return the symbol that a name refers to in node, None if the name is not in the index.
+      The order is: internal procedures of the node, host scopes (up to the module),
+      used modules, external procedures.
+      """
+      name = name.lower()
+
+      if name not in self.name_dict.keys():
+         return None
+
+      # Internal procedures and host scopes
+      own_scope = node.scope + (node.name.lower(),)
+      for i in range(len(own_scope),0,-1):
+         symbol = (own_scope[:i],name)
+         if symbol in self.symbol_dict.keys():
+            return symbol
+
+      # Used modules
+      if node.uses is not None:
+         for module in self.iter_used_modules(node.uses,module_uses_dict):
+            symbol = ((module,),name)
+            if symbol in self.symbol_dict.keys():
+               return symbol
+
+      # External procedures
+      symbol = ((),name)
+      if symbol in self.symbol_dict.keys():
+         return symbol
+
+      # Not accessible with the scope rules (e.g. the uses are not computed or the module
+      # is not parsed): the symbol with this name defined in the last file
+      return max(reversed(list(self.name_dict[name].keys())),key=lambda x: self.candidate_dict[x][-1][0])
+
+   def resolve_calls(self,node,key_dict,module_uses_dict):
+      """
+      Replace the names of the calls of node by the keys of the callables they refer to,
+      and add the function references (as in MySubrOrFunc.append_func_calls)
+      """
+      call_list = []
+      for name in node.calls:
+         symbol = self.resolve(node,name,module_uses_dict)
+         call_list.append(name if symbol is None else key_dict[symbol])
+
+      func_name_list = []
+      for name in node.arrays_or_funcs:
+         symbol = self.resolve(node,name,module_uses_dict)
+         if symbol is not None and self.symbol_dict[symbol].fparser_type == Fortran2003.Function_Stmt:
+            func_name_list.append(name)
+            call_list.append(key_dict[symbol])
+
+      node.calls = sorted(set(call_list))
+      node.arrays = list(set(node.arrays_or_funcs) - set(func_name_list))
+
+   def create_callable_dict(self,file_order=None):
+      """
+      Return the dictionary of the callables {key: node} with the resolved calls.
+      The nodes are copies, the index itself is not modified.
+      The order of the dict follows file_order (by default, the order of the files, see add_file).
+      """
+      if file_order is None:
+         file_order = sorted(self.file_dict.keys(),key=lambda x: self.order_dict[x])
+
+      # A symbol defined in several files takes the place of its first definition
+      symbol_list = {}
+      for filename in file_order:
+         for symbol, node in self.file_dict.get(filename,[]):
+            symbol_list.setdefault(symbol)
+
+      key_dict = { symbol: self.get_key(symbol) for symbol in self.symbol_dict.keys() }
+      module_uses_dict = self.get_module_uses_dict()
+
+      callable_dict = {}
+      for symbol in symbol_list:
+         if symbol in self.symbol_dict.keys():
+            callable_dict[key_dict[symbol]] = copy.copy(self.symbol_dict[symbol])
+
+      for node in callable_dict.values():
+         if isinstance(node,MySubrOrFunc):
+            self.resolve_calls(node,key_dict,module_uses_dict)
+
+      #
+      # Once the calls are resolved, the interfaces incorporate all the calls, etc.
+      # of the module procedures that they contain
+      #
+      for node in callable_dict.values():
+         if isinstance(node,MyInterface):
+            procedure_list = []
+            for name in node.procedures:
+               symbol = self.resolve(node,name,module_uses_dict)
+               procedure_list.append(name if symbol is None else key_dict[symbol])
+
+            node.procedures = procedure_list
+            node.update_interface_attrs(callable_dict)
+
+      return callable_dict
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')
@@ -0,0 +1,57 @@
+import cpptools
+
+SOURCE = """\
+subroutine solve
+#ifdef USE_MPI
+#  ifdef USE_OPENMP
+   call hybrid_solve
+#  else
+   call mpi_solve
+#  endif
+#else
+   call serial_solve
+#endif
+end subroutine solve
+"""
+
+def preprocess(tmp_path,defines):
+   filepath = tmp_path/'solve.F90'
+   filepath.write_text(SOURCE)
+
+   preprocessor = cpptools.Preprocessor(defines=defines,cpp_command='python')
+   text, line_map = preprocessor.preprocess(str(filepath))
+
+   return text.splitlines(), line_map
+
+def get_code_lines(line_list,line_map):
+   return [ (line.strip(),nline) for line,nline in zip(line_list,line_map) if line.strip() ]
+
+def test_nested_ifdef_else(tmp_path):
+   line_list, line_map = preprocess(tmp_path,[])
+   assert get_code_lines(line_list,line_map) == [('subroutine solve',1), ('call serial_solve',9), ('end subroutine solve',11)]
+
+   line_list, line_map = preprocess(tmp_path,['USE_MPI'])
+   assert get_code_lines(line_list,line_map) == [('subroutine solve',1), ('call mpi_solve',6), ('end subroutine solve',11)]
+
+   line_list, line_map = preprocess(tmp_path,['USE_MPI','USE_OPENMP=1'])
+   assert get_code_lines(line_list,line_map) == [('subroutine solve',1), ('call hybrid_solve',4), ('end subroutine solve',11)]
+
+def test_map_line_of_included_file(tmp_path):
+   (tmp_path/'inc').mkdir()
+   (tmp_path/'inc'/'calls.h').write_text('   call first\n   call second\n')
+
+   filepath = tmp_path/'main.F90'
+   filepath.write_text('program main\n#include "calls.h"\n   call third\nend program main\n')
+
+   preprocessor = cpptools.Preprocessor(include_dirs=[str(tmp_path/'inc')],cpp_command='python')
+   text, line_map = preprocessor.preprocess(str(filepath))
+   line_list = text.splitlines()
+
+   # The lines of the included file are mapped to the #include line
+   assert line_list[1].strip() == 'call first' and cpptools.map_line(line_map,2) == 2
+   assert line_list[2].strip() == 'call second' and cpptools.map_line(line_map,3) == 2
+   assert line_list[3].strip() == 'call third' and cpptools.map_line(line_map,4) == 3
+
+   # Out of range lines are clamped, no line map keeps the line
+   assert cpptools.map_line(line_map,100) == 4
+   assert cpptools.map_line(None,7) == 7
@@ -0,0 +1,109 @@
+import filtertools
+
+class Node:
+   def __init__(self,name,node_type,filename,scope=()):
+      self.name = name
+      self.type = node_type
+      self.filename = filename
+      self.scope = scope
+
+def get_graph():
+   # The external nodes keep the case of the source
+   graph_dict = {
+      'main'  : {'work': None, 'MPI_Init': None, 'MPI_Finalize': None},
+      'work'  : {'MPI_Barrier': None},
+   }
+   callable_dict = {
+      'main': Node('main','Program','main.F90'),
+      'work': Node('work','Subroutine','work.F90'),
+   }
+   return graph_dict, callable_dict
+
+def test_hide_nodes_mixed_case_external():
+   graph_dict, callable_dict = get_graph()
+
+   graph_filter = filtertools.GraphFilter.from_options(hide_nodes=['MPI_Init'])
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   assert filtered_graph_dict['main'] == {'work': None, 'MPI_Finalize': None}
+
+def test_hide_glob_and_regex_mixed_case_external():
+   graph_dict, callable_dict = get_graph()
+
+   for rule in [{'name': 'MPI_*'}, {'name': 'mpi_*'}, {'regex': '^mpi_'}]:
+      graph_filter = filtertools.GraphFilter(hide=[rule])
+      filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+      assert filtered_graph_dict == {'main': {'work': None}, 'work': {}}
+
+def test_regex_searched_glob_anchored():
+   graph_dict = {
+      'main'         : {'my_debug_dump': None, 'debug_log': None, 'work': None},
+      'work'         : {},
+   }
+   callable_dict = {
+      'main': Node('main','Program','main.F90'),
+      'work': Node('work','Subroutine','work.F90'),
+      'my_debug_dump': Node('my_debug_dump','Subroutine','debug.F90'),
+      'debug_log': Node('debug_log','Subroutine','debug.F90'),
+   }
+
+   graph_filter = filtertools.GraphFilter(hide=[{'regex': 'debug'}])
+   assert graph_filter.apply(graph_dict,callable_dict)['main'] == {'work': None}
+
+   graph_filter = filtertools.GraphFilter(hide=[{'name': 'debug_*'}])
+   assert graph_filter.apply(graph_dict,callable_dict)['main'] == {'my_debug_dump': None, 'work': None}
+
+   graph_filter = filtertools.GraphFilter(hide=[{'name': 'w*'}, {'regex': 'dump$'}])
+   assert graph_filter.apply(graph_dict,callable_dict)['main'] == {'debug_log': None}
+
+def test_forbid_connection():
+   graph_dict, callable_dict = get_graph()
+
+   graph_filter = filtertools.GraphFilter(forbid=[{'caller': {'type': 'Program'}, 'callee': 'Mpi_*'}])
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   assert filtered_graph_dict == {'main': {'work': None}, 'work': {'MPI_Barrier': None}}
+
+def get_qualified_graph():
+   # helper is defined in two modules: the keys are qualified
+   graph_dict = {
+      'main'        : {'mod_a::helper': None, 'mod_b::helper': None, 'work': None},
+      'mod_a::helper': {},
+      'mod_b::helper': {},
+      'work'        : {},
+   }
+   callable_dict = {
+      'main'        : Node('main','Program','main.F90'),
+      'mod_a::helper': Node('helper','Subroutine','mod_a.F90',scope=('mod_a',)),
+      'mod_b::helper': Node('helper','Subroutine','mod_b.F90',scope=('mod_b',)),
+      'work'        : Node('work','Subroutine','work.F90'),
+   }
+   return graph_dict, callable_dict
+
+def test_hide_bare_name_of_qualified_nodes():
+   graph_dict, callable_dict = get_qualified_graph()
+
+   graph_filter = filtertools.GraphFilter.from_options(hide_nodes=['helper'])
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   assert filtered_graph_dict == {'main': {'work': None}, 'work': {}}
+
+def test_hide_qualified_name():
+   graph_dict, callable_dict = get_qualified_graph()
+
+   graph_filter = filtertools.GraphFilter(hide=[{'name': 'mod_a::helper'}])
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   assert set(filtered_graph_dict['main']) == {'mod_b::helper','work'}
+
+def test_legacy_connection_file_bare_name(tmp_path):
+   graph_dict, callable_dict = get_qualified_graph()
+
+   forbid_path = tmp_path / 'forbid.yaml'
+   forbid_path.write_text('main: [helper]\n')
+
+   graph_filter = filtertools.GraphFilter.from_options(forbidden_connections_path=str(forbid_path))
+   filtered_graph_dict = graph_filter.apply(graph_dict,callable_dict)
+
+   assert filtered_graph_dict['main'] == {'work': None}
@@ -0,0 +1,35 @@
+import graphtools
+
+def test_cycle_truncated_by_max_depth():
+   # main -> mid -> rec_a <-> rec_b: the cycle is deeper than max_depth
+   graph_dict = {
+      'main' : {'mid': None},
+      'mid'  : {'rec_a': None},
+      'rec_a': {'rec_b': None},
+      'rec_b': {'rec_a': None},
+   }
+
+   call_graph_dict, stub_dict, cycle_dict = graphtools.create_call_graph_dict(graph_dict,{},'main',max_depth=1,verbose=False)
+
+   assert cycle_dict == {}
+   assert set(call_graph_dict) == {'main','mid','+mid'}
+   assert stub_dict == {'+mid': ('mid',1)}
+
+   # The cycle nodes are all in the graph
+   graphtools.create_call_graph(call_graph_dict,stub_dict=stub_dict,cycle_dict=cycle_dict)
+
+def test_cycle_kept_within_max_depth():
+   graph_dict = {
+      'main' : {'rec_a': None},
+      'rec_a': {'rec_b': None},
+      'rec_b': {'rec_a': None, 'leaf': None},
+      'leaf' : {},
+   }
+
+   call_graph_dict, stub_dict, cycle_dict = graphtools.create_call_graph_dict(graph_dict,{},'main',max_depth=1,verbose=False)
+
+   assert cycle_dict == {'_cycle_rec_a': ['rec_a','rec_b']}
+   assert '_cycle_rec_a' in call_graph_dict
+   assert 'leaf' not in call_graph_dict
+
+   graphtools.create_call_graph(call_graph_dict,stub_dict=stub_dict,cycle_dict=cycle_dict)
@@ -0,0 +1,23 @@
+import runparse
+
+class Node:
+   def __init__(self,name):
+      self.name = name
+
+def test_find_root_node_keys():
+   callable_dict = {
+      'main'         : Node('main'),
+      'mod_a::helper': Node('helper'),
+      'mod_b::helper': Node('helper'),
+   }
+   graph_dict = {
+      'main'         : {'mod_a::helper': None, 'mod_b::helper': None, 'mpi_init': None},
+      'mod_a::helper': {},
+      'mod_b::helper': {},
+   }
+
+   assert runparse.find_root_node_keys('main',callable_dict,graph_dict) == ['main']
+   assert runparse.find_root_node_keys('Helper',callable_dict,graph_dict) == ['mod_a::helper','mod_b::helper']
+   assert runparse.find_root_node_keys('mod_b::helper',callable_dict,graph_dict) == ['mod_b::helper']
+   assert runparse.find_root_node_keys('mpi_init',callable_dict,graph_dict) == ['mpi_init']
+   assert runparse.find_root_node_keys('nosuch',callable_dict,graph_dict) == []
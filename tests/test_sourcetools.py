@@ -0,0 +1,51 @@
+import re
+
+import sourcetools
+
+def test_translate_glob():
+   # * and ? do not match /
+   assert re.match(sourcetools.translate_glob('*.F90'),'a.F90')
+   assert not re.match(sourcetools.translate_glob('*.F90'),'sub/a.F90')
+   assert not re.match(sourcetools.translate_glob('a?F90'),'a/F90')
+
+   assert sourcetools.IgnoreRule('src/*.F90').match('src/a.F90',False)
+   assert not sourcetools.IgnoreRule('src/*.F90').match('src/sub/a.F90',False)
+   assert sourcetools.IgnoreRule('src/**/*.F90').match('src/sub/a.F90',False)
+   assert sourcetools.IgnoreRule('src/**/*.F90').match('src/a.F90',False)
+
+def test_unanchored_and_leading_slash():
+   # Without /, the pattern matches the name at any depth
+   rule = sourcetools.IgnoreRule('test_*.F90')
+   assert rule.match('test_a.F90',False)
+   assert rule.match('sub/test_a.F90',False)
+
+   # With a leading /, only relative to the directory of the ignore file
+   rule = sourcetools.IgnoreRule('/build',base='src')
+   assert rule.match('src/build',True)
+   assert not rule.match('src/sub/build',True)
+
+def test_dir_only_rule():
+   rule = sourcetools.IgnoreRule('build/')
+   assert rule.match('build',True)
+   assert rule.match('sub/build',True)
+   assert not rule.match('build',False)
+
+def test_negated_rule_reincludes():
+   rule_list = [sourcetools.IgnoreRule('*.F90'), sourcetools.IgnoreRule('!keep.F90')]
+   assert sourcetools.is_ignored(rule_list,'drop.F90',False)
+   assert not sourcetools.is_ignored(rule_list,'keep.F90',False)
+
+   # The last matching rule decides
+   rule_list.append(sourcetools.IgnoreRule('sub/keep.F90'))
+   assert sourcetools.is_ignored(rule_list,'sub/keep.F90',False)
+
+def test_ignore_file_in_source_tree(tmp_path):
+   for relpath in ['main.F90', 'gen/a.F90', 'gen/keep.F90', 'sub/gen/b.F90', 'sub/c.F90']:
+      (tmp_path/relpath).parent.mkdir(parents=True,exist_ok=True)
+      (tmp_path/relpath).write_text('')
+
+   (tmp_path/'.gitignore').write_text('# generated\n/gen/*\n!/gen/keep.F90\n')
+   (tmp_path/'sub'/'.gitignore').write_text('gen/\n')
+
+   source_filter = sourcetools.SourceFilter(ignore_file_names=['.gitignore'])
+   assert sourcetools.get_source_file_list(str(tmp_path),source_filter=source_filter) == ['gen/keep.F90', 'main.F90', 'sub/c.F90']
@@ -0,0 +1,59 @@
+import warnings
+
+import symboltools
+
+class Node:
+   def __init__(self,name,filename,scope=(),interface_body=False):
+      self.name = name
+      self.filename = filename
+      self.scope = scope
+      self.interface_body = interface_body
+
+def test_remove_overriding_file_restores_definition():
+   index = symboltools.SymbolIndex()
+
+   first = Node('solve','a.F90')
+   second = Node('solve','b.F90')
+
+   with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      index.add_file('a.F90',{'solve': first})
+      index.add_file('b.F90',{'solve': second})
+
+   assert index.lookup((),'solve') is second
+
+   index.remove_file('b.F90')
+   assert index.lookup((),'solve') is first
+   assert index.get_key(((),'solve')) == 'solve'
+
+   index.remove_file('a.F90')
+   assert index.lookup((),'solve') is None
+   assert 'solve' not in index.name_dict
+
+def test_implementation_has_priority_over_interface_body():
+   index = symboltools.SymbolIndex()
+
+   implementation = Node('solve','a.F90')
+   interface_body = Node('solve','b.F90',interface_body=True)
+
+   index.add_file('a.F90',{'solve': implementation})
+   index.add_file('b.F90',{'solve': interface_body})
+   assert index.lookup((),'solve') is implementation
+
+   index.remove_file('a.F90')
+   assert index.lookup((),'solve') is interface_body
+
+def test_selection_follows_file_order_not_arrival_order():
+   index = symboltools.SymbolIndex()
+
+   first = Node('solve','a.F90')
+   second = Node('solve','b.F90')
+
+   with warnings.catch_warnings(record=True) as warning_list:
+      warnings.simplefilter('always')
+      index.add_file('b.F90',{'solve': second},order='b.F90')
+      index.add_file('a.F90',{'solve': first},order='a.F90')
+
+   assert index.lookup((),'solve') is second
+   assert 'in a.F90 and in b.F90' in str(warning_list[0].message)
+   assert list(index.create_callable_dict().keys()) == ['solve']
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Tools for the watch mode: poll the source directory and detect the graphs to update
+"""
+
+import os, sys, hashlib
+
+import graphtools
+
+class SourceWatcher:
+   """
+   Poll the source files with (mtime, size) checks
+   """
+   def __init__(self,path,source_file_list):
+      self.path = path
+      self.stat_dict = self.get_stat_dict(source_file_list)
+
+   def get_stat_dict(self,source_file_list):
+      stat_dict = {}
+      for filename in source_file_list:
+         try:
+            stat = os.stat(os.path.join(self.path,filename))
+         except FileNotFoundError:
+            continue
+         stat_dict[filename] = (stat.st_mtime_ns, stat.st_size)
+
+      return stat_dict
+
+   def poll(self,source_file_list):
+      """
+      Return the lists of changed (or new) files and of removed files since the previous poll
+      """
+      new_stat_dict = self.get_stat_dict(source_file_list)
+
+      changed_file_list = sorted( filename for filename, stat in new_stat_dict.items() \
+                                  if self.stat_dict.get(filename) != stat )
+
+      removed_file_list = sorted( self.stat_dict.keys() - new_stat_dict.keys() )
+
+      self.stat_dict = new_stat_dict
+
+      return changed_file_list, removed_file_list
+
+def get_node_signature(node_obj):
+   """
+   Attributes of a node that can appear in the graph or in the HTML file
+   """
+   attrname_list = ['type','filename','nfirst_line','nlines','ncode_lines','ncomment_lines','uses','calls']
+   signature = [ getattr(node_obj,attrname,None) for attrname in attrname_list ]
+
+   for attrname in ['alloc','dealloc']:
+      array_list = getattr(node_obj,attrname,None)
+      if array_list is not None:
+         signature.append([ repr(x) for x in array_list ])
+
+   return repr(signature)
+
+def get_subgraph_signature(graph_dict,callable_dict,root_node_name):
+   """
+   Hash of the subgraph reachable from the root node (nodes, edges, and node attributes)
+   """
+   sha = hashlib.sha256()
+
+   for node in sorted(graphtools.get_reachable_nodes(graph_dict,root_node_name)):
+      sha.update(node.encode())
+      sha.update(repr(sorted(graph_dict.get(node,{}).keys())).encode())
+
+      if node in callable_dict.keys():
+         sha.update(get_node_signature(callable_dict[node]).encode())
+
+   return sha.hexdigest()
+
+if __name__ == '__main__':
+   sys.exit('This file is not inteded to be run as __main__')